@@ -9,22 +9,27 @@ from __future__ import division
 import sys, os, numpy as np, matplotlib.pyplot as plt
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from src import plotting as pl, fileIO
+from src import plotting as pl, fileIO, profiling as prof
 
 
 def main(smooth_coalbedo=False):
     
-    fig1, ax1 = pl.PlotHFCIceEdge(smooth_coalbedo=smooth_coalbedo)
-    fig2, ax2 = pl.PlotHFCIceEdge(relative_D=np.array([1.0]),
-        smooth_coalbedo=smooth_coalbedo, add_linear_fit=True)
+    # The heat flux convergences are computed by the plotting functions:
+    with prof.Phase('compute and plot'):
+        fig1, ax1 = pl.PlotHFCIceEdge(smooth_coalbedo=smooth_coalbedo)
+        fig2, ax2 = pl.PlotHFCIceEdge(relative_D=np.array([1.0]),
+            smooth_coalbedo=smooth_coalbedo, add_linear_fit=True)
     subdir_name = 'HFCIceEdge' + ('_SmoothedCoalbedo'*smooth_coalbedo)
-    fileIO.SaveFigures([fig1, fig2], subdir_name)
-    fileIO.SaveFigures([fig1, fig2], subdir_name, '.svg')
-    fig1.show(); fig2.show()
+    with prof.Phase('save'):
+        fileIO.SaveFigures([fig1, fig2], subdir_name, ['.pdf', '.svg'])
+    if not fileIO.Headless():
+        fig1.show()
+        fig2.show()
     
     pass
 
 
 if __name__ == '__main__':
+    fileIO.HandleFlags(sys.argv)
     pl.SetRCParams()
     main('smooth_coalbedo' in sys.argv)
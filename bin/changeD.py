@@ -11,35 +11,37 @@ import sys, os, numpy as np, matplotlib.pyplot as plt
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from src import parameters as pm, analytics as an, fileIO
-from src import plotting as pl
+from src import plotting as pl, store as st, profiling as prof
 
 
 def main(f=0.7, smooth_coalbedo=False):
     
     xi = np.arange(0.0, 1.0001, 0.001)
     relative_D = np.array([1.0, f])
-    Q_arrays = np.zeros( (len(relative_D), len(xi)) )
     
     print "Using %s-coalbedo..." % ('smoothed' if smooth_coalbedo else 
         'step-function')
     
-    for k in xrange(len(Q_arrays)):
-        print "Calculating with D/D0 = %.2f" % relative_D[k]
-        for j in xrange(len(xi)):
-            Q_arrays[k][j] = an.Q(xi[j], D=relative_D[k]*pm.D, 
-                smooth_coalbedo=smooth_coalbedo)
+    # Each row of Q_arrays is Q(xi) for the corresponding value of D:
+    with prof.Phase('compute'):
+        Q_arrays = st.Cached(an.Q, xi[np.newaxis,:],
+            D=relative_D[:,np.newaxis]*pm.D, smooth_coalbedo=smooth_coalbedo)
     
-    fig, ax = pl.StabilityPlot(xi, Q_arrays/pm.Q, relative_D, ['grey', 'k'])
-    ax.legend(loc='upper right')
+    with prof.Phase('plot'):
+        fig, ax = pl.StabilityPlot(xi, Q_arrays/pm.Q, relative_D,
+            ['grey', 'k'])
+        ax.legend(loc='upper right')
     subdir_name =('change_D_to_%.2fD0'%f)+('_SmoothedCoalbedo'*smooth_coalbedo)
-    fileIO.SaveFigures([fig], subdir_name)
-    fileIO.SaveFigures([fig], subdir_name, '.svg')
-    fig.show()
+    with prof.Phase('save'):
+        fileIO.SaveFigures([fig], subdir_name, ['.pdf', '.svg'])
+    if not fileIO.Headless():
+        fig.show()
     
     pass
 
 
 if __name__ == '__main__':
+    fileIO.HandleFlags(sys.argv)
     pl.SetRCParams()
     if len(sys.argv)==3:
         try:
@@ -0,0 +1,44 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Monte Carlo ensemble of the analytic solution with uncertain parameters:
+### print the quantiles of the ice-edge position and of the critical values
+### of Q at the saddle-node bifurcations (tipping points).
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, time, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, ensemble as en, profiling as prof
+
+
+def main(n_members=100000, smooth_coalbedo=False):
+    
+    # Latin hypercube sample of each parameter within 5% of its default:
+    distributions = [(name, 0.95*getattr(pm, name), 1.05*getattr(pm, name))
+        for name in ['A', 'B', 'D', 'ai', 'af', 'S2']]
+    
+    print "Using %s-coalbedo..." % ('smoothed' if smooth_coalbedo else 
+        'step-function')
+    
+    t0 = time.time()
+    with prof.Phase('compute'):
+        statistics = en.RunEnsemble(distributions, n_members, 'lhs',
+            smooth_coalbedo, seed=0)
+    print "%i members in %.1f s" % (n_members, time.time()-t0)
+    
+    q = np.array([0.05, 0.25, 0.5, 0.75, 0.95])
+    print "Quantiles:       " + ''.join(['%10.2f' % k for k in q])
+    for name, scale in [('xi', 1.0), ('Q_min', pm.Q), ('Q_max', pm.Q)]:
+        histogram = getattr(statistics, name)
+        print "%-6s (%6i NaN)" % (name + ('/Q0' if scale != 1.0 else ''),
+            histogram.n_nan) + ''.join(['%10.4f' % v
+            for v in histogram.Quantile(q)/scale])
+    
+    pass
+
+
+if __name__ == '__main__':
+    main(smooth_coalbedo=('smooth_coalbedo' in sys.argv))
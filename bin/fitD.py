@@ -0,0 +1,62 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tune the diffusivity D (and optionally B and the ice edge x_i) so that the
+### analytic heat transport of the steady state best matches the observed
+### atmospheric heat transport in data/, and plot the fitted heat transport
+### against the observations.
+### Usage: python fitD.py [B] [xi] [smooth_coalbedo] [headless] [overwrite]
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import analytics as an, fitting as ft
+from src import fileIO, plotting as pl, profiling as prof
+
+
+def main(fit=('D',), smooth_coalbedo=False, plot_source='MEAN'):
+    
+    print "Using %s-coalbedo..." % ('smoothed' if smooth_coalbedo else 
+        'step-function')
+    
+    observations = {}; results = {}
+    for source in ['NCEP', 'ECMWF', 'MEAN']:
+        with prof.Phase('load'):
+            observations[source] = fileIO.LoadHeatTransport(source, 'AT')
+        with prof.Phase('fit'):
+            results[source] = ft.FitHeatTransport(*observations[source],
+                fit=fit, smooth_coalbedo=smooth_coalbedo)
+        result = results[source]
+        print ("%-5s: D = %.4f, B = %.4f, xi = %.4f, Q = %.2f, rms error = "
+            "%.3f PW" % (source, result.params.D, result.params.B, result.xi,
+            result.Q, result.rms/1E15))
+    
+    # Plot the fit to the observations from plot_source:
+    x_obs, HT_obs = observations[plot_source]
+    result = results[plot_source]
+    x = np.arange(0.0, 1.001, 0.001)
+    with prof.Phase('compute'):
+        HT = an.HeatTransport(x, result.xi, smooth_coalbedo=smooth_coalbedo,
+            params=result.params)
+    with prof.Phase('plot'):
+        fig, ax = pl.PlotHeatTransport(x, HT, result.xi)
+        ax.plot(x_obs, HT_obs/1E15, 'o', color='grey',
+            label='Observed AT (%s)' % plot_source)
+        ax.legend(loc='upper right')
+    subdir_name = 'FitD' + ('_SmoothedCoalbedo'*smooth_coalbedo)
+    with prof.Phase('save'):
+        fileIO.SaveFigures([fig], subdir_name, ['.pdf', '.svg'])
+    if not fileIO.Headless():
+        fig.show()
+    
+    pass
+
+
+if __name__ == '__main__':
+    fileIO.HandleFlags(sys.argv)
+    pl.SetRCParams()
+    main(fit=('D',) + tuple(p for p in ['B', 'xi'] if p in sys.argv),
+        smooth_coalbedo=('smooth_coalbedo' in sys.argv))
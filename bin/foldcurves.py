@@ -0,0 +1,43 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Track the saddle-node bifurcations (tipping points) of the steady-state
+### solution branch as the diffusivity D varies, and plot the critical Q
+### against D.
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, numpy as np, matplotlib.pyplot as plt
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, continuation as ct
+from src import fileIO, plotting as pl, profiling as prof
+
+
+def main(smooth_coalbedo=False):
+    
+    relative_D = np.arange(1.6, 0.249, -0.01)
+    
+    print "Using %s-coalbedo..." % ('smoothed' if smooth_coalbedo else 
+        'step-function')
+    
+    with prof.Phase('compute'):
+        curves = ct.TrackFolds(relative_D*pm.D,
+            smooth_coalbedo=smooth_coalbedo)
+    
+    with prof.Phase('plot'):
+        fig, ax = pl.PlotFoldCurves(curves)
+    subdir_name = 'FoldCurves' + ('_SmoothedCoalbedo'*smooth_coalbedo)
+    with prof.Phase('save'):
+        fileIO.SaveFigures([fig], subdir_name, ['.pdf', '.svg'])
+    if not fileIO.Headless():
+        fig.show()
+    
+    pass
+
+
+if __name__ == '__main__':
+    fileIO.HandleFlags(sys.argv)
+    pl.SetRCParams()
+    main(smooth_coalbedo=('smooth_coalbedo' in sys.argv))
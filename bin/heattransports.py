@@ -11,36 +11,38 @@ import sys, os, numpy as np, matplotlib.pyplot as plt
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from src import parameters as pm, analytics as an
-from src import plotting as pl, fileIO
+from src import plotting as pl, fileIO, store as st, profiling as prof
 
 
 def main(xi=0.95, smooth_coalbedo=False, latitude_axis=False):
     
     x = np.arange(0.0, 1.001, 0.001)
-    HT = np.zeros(len(x))
-    HFC = np.zeros(len(x))
-    Q = an.Q(xi, smooth_coalbedo=smooth_coalbedo)
     
     print "Using %s-coalbedo..." % ('smoothed' if smooth_coalbedo else 
         'step-function')
     
-    for k in xrange(len(x)):
-        HT[k] =an.HeatTransport(x[k], xi, Q=Q, smooth_coalbedo=smooth_coalbedo)
-        HFC[k] = an.HeatFluxConvergence(
-            x[k], xi, Q=Q, smooth_coalbedo=smooth_coalbedo)
+    with prof.Phase('compute'):
+        Q = st.Cached(an.Q, xi, smooth_coalbedo=smooth_coalbedo)
+        HT = st.Cached(an.HeatTransport, x, xi, Q,
+            smooth_coalbedo=smooth_coalbedo)
+        HFC = st.Cached(an.HeatFluxConvergence, x, xi, Q,
+            smooth_coalbedo=smooth_coalbedo)
     
-    fig1, ax1 = pl.PlotHeatTransport(x, HT, xi, latitude_axis)
-    fig2, ax2 = pl.PlotHeatFluxConvergence(x, HFC, xi, latitude_axis)
+    with prof.Phase('plot'):
+        fig1, ax1 = pl.PlotHeatTransport(x, HT, xi, latitude_axis)
+        fig2, ax2 = pl.PlotHeatFluxConvergence(x, HFC, xi, latitude_axis)
     subdir_name = 'StandardHeatTransports'+('_SmoothCoalbedo'*smooth_coalbedo)
-    fileIO.SaveFigures([fig1, fig2], subdir_name)
-    fileIO.SaveFigures([fig1, fig2], subdir_name, '.svg')
-    fig1.show()
-    fig2.show()
+    with prof.Phase('save'):
+        fileIO.SaveFigures([fig1, fig2], subdir_name, ['.pdf', '.svg'])
+    if not fileIO.Headless():
+        fig1.show()
+        fig2.show()
     
     pass
 
 
 if __name__ == '__main__':
+    fileIO.HandleFlags(sys.argv)
     pl.SetRCParams()
     main(smooth_coalbedo=('smooth_coalbedo' in sys.argv),
         latitude_axis=('latitude_axis' in sys.argv))
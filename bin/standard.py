@@ -8,30 +8,37 @@ from __future__ import division
 import sys, os, numpy as np, matplotlib.pyplot as plt
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from src import parameters as pm, analytics as an
-from src import fileIO, plotting as pl
+from src import parameters as pm, analytics as an, continuation as ct
+from src import fileIO, plotting as pl, store as st, profiling as prof
 
 
 def main(smooth_coalbedo=False):
     
     xi = np.arange(0.0, 1.001, 0.01)
-    Q = np.zeros(len(xi))
     
     print "Using %s-coalbedo..." % ('smoothed' if smooth_coalbedo else 
         'step-function')
     
-    for k in xrange(len(Q)):
-        Q[k] = an.Q(xi[k], smooth_coalbedo=smooth_coalbedo)
+    with prof.Phase('compute'):
+        Q = st.Cached(an.Q, xi, smooth_coalbedo=smooth_coalbedo)
+        folds = ct.FindFolds(smooth_coalbedo=smooth_coalbedo)[0]
     
-    fig, ax = pl.StabilityPlot(xi, np.array([Q])/pm.Q, np.array([1]))
+    for f in folds:
+        print "Saddle-node bifurcation (Q %s): xi = %.6f, Q/Q0 = %.6f" % (
+            f.kind, f.xi, f.Q/pm.Q)
+    
+    with prof.Phase('plot'):
+        fig, ax = pl.StabilityPlot(xi, np.array([Q])/pm.Q, np.array([1]))
     subdir_name = 'StandardCase' + ('_SmoothedCoalbedo'*smooth_coalbedo)
-    fileIO.SaveFigures([fig], subdir_name)
-    fileIO.SaveFigures([fig], subdir_name, '.svg')
-    fig.show()
+    with prof.Phase('save'):
+        fileIO.SaveFigures([fig], subdir_name, ['.pdf', '.svg'])
+    if not fileIO.Headless():
+        fig.show()
     
     pass
 
 
 if __name__ == '__main__':
+    fileIO.HandleFlags(sys.argv)
     pl.SetRCParams()
     main(smooth_coalbedo=('smooth_coalbedo' in sys.argv))
@@ -5,12 +5,35 @@
 ### ---------------------------------------------------------------------------
 
 from __future__ import division
-import parameters as pm
+import parameters as pm, spectral, cache, profiling as prof
 import numpy as np
 import scipy.special as spec, scipy.integrate as integrate
 
 
-def Hn_step_coalbedo(n, xi):
+# Memoization cache for the H_n(x_i) terms (see HnCacheInfo()):
+Hn_cache = cache.Cache(pm.Hn_cache_size)
+
+# Cache of Legendre polynomials (and their derivatives) as poly1d objects so
+# that they are only constructed once per (n, m):
+_legendre_polys = {}
+
+
+def Legendre(n, m=0):
+    """Returns the m-th derivative of the Legendre polynomial of degree n as a
+    NumPy poly1d object, which may be evaluated at arrays of x. Polynomials are
+    cached so that repeated calls do not rebuild them.
+    
+    --Args--
+    n   : int, degree of the Legendre polynomial.
+    (m) : int, order of derivative (default m=0, i.e. P_n itself).
+    """
+    if (n, m) not in _legendre_polys:
+        _legendre_polys[(n, m)] = np.polyder(spec.legendre(n), m=m)
+    return _legendre_polys[(n, m)]
+
+
+@prof.Timed('analytics.Hn_step_coalbedo')
+def Hn_step_coalbedo(n, xi, params=None):
     """The term H_n(x_i) appearing in the T_n coefficient of the analytic
     solution to the classical EBM (see North et. al. 1981 eq (29)). It uses
     the step-function coalbedo: 
@@ -19,19 +42,57 @@ def Hn_step_coalbedo(n, xi):
         a = {
             { af    x < xi
     
+    The integrals are evaluated exactly in terms of Legendre polynomials (see
+    _Hn_step_coalbedo()), so that H_n is accurate for large n. Results are
+    memoized in Hn_cache.
+    
     --Args--
-    n  : integer determining which term in the expansion is being calculated.
-    xi : float between 0 and 1, sine of ice-edge latitude.
+    n        : int, or array of int, determining which term(s) in the
+               expansion are being calculated. If an array, the result has
+               shape xi.shape + (len(n),).
+    xi       : float or NumPy array (values between 0 and 1), sine of ice-edge
+               latitude.
+    (params) : Parameters tuple (default: current values, see parameters.py).
     """
-    integrand = spec.legendre(n)*(1.0 + pm.S2*spec.legendre(2))
-    integrand1 = integrand * pm.af
-    integrand2 = integrand * pm.ai
-    integral = np.polyint(integrand1)(xi) - np.polyint(integrand1)(0)
-    integral += np.polyint(integrand2)(1) - np.polyint(integrand2)(xi)
+    params = pm.Get(params)
+    key = ('step', tuple(np.atleast_1d(n)), cache.ArrayKey(xi), params.ai,
+        params.af, params.S2)
+    Hn = Hn_cache.Get(key, _Hn_step_coalbedo, np.atleast_1d(n), xi, params)
+    return Hn if np.ndim(n) > 0 else Hn[...,0]
+
+
+@prof.Timed('analytics._Hn_step_coalbedo')
+def _Hn_step_coalbedo(n, xi, params):
+    """Calculates H_n(x_i) for the step coalbedo (see Hn_step_coalbedo())
+    for the array of degrees n. The integrand P_n (1 + S2 P_2) is expanded
+    as a sum of Legendre polynomials,
+    
+        P_2 P_n = alpha_n P_{n+2} + beta_n P_n + gamma_n P_{n-2},
+    
+        alpha_n = 3(n+1)(n+2) / [2(2n+1)(2n+3)],
+         beta_n = n(n+1) / [(2n-1)(2n+3)],
+        gamma_n = 3n(n-1) / [2(2n-1)(2n+1)],
+    
+    each of which is integrated exactly (see spectral.LegendreIntegral()).
+    """
+    xi = np.asarray(xi, dtype=float)
+    alpha = 3*(n+1)*(n+2) / (2*(2*n+1)*(2*n+3))
+    beta = n*(n+1) / ((2*n-1)*(2*n+3))
+    gamma = 3*n*(n-1) / (2*(2*n-1)*(2*n+1))
+    
+    def Integral(x):
+        """int_0^x P_n (1 + S2 P_2) dx for each n."""
+        I = spectral.LegendreIntegral(np.max(n)+2, x)
+        return (I[...,n]*(1 + params.S2*beta) + params.S2*(
+            alpha*I[...,n+2] + gamma*I[...,np.maximum(n-2, 0)]))
+    
+    integral_xi = Integral(xi)
+    integral = params.af*integral_xi + params.ai*(Integral(1.0)-integral_xi)
     return (2*n + 1) * integral
 
 
-def Hn_smooth_coalbedo(n, xi):
+@prof.Timed('analytics.Hn_smooth_coalbedo')
+def Hn_smooth_coalbedo(n, xi, quadrature='gauss', params=None):
     """The term H_n(x_i) appearing in the T_n coefficient of the analytic
     solution to the classical EBM (see North et. al. 1981 eq (29)). It uses
     the smoothed coalbedo:
@@ -41,102 +102,786 @@ def Hn_smooth_coalbedo(n, xi):
     where a1=(ai+af)/2, a2=(ai-af)/2, delta_x specifies the degree of 
     smoothing about the ice-edge location and erf() is the error-function.
     
-    This function uses the SciPy general numerical integration method
-    (scipy.integrate()) and SciPy Special module for the error function
-    (scipy.special.erf()).
+    By default the integral is evaluated for all xi at once with a fixed
+    Gauss-Legendre rule (see Hn_smooth_coalbedo_gauss()). Otherwise, the SciPy
+    general numerical integration method (scipy.integrate.quad()) is used, in
+    which case one integration is carried out per element of xi. Results are
+    memoized in Hn_cache.
     
     --Args--
-    n  : integer determining which term in the expansion is being calculated.
-    xi : float between 0 and 1, sine of ice-edge latitude.
+    n            : integer determining which term in the expansion is being
+                   calculated.
+    xi           : float or NumPy array (values between 0 and 1), sine of
+                   ice-edge latitude.
+    (quadrature) : str, 'gauss' (default) or 'quad' (adaptive quadrature).
+    (params)     : Parameters tuple (default: current values, see
+                   parameters.py).
     """
-    a1 = 0.5*(pm.ai+pm.af); a2 = 0.5*(pm.ai-pm.af)
-    integrand = lambda x: ( (2*n+1)*spec.legendre(n)(x)*(
-        1+pm.S2*spec.legendre(2)(x))*(a1+a2*spec.erf((x-xi)/pm.delta_x)) )
-    return integrate.quad(integrand, 0.0, 1.0)[0]
+    params = pm.Get(params)
+    if quadrature == 'gauss':
+        return Hn_smooth_coalbedo_gauss([n], xi, params=params)[...,0]
+    key = ('smooth-quad', n, cache.ArrayKey(xi), params.ai, params.af,
+        params.S2, params.delta_x)
+    return Hn_cache.Get(key, _Hn_smooth_coalbedo_quad, n, xi, params)
 
 
-def Ln(n, D=pm.D):
+@prof.Timed('analytics._Hn_smooth_coalbedo_quad')
+def _Hn_smooth_coalbedo_quad(n, xi, params):
+    """Calculates H_n(x_i) for the smoothed coalbedo by adaptive quadrature
+    (see Hn_smooth_coalbedo()).
+    """
+    a1 = 0.5*(params.ai+params.af); a2 = 0.5*(params.ai-params.af)
+    P_n = lambda x: spec.eval_legendre(n, x); P_2 = Legendre(2)
+    xi = np.asarray(xi, dtype=float)
+    Hn = np.zeros(xi.shape)
+    prof.Count('analytics.quad_integrals', xi.size)
+    for j in xrange(xi.size):
+        integrand = lambda x: ( (2*n+1)*P_n(x)*(1+params.S2*P_2(x))*(
+            a1+a2*spec.erf((x-xi.flat[j])/params.delta_x)) )
+        if prof.enabled:
+            integrand = prof.Counted('analytics.quad_evaluations', integrand)
+        Hn.flat[j] = integrate.quad(integrand, 0.0, 1.0)[0]
+    return Hn[()]
+
+
+# Gauss-Legendre orders found to satisfy the tolerance on H_n for the smoothed
+# coalbedo, keyed on the parameters they were determined with:
+_gauss_orders = {}
+
+# Maximum number of values of P_n(x) evaluated at once by the Gauss-Legendre
+# rule (see _Hn_smooth_coalbedo_gauss()):
+_max_table_size = 2**22
+
+
+@prof.Timed('analytics._HnSmoothGaussRule')
+def _HnSmoothGaussRule(n, xi, m, params, derivative=None):
+    """Evaluate H_n(x_i) for the smoothed coalbedo with an m-point Gauss-
+    Legendre rule on each of the intervals [0, xi] and [xi, 1] (on which the
+    integrand is smooth). Returns an array of shape xi.shape + (len(n),).
+    
+    --Args--
+    n            : array of int, degrees of the terms to calculate.
+    xi           : NumPy array, sine of ice-edge latitude.
+    m            : int, number of Gauss-Legendre nodes on each interval.
+    params       : Parameters tuple.
+    (derivative) : str, if 'xi' or 'delta_x', evaluate the derivative of
+                   H_n with respect to that parameter instead (the coalbedo
+                   is replaced by its derivative).
+    """
+    a1 = 0.5*(params.ai+params.af); a2 = 0.5*(params.ai-params.af)
+    t, w = np.polynomial.legendre.leggauss(m)
+    xi = xi[...,np.newaxis]
+    x = np.concatenate( (0.5*xi*(1+t), xi + 0.5*(1-xi)*(1+t)), axis=-1 )
+    w = np.concatenate( (0.5*xi*w, 0.5*(1-xi)*w), axis=-1 )
+    prof.Count('analytics.gauss_evaluations', x.size)
+    u = (x-xi)/params.delta_x
+    if derivative == 'xi':
+        a = -2*a2*np.exp(-u**2) / (np.sqrt(np.pi)*params.delta_x)
+    elif derivative == 'delta_x':
+        a = -2*a2*u*np.exp(-u**2) / (np.sqrt(np.pi)*params.delta_x)
+    else:
+        a = a1 + a2*spec.erf(u)
+    f = w*(1 + params.S2*0.5*(3*x**2-1))*a
+    P_n = spectral.LegendreP(np.max(n), x)[...,n]
+    return (2*n+1)*np.einsum('...j,...jn->...n', f, P_n)
+
+
+@prof.Timed('analytics.Hn_smooth_coalbedo_gauss')
+def Hn_smooth_coalbedo_gauss(n, xi, tol=None, chunk_size=4096, params=None):
+    """Calculates H_n(x_i) for the smoothed coalbedo (see Hn_smooth_coalbedo())
+    for several n and a whole array of xi at once. The integral is split at xi
+    and each part is evaluated with a fixed Gauss-Legendre rule whose order is
+    chosen (by successive doubling) so that H_n changes by less than tol, as
+    tested on a set of ice-edge positions spanning 0 to 1. The chosen order is
+    cached for the current parameters and results are memoized in Hn_cache.
+    Returns an array of shape xi.shape + (len(n),).
+    
+    --Args--
+    n            : int or array of int, degree(s) of the terms to calculate.
+    xi           : float or NumPy array (values between 0 and 1), sine of
+                   ice-edge latitude.
+    (tol)        : float, absolute tolerance on H_n (default params.Hn_tol).
+    (chunk_size) : int, number of xi values evaluated together (limits memory
+                   usage for large arrays).
+    (params)     : Parameters tuple (default: current values, see
+                   parameters.py).
+    """
+    params = pm.Get(params)
+    n = np.atleast_1d(n)
+    tol = params.Hn_tol if tol is None else tol
+    key = ('smooth-gauss', tuple(n), cache.ArrayKey(xi), tol, params.ai,
+        params.af, params.S2, params.delta_x)
+    return Hn_cache.Get(key, _Hn_smooth_coalbedo_gauss, n, xi, tol,
+        chunk_size, params)
+
+
+@prof.Timed('analytics._GaussOrder')
+def _GaussOrder(n, tol, params):
+    """Returns the Gauss-Legendre order used for H_n for the smoothed coalbedo
+    (see Hn_smooth_coalbedo_gauss()), determining it if necessary."""
+    key = (np.max(n), tol, params.ai, params.af, params.S2, params.delta_x)
+    if key not in _gauss_orders:
+        xi_test = np.linspace(0.0, 1.0, 11)
+        m = 8
+        Hn_old = _HnSmoothGaussRule(n, xi_test, m, params)
+        while m < 4096:
+            m *= 2
+            Hn_new = _HnSmoothGaussRule(n, xi_test, m, params)
+            if np.max(abs(Hn_new - Hn_old)) < tol:
+                break
+            Hn_old = Hn_new
+        _gauss_orders[key] = m
+    return _gauss_orders[key]
+
+
+@prof.Timed('analytics._Hn_smooth_coalbedo_gauss')
+def _Hn_smooth_coalbedo_gauss(n, xi, tol, chunk_size, params):
+    """Calculates H_n(x_i) for the smoothed coalbedo using Gauss-Legendre
+    quadrature (see Hn_smooth_coalbedo_gauss()).
+    """
+    m = _GaussOrder(n, tol, params)
+    # Limit the size of the table of P_n at the nodes, for large n:
+    chunk_size = max(1, min(chunk_size, _max_table_size//(2*m*(np.max(n)+1))))
+    xi = np.asarray(xi, dtype=float)
+    Hn = np.zeros(xi.shape + (len(n),))
+    xi_flat = xi.ravel(); Hn_flat = Hn.reshape(-1, len(n))
+    for j in xrange(0, xi.size, chunk_size):
+        Hn_flat[j:j+chunk_size] = _HnSmoothGaussRule(n,
+            xi_flat[j:j+chunk_size], m, params)
+    return Hn
+
+
+def HnCacheInfo():
+    """Returns a dictionary of statistics (hits, misses, size, ...) for the
+    cache of H_n(x_i) values, Hn_cache. Its size may be changed with
+    Hn_cache.Resize() and it may be emptied with Hn_cache.Clear().
+    """
+    return Hn_cache.Info()
+
+
+def CheckHnSmoothCoalbedo(xi=np.linspace(0.0, 1.0, 21), tol=None,
+    params=None):
+    """Regression check of the Gauss-Legendre calculation of H_n(x_i) for the
+    smoothed coalbedo against the adaptive quadrature (scipy.integrate.quad())
+    result for each term in the expansion. Returns the maximum absolute
+    difference.
+    
+    --Args--
+    (xi)     : NumPy array, ice-edge positions at which to compare.
+    (tol)    : float, tolerance passed to Hn_smooth_coalbedo_gauss().
+    (params) : Parameters tuple (default: current values, see parameters.py).
+    """
+    params = pm.Get(params)
+    n = spectral.Degrees(params.nmax)
+    Hn_gauss = Hn_smooth_coalbedo_gauss(n, xi, tol, params=params)
+    Hn_quad = np.stack([Hn_smooth_coalbedo(k, xi, 'quad', params)
+        for k in n], axis=-1)
+    return np.max(abs(Hn_gauss - Hn_quad))
+
+
+@prof.Timed('analytics.HnCoefficients')
+def HnCoefficients(xi, smooth_coalbedo=False, params=None):
+    """Returns all of the terms H_n(x_i) (n = 0, 2, ..., see Hn_step_coalbedo()
+    and Hn_smooth_coalbedo()) in the truncated expansion as a NumPy array of
+    shape xi.shape + (number of terms,).
+    
+    --Args--
+    xi                : float or array, sine of ice-edge latitude.
+    (smooth_coalbedo) : bool, whether to use smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    params = pm.Get(params)
+    n = spectral.Degrees(params.nmax)
+    if smooth_coalbedo:
+        return Hn_smooth_coalbedo_gauss(n, xi, params=params)
+    return Hn_step_coalbedo(n, xi, params)
+
+
+@prof.Timed('analytics.HnTerms')
+def HnTerms(xi, smooth_coalbedo=False, params=None):
+    """H_n(x_i) is linear in af, af*S2, ai and ai*S2:
+    
+        H_n = af*(F_n + S2*G_n) + ai*(F'_n + S2*G'_n),
+    
+    where F_n, G_n, F'_n and G'_n are the values of H_n for unit values of
+    each of these (in turn) and zero for the others. Returns these four terms
+    as a NumPy array of shape (4,) + xi.shape + (number of terms,), from
+    which H_n and its derivatives with respect to the coalbedo parameters may
+    be obtained for any ai, af and S2 (e.g. for ensembles, see ensemble.py).
+    The smoothing width delta_x is taken from params.
+    
+    --Args--
+    xi                : float or array, sine of ice-edge latitude.
+    (smooth_coalbedo) : bool, whether to use smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    params = pm.Get(params)
+    units = [(1.0, 0.0, 0.0), (1.0, 0.0, 1.0), (0.0, 1.0, 0.0),
+        (0.0, 1.0, 1.0)]
+    F1, F1G1, F2, F2G2 = [HnCoefficients(xi, smooth_coalbedo,
+        params._replace(af=af, ai=ai, S2=S2)) for af, ai, S2 in units]
+    return np.stack((F1, F1G1-F1, F2, F2G2-F2))
+
+
+# Parameters with respect to which derivatives of H_n are calculated (see
+# HnDerivatives()):
+Hn_derivative_parameters = ('xi', 'ai', 'af', 'S2', 'delta_x')
+
+
+@prof.Timed('analytics.HnDerivatives')
+def HnDerivatives(xi, smooth_coalbedo=False, params=None):
+    """Returns the derivatives of all of the terms H_n in the truncated
+    expansion (see HnCoefficients()) with respect to the ice edge x_i and the
+    coalbedo parameters ai, af, S2 and delta_x, as a dictionary of NumPy
+    arrays of shape xi.shape + (number of terms,). All are exact: for the
+    step coalbedo,
+    
+        dH_n/dx_i = (2n+1) P_n(x_i) (1 + S2 P_2(x_i)) (af - ai),
+    
+    and for the smoothed coalbedo the derivative of the coalbedo with respect
+    to x_i or delta_x is integrated with the same Gauss-Legendre rule as H_n.
+    The derivatives with respect to ai, af and S2 follow from HnTerms().
+    
+    --Args--
+    xi                : float or array, sine of ice-edge latitude.
+    (smooth_coalbedo) : bool, whether to use smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    params = pm.Get(params)
+    n = spectral.Degrees(params.nmax)
+    xi = np.asarray(xi, dtype=float)
+    F1, G1, F2, G2 = HnTerms(xi, smooth_coalbedo, params)
+    dHn = {'af': F1 + params.S2*G1, 'ai': F2 + params.S2*G2,
+        'S2': params.af*G1 + params.ai*G2}
+    if smooth_coalbedo:
+        m = _GaussOrder(n, params.Hn_tol, params)
+        for name in ['xi', 'delta_x']:
+            dHn[name] = _HnSmoothGaussRule(n, xi, m, params, name)
+    else:
+        P = spectral.LegendreP(max(n[-1], 2), xi)
+        dHn['xi'] = (2*n+1)*P[...,n]*(1 + params.S2*P[...,2:3])*(
+            params.af-params.ai)
+        dHn['delta_x'] = np.zeros(xi.shape + (len(n),))
+    return dHn
+
+
+def Ln(n, D=None, params=None):
     """The term denoted L_n = n(n+1)D + B in the solution to the classical EBM
     (see North et. al. 1981 equation (28)).
     
     --Args--
-    n   : int, identifies the term in the spectral expansion.
-    (D) : float, large-scale constant diffusivity [W m^-2 degC^-1]
+    n        : int, identifies the term in the spectral expansion.
+    (D)      : float or NumPy array, large-scale constant diffusivity
+               [W m^-2 degC^-1] (default params.D).
+    (params) : Parameters tuple (default: current values, see parameters.py).
     """
-    return n*(n+1)*D + pm.B
+    params = pm.Get(params)
+    D = params.D if D is None else D
+    return n*(n+1)*D + params.B
 
 
-def Tn(n, xi, Q=pm.Q, D=pm.D, smooth_coalbedo=False):
+@prof.Timed('analytics.Tn')
+def Tn(n, xi, Q=None, D=None, smooth_coalbedo=False, params=None):
     """
     Returns the coefficient T_n [degC] in the expansion of T(x) for the
     solution of the classical EBM model (North et. al. 1981 equation (30)).
+    The arguments xi, Q and D may be NumPy arrays, in which case they are
+    broadcast against each other and an array of T_n is returned.
     
     --Args--
     n                 : int, identifies the term in the spectral expansion.
-    xi                : float, sine of ice-edge latitude [dimensionless].
-    (Q)               : float, solar constant divided by 4 [W m^-2].
-    (D)               : float, large-scale constant diffusivity
-                        [W m^-2 degC^-1].
+    xi                : float or array, sine of ice-edge latitude
+                        [dimensionless].
+    (Q)               : float or array, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float or array, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
     (smooth_coalbedo) : bool, whether to use smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
     """
-    Hn= Hn_smooth_coalbedo(n,xi) if smooth_coalbedo else Hn_step_coalbedo(n,xi)
-    T_n = Q*Hn/Ln(n, D) - (n==0)*(pm.A/pm.B)
+    params = pm.Get(params)
+    Q = params.Q if Q is None else Q
+    if smooth_coalbedo:
+        Hn = Hn_smooth_coalbedo(n, xi, params=params)
+    else:
+        Hn = Hn_step_coalbedo(n, xi, params)
+    T_n = Q*Hn/Ln(n, D, params) - (n==0)*(params.A/params.B)
     return T_n
 
 
-def Q(xi, D=pm.D, smooth_coalbedo=False):
+@prof.Timed('analytics.Q')
+def Q(xi, D=None, smooth_coalbedo=False, params=None):
     """Calculates analytically Q at ice edge position xi for the diffusive
     model including the ice albedo feedback effect, i.e. equation (37) in North
-    et al.
+    et al. Both xi and D may be NumPy arrays, which are broadcast against each
+    other; e.g. Q(xi[np.newaxis,:], D[:,np.newaxis]) returns one Q(x_i) curve
+    per row for each value of D. H_n is only computed once per xi value.
     
     --Args--
-    xi                : float, sine of ice-edge latitude [dimensionless].
-    (D)               : float, the large-scale constant diffusivity
-                        [W m^-2 degC^-1]
+    xi                : float or array, sine of ice-edge latitude
+                        [dimensionless].
+    (D)               : float or array, the large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
     (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
     """
-    sumterm = 0
-    for n in xrange(0, pm.nmax+2, 2):
-        Hn = Hn_smooth_coalbedo(n, xi) if smooth_coalbedo else Hn_step_coalbedo(n, xi)
-        sumterm += Hn*spec.legendre(n)(xi)/Ln(n, D)
+    return AnalyticSolution(xi, smooth_coalbedo, params).Q(D)
+
+
+@prof.Timed('analytics.TnCoefficients')
+def TnCoefficients(xi, Q=None, D=None, smooth_coalbedo=False, params=None):
+    """Returns all of the coefficients T_n [degC] (n = 0, 2, ..., see Tn())
+    in the truncated expansion of T(x), as a NumPy array whose last axis runs
+    over n. If xi, Q or D are arrays, they are broadcast against each other
+    and the result has shape (broadcast shape) + (number of terms,).
     
-    return (pm.A + pm.B*pm.T_ice_edge) / (pm.B*sumterm)
+    --Args--
+    xi                : float or array, sine of ice-edge latitude
+                        [dimensionless].
+    (Q)               : float or array, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float or array, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return AnalyticSolution(xi, smooth_coalbedo, params).TnCoefficients(Q, D)
 
 
-def HeatFluxConvergence(x, xi, Q=pm.Q, D=pm.D, smooth_coalbedo=False):
+@prof.Timed('analytics.Temperature')
+def Temperature(x, xi, Q=None, D=None, smooth_coalbedo=False, params=None):
+    """Calculate the steady-state surface temperature T [degC] at location x.
+    All of x, xi, Q and D may be NumPy arrays, which are broadcast against each
+    other (so that, for example, x[np.newaxis,:] and xi[:,np.newaxis] returns
+    one temperature profile per row for each ice edge). For a single solution
+    (scalar xi, Q and D) this is one matrix-vector product against a cached
+    table of P_n(x) (see spectral.py).
+    
+    --Args--
+    x                 : float or array, sine of latitude at which to calculate
+                        T.
+    xi                : float or array, sine of ice-edge latitude.
+    (Q)               : float or array, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float or array, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return AnalyticSolution(xi, smooth_coalbedo, params).Temperature(x, Q, D)
+
+
+@prof.Timed('analytics.HeatFluxConvergence')
+def HeatFluxConvergence(x, xi, Q=None, D=None, smooth_coalbedo=False,
+    params=None):
     """Calculate the steady-state heat flux convergence (HFC) [W m^-2] at
-    location x.
+    location x. All of x, xi, Q and D may be NumPy arrays, which are broadcast
+    against each other (see Temperature()).
     
     --Args--
-    x                 : float, sine of latitude at which to calculate HFC.
-    xi                : float, sine of ice-edge latitude.
-    (Q)               : float, solar constant divided by 4 [W m^-2].
-    (D)               : float, large-scale constant diffusivity
-                        [W m^-2 degC^-1].
+    x                 : float or array, sine of latitude at which to calculate
+                        HFC.
+    xi                : float or array, sine of ice-edge latitude.
+    (Q)               : float or array, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float or array, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
     (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
     """
-    sumterm_ddx = 0; sumterm_ddx2 = 0
-    for n in xrange(0, pm.nmax+2, 2):
-        T_n = Tn(n, xi, Q, D, smooth_coalbedo)
-        sumterm_ddx += T_n * np.polyder(spec.legendre(n), m=1)(x)
-        sumterm_ddx2 += T_n * np.polyder(spec.legendre(n), m=2)(x)
-    return D * ( (1-x**2)*sumterm_ddx2 - 2*x*sumterm_ddx )
+    solution = AnalyticSolution(xi, smooth_coalbedo, params)
+    return solution.HeatFluxConvergence(x, Q, D)
 
 
-def HeatTransport(x, xi, Q=pm.Q, D=pm.D, smooth_coalbedo=False):
+@prof.Timed('analytics.HeatTransport')
+def HeatTransport(x, xi, Q=None, D=None, smooth_coalbedo=False,
+    params=None):
     """Calculate the steady-state zonally-integrated heat transport [W] at
-    location x.
+    location x. All of x, xi, Q and D may be NumPy arrays, which are broadcast
+    against each other (see Temperature()).
+    
+    --Args--
+    x                 : float or array, sine of latitude at which to calculate
+                        heat transport.
+    xi                : float or array, sine of ice-edge latitude.
+    (Q)               : float or array, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float or array, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return AnalyticSolution(xi, smooth_coalbedo, params).HeatTransport(x, Q, D)
+
+
+# Parameters with respect to which the derivatives of the solution are
+# calculated (see AnalyticSolution and the functions below):
+derivative_parameters = ('xi', 'D', 'Q', 'A', 'B', 'ai', 'af', 'S2', 'delta_x')
+
+
+@prof.Timed('analytics.QDerivatives')
+def QDerivatives(xi, D=None, smooth_coalbedo=False, params=None):
+    """Returns (Q, dQ), where Q is Q(x_i) (see Q()) and dQ is a dictionary of
+    its exact derivatives with respect to x_i, D, A, B, ai, af, S2 and
+    delta_x (see AnalyticSolution.QDerivatives()), evaluated together.
+    
+    --Args--
+    xi                : float or array, sine of ice-edge latitude.
+    (D)               : float or array, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return AnalyticSolution(xi, smooth_coalbedo, params).QDerivatives(D)
+
+
+@prof.Timed('analytics.TnDerivatives')
+def TnDerivatives(xi, Q=None, D=None, smooth_coalbedo=False, params=None):
+    """Returns (T_n, dT_n), where T_n are the coefficients (see
+    TnCoefficients()) and dT_n is a dictionary of their exact derivatives
+    with respect to each of derivative_parameters.
+    
+    --Args--
+    xi                : float or array, sine of ice-edge latitude.
+    (Q)               : float or array, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float or array, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return AnalyticSolution(xi, smooth_coalbedo, params).TnDerivatives(Q, D)
+
+
+@prof.Timed('analytics.TemperatureDerivatives')
+def TemperatureDerivatives(x, xi, Q=None, D=None, smooth_coalbedo=False,
+    params=None):
+    """Returns (T, dT), the surface temperature [degC] at x (see
+    Temperature()) and a dictionary of its exact derivatives with respect to
+    each of derivative_parameters. Arguments are as for Temperature().
+    """
+    solution = AnalyticSolution(xi, smooth_coalbedo, params)
+    return solution.TemperatureDerivatives(x, Q, D)
+
+
+@prof.Timed('analytics.HeatFluxConvergenceDerivatives')
+def HeatFluxConvergenceDerivatives(x, xi, Q=None, D=None,
+    smooth_coalbedo=False, params=None):
+    """Returns (HFC, dHFC), the heat flux convergence [W m^-2] at x (see
+    HeatFluxConvergence()) and a dictionary of its exact derivatives with
+    respect to each of derivative_parameters. Arguments are as for
+    HeatFluxConvergence().
+    """
+    solution = AnalyticSolution(xi, smooth_coalbedo, params)
+    return solution.HeatFluxConvergenceDerivatives(x, Q, D)
+
+
+@prof.Timed('analytics.HeatTransportDerivatives')
+def HeatTransportDerivatives(x, xi, Q=None, D=None, smooth_coalbedo=False,
+    params=None):
+    """Returns (HT, dHT), the heat transport [W] at x (see HeatTransport())
+    and a dictionary of its exact derivatives with respect to each of
+    derivative_parameters. Arguments are as for HeatTransport().
+    """
+    solution = AnalyticSolution(xi, smooth_coalbedo, params)
+    return solution.HeatTransportDerivatives(x, Q, D)
+
+
+@prof.Timed('analytics.AdaptiveNmax')
+def AdaptiveNmax(xi, smooth_coalbedo=False, params=None):
+    """Returns (nmax, Hn): the truncation nmax of the spectral expansion to use
+    for the solution at the ice edge(s) xi, and the terms H_n(x_i) (see
+    HnCoefficients()) for the degrees up to at least nmax.
+    
+    If params.nmax_Q_tol and params.nmax_T_tol are both zero, this is just
+    params.nmax. Otherwise nmax is the smallest for which the estimated
+    truncation errors of Q(x_i) [W m^-2] and of T(x) [degC] (for D = params.D
+    and, for T, Q = Q(x_i)) are less than those tolerances (where positive) at
+    every xi. Starting from N = params.nmax, N is doubled until the truncation
+    at N differs from that at 2N by less than half of the tolerance; nmax is
+    then the smallest truncation which differs from that at 2N (as do all
+    larger ones) by less than half of the tolerance. For T(x), the difference
+    is bounded by the sum of |T_n| over the omitted terms, since |P_n(x)| <= 1.
+    If the tolerances are not met by params.nmax_limit, that is used.
+    
+    --Args--
+    xi                : float or array, sine of ice-edge latitude.
+    (smooth_coalbedo) : bool, whether to use smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    params = pm.Get(params)
+    if params.nmax_Q_tol <= 0 and params.nmax_T_tol <= 0:
+        return params.nmax, HnCoefficients(xi, smooth_coalbedo, params)
+    xi = np.asarray(xi, dtype=float)
+    N = max(2, params.nmax - params.nmax % 2)
+    while True:
+        p = params._replace(nmax=min(2*N, params.nmax_limit))
+        n = spectral.Degrees(p.nmax)
+        Hn = HnCoefficients(xi, smooth_coalbedo, p)
+        P_n = spectral.LegendreP(n[-1], xi)[...,n]
+        
+        # Q(x_i) and the magnitudes of T_n for each truncation n[j]:
+        S = np.cumsum(Hn*P_n/Ln(n, None, p), axis=-1)
+        Q_j = (p.A + p.B*p.T_ice_edge) / (p.B*S)
+        T_n = abs(Q_j[...,-1:]*Hn/Ln(n, None, p))
+        
+        # Difference from the finest truncation, relative to the tolerance:
+        error = np.zeros(xi.shape + (len(n),))
+        if p.nmax_Q_tol > 0:
+            error = abs(Q_j - Q_j[...,-1:]) / p.nmax_Q_tol
+        if p.nmax_T_tol > 0:
+            T_omitted = np.sum(T_n, axis=-1)[...,np.newaxis] - np.cumsum(T_n,
+                axis=-1)
+            error = np.maximum(error, T_omitted / p.nmax_T_tol)
+        error = np.max(error.reshape(-1, len(n)), axis=0)
+        
+        too_large = ~(error < 0.5)
+        if error[min(N//2, len(n)-1)] < 0.5 or p.nmax >= p.nmax_limit:
+            j = np.nonzero(too_large)[0]
+            return n[j[-1]+1 if len(j) > 0 else 0], Hn
+        N = p.nmax
+
+
+class AnalyticSolution(object):
+    """The analytic solution for a fixed ice edge (or array of ice edges) xi.
+    The terms H_n(x_i), which require the integration over the coalbedo, do
+    not depend on Q or D, so they are calculated once on construction; T_n,
+    Q(x_i) and the temperature/heat transport profiles for any Q and D are then
+    obtained by rescaling them. This makes sweeps over Q and D on a fixed xi
+    grid cheap after the first pass.
+    
+    The methods ending in Derivatives return (value, derivatives), where
+    derivatives is a dictionary of the exact derivatives of the value with
+    respect to each of derivative_parameters (except Q for Q(x_i) itself),
+    obtained from the same terms as the value (the derivatives of H_n are
+    calculated on first use, see HnDerivatives()).
+    
+    All other parameters are taken from params, which is fixed at
+    construction; Q and D default to params.Q and params.D. If a tolerance on
+    the truncation error is set (params.nmax_Q_tol or params.nmax_T_tol), the
+    truncation is chosen on construction (see AdaptiveNmax()) and
+    self.params.nmax is replaced by it.
     
     --Args--
-    x                 : float, sine of latitude at which to calculate HFC.
-    xi                : float, sine of ice-edge latitude.
-    (Q)               : float, solar constant divided by 4 [W m^-2].
-    (D)               : float, large-scale constant diffusivity
-                        [W m^-2 degC^-1].
+    xi                : float or array, sine of ice-edge latitude.
     (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
     """
-    sumterm = 0 # sum from n=0 to n=nmax (n even), of T_n*(d/dx)P_n
-    for n in xrange(0, pm.nmax+2, 2):
-        T_n = Tn(n, xi, Q, D, smooth_coalbedo)
-        sumterm += T_n*np.polyder(spec.legendre(n), m=1)(x)
-    return -2*np.pi*D*pm.RE**2*(1-x**2)*sumterm
+    
+    @prof.Timed('analytics.AnalyticSolution.__init__')
+    def __init__(self, xi, smooth_coalbedo=False, params=None):
+        self.xi = np.asarray(xi, dtype=float)
+        self.smooth_coalbedo = smooth_coalbedo
+        self.params = pm.Get(params)
+        nmax, Hn = AdaptiveNmax(self.xi, smooth_coalbedo, self.params)
+        self.params = self.params._replace(nmax=nmax)
+        self.n = spectral.Degrees(nmax)
+        self.Hn = Hn[...,:len(self.n)]
+        self._P_n_xi = None
+        self._dP_n_xi = None
+        self._dHn = None
+    
+    def _Legendre_xi(self):
+        """Returns P_n(x_i) and P_n'(x_i), calculated on first use."""
+        if self._dP_n_xi is None:
+            P, dP = spectral.LegendreTable(self.n[-1], self.xi)[:2]
+            self._P_n_xi = P[...,self.n]
+            self._dP_n_xi = dP[...,self.n]
+        return self._P_n_xi, self._dP_n_xi
+    
+    def _HnDerivatives(self):
+        """Returns the derivatives of H_n (see HnDerivatives()), calculated
+        on first use."""
+        if self._dHn is None:
+            self._dHn = HnDerivatives(self.xi, self.smooth_coalbedo,
+                self.params)
+        return self._dHn
+    
+    def _QD(self, Q, D):
+        """Returns Q and D (defaulting to the values in self.params) as arrays
+        with a trailing axis to broadcast against the degrees n."""
+        Q = self.params.Q if Q is None else Q
+        D = self.params.D if D is None else D
+        return np.asarray(Q)[...,np.newaxis], np.asarray(D)[...,np.newaxis]
+    
+    @prof.Timed('analytics.AnalyticSolution.TnCoefficients')
+    def TnCoefficients(self, Q=None, D=None):
+        """Returns all of the coefficients T_n [degC] as an array of shape
+        (broadcast shape of xi, Q and D) + (number of terms,).
+        
+        --Args--
+        (Q) : float or array, solar constant divided by 4 [W m^-2].
+        (D) : float or array, large-scale constant diffusivity
+              [W m^-2 degC^-1].
+        """
+        Q, D = self._QD(Q, D)
+        p = self.params
+        return Q*self.Hn/Ln(self.n, D, p) - (self.n==0)*(p.A/p.B)
+    
+    @prof.Timed('analytics.AnalyticSolution.Q')
+    def Q(self, D=None):
+        """Returns Q(x_i) [W m^-2] for the steady state at each ice edge (see
+        Q()), for diffusivity D (float or array, broadcast against xi).
+        """
+        if self._P_n_xi is None:
+            self._P_n_xi = spectral.LegendreP(self.n[-1], self.xi)[...,self.n]
+        D = self._QD(None, D)[1]
+        p = self.params
+        sumterm = np.sum(self.Hn*self._P_n_xi/Ln(self.n, D, p), axis=-1)
+        return (p.A + p.B*p.T_ice_edge) / (p.B*sumterm)
+    
+    @prof.Timed('analytics.AnalyticSolution.Temperature')
+    def Temperature(self, x, Q=None, D=None):
+        """Returns the surface temperature T [degC] at x (see Temperature()).
+        """
+        basis = spectral.GetSpectralBasis(self.params.nmax, x)
+        return basis.Sum(basis.P, self.TnCoefficients(Q, D))
+    
+    @prof.Timed('analytics.AnalyticSolution.HeatFluxConvergence')
+    def HeatFluxConvergence(self, x, Q=None, D=None):
+        """Returns the heat flux convergence [W m^-2] at x (see
+        HeatFluxConvergence()).
+        """
+        basis = spectral.GetSpectralBasis(self.params.nmax, x)
+        T_n = self.TnCoefficients(Q, D)
+        D = self.params.D if D is None else D
+        sumterm_ddx = basis.Sum(basis.dP, T_n)
+        sumterm_ddx2 = basis.Sum(basis.d2P, T_n)
+        return D * ( (1-basis.x**2)*sumterm_ddx2 - 2*basis.x*sumterm_ddx )
+    
+    @prof.Timed('analytics.AnalyticSolution.HeatTransport')
+    def HeatTransport(self, x, Q=None, D=None):
+        """Returns the zonally-integrated heat transport [W] at x (see
+        HeatTransport()).
+        """
+        basis = spectral.GetSpectralBasis(self.params.nmax, x)
+        T_n = self.TnCoefficients(Q, D)
+        D = self.params.D if D is None else D
+        sumterm = basis.Sum(basis.dP, T_n) # sum over n (even) of T_n*P_n'
+        return -2*np.pi*D*self.params.RE**2*(1-basis.x**2)*sumterm
+    
+    @prof.Timed('analytics.AnalyticSolution.TnDerivatives')
+    def TnDerivatives(self, Q=None, D=None):
+        """Returns (T_n, dT_n) where T_n are the coefficients (see
+        TnCoefficients()) and dT_n is a dictionary of their derivatives, of
+        the same shape, with respect to each of derivative_parameters. With
+        L_n = n(n+1)D + B,
+        
+            dT_n/dD = -Q H_n n(n+1)/L_n^2,    dT_n/dQ = H_n/L_n,
+            dT_n/dB = -Q H_n/L_n^2 + delta_n0 A/B^2,
+        
+        and the derivatives with respect to x_i and the coalbedo parameters
+        are Q (dH_n/dp)/L_n.
+        
+        --Args--
+        (Q) : float or array, solar constant divided by 4 [W m^-2].
+        (D) : float or array, large-scale constant diffusivity
+              [W m^-2 degC^-1].
+        """
+        Q, D = self._QD(Q, D)
+        p = self.params
+        n = self.n
+        L = Ln(n, D, p)
+        T_n = Q*self.Hn/L - (n==0)*(p.A/p.B)
+        zero = np.zeros(T_n.shape)
+        dT_n = {'D': zero - Q*self.Hn*n*(n+1)/L**2,
+            'Q': zero + self.Hn/L,
+            'A': zero - (n==0)/p.B,
+            'B': zero - Q*self.Hn/L**2 + (n==0)*(p.A/p.B**2)}
+        for name, dHn in self._HnDerivatives().items():
+            dT_n[name] = zero + Q*dHn/L
+        return T_n, dT_n
+    
+    @prof.Timed('analytics.AnalyticSolution.QDerivatives')
+    def QDerivatives(self, D=None):
+        """Returns (Q, dQ) where Q is Q(x_i) (see Q()) and dQ is a dictionary
+        of its derivatives with respect to each of derivative_parameters
+        other than Q. Writing Q = (A + B T_ice_edge)/(B S) with
+        S = sum_n H_n(x_i) P_n(x_i)/L_n, these follow from
+        
+            dQ/dp = (dA/dp + T_ice_edge dB/dp)/(B S) - Q (dB/dp)/B
+                    - Q (dS/dp)/S.
+        
+        In particular dQ/dx_i, whose sign gives the stability of the steady
+        state (see continuation.py), includes the variation of P_n(x_i).
+        
+        --Args--
+        (D) : float or array, large-scale constant diffusivity
+              [W m^-2 degC^-1].
+        """
+        P, dP = self._Legendre_xi()
+        D = self._QD(None, D)[1]
+        p = self.params
+        n = self.n
+        L = Ln(n, D, p)
+        S = np.sum(self.Hn*P/L, axis=-1)
+        Q = (p.A + p.B*p.T_ice_edge) / (p.B*S)
+        dS = {'D': -np.sum(self.Hn*P*n*(n+1)/L**2, axis=-1),
+            'A': 0.0*S,
+            'B': -np.sum(self.Hn*P/L**2, axis=-1)}
+        for name, dHn in self._HnDerivatives().items():
+            dS[name] = np.sum(dHn*P/L, axis=-1)
+        dS['xi'] = dS['xi'] + np.sum(self.Hn*dP/L, axis=-1)
+        dQ = dict((name, -Q*dS[name]/S) for name in dS)
+        dQ['A'] = dQ['A'] + 1.0/(p.B*S)
+        dQ['B'] = dQ['B'] + p.T_ice_edge/(p.B*S) - Q/p.B
+        return Q, dQ
+    
+    @prof.Timed('analytics.AnalyticSolution.TemperatureDerivatives')
+    def TemperatureDerivatives(self, x, Q=None, D=None):
+        """Returns (T, dT), the surface temperature [degC] at x (see
+        Temperature()) and a dictionary of its derivatives with respect to
+        each of derivative_parameters.
+        """
+        basis = spectral.GetSpectralBasis(self.params.nmax, x)
+        T_n, dT_n = self.TnDerivatives(Q, D)
+        return basis.Sum(basis.P, T_n), dict((name, basis.Sum(basis.P, dT))
+            for name, dT in dT_n.items())
+    
+    @prof.Timed('analytics.AnalyticSolution.HeatFluxConvergenceDerivatives')
+    def HeatFluxConvergenceDerivatives(self, x, Q=None, D=None):
+        """Returns (HFC, dHFC), the heat flux convergence [W m^-2] at x (see
+        HeatFluxConvergence()) and a dictionary of its derivatives with
+        respect to each of derivative_parameters.
+        """
+        basis = spectral.GetSpectralBasis(self.params.nmax, x)
+        T_n, dT_n = self.TnDerivatives(Q, D)
+        D = self.params.D if D is None else D
+        
+        def HFC(c):
+            return D * ( (1-basis.x**2)*basis.Sum(basis.d2P, c)
+                - 2*basis.x*basis.Sum(basis.dP, c) )
+        
+        value = HFC(T_n)
+        derivatives = dict((name, HFC(dT)) for name, dT in dT_n.items())
+        derivatives['D'] = derivatives['D'] + value/D
+        return value, derivatives
+    
+    @prof.Timed('analytics.AnalyticSolution.HeatTransportDerivatives')
+    def HeatTransportDerivatives(self, x, Q=None, D=None):
+        """Returns (HT, dHT), the zonally-integrated heat transport [W] at x
+        (see HeatTransport()) and a dictionary of its derivatives with respect
+        to each of derivative_parameters.
+        """
+        basis = spectral.GetSpectralBasis(self.params.nmax, x)
+        T_n, dT_n = self.TnDerivatives(Q, D)
+        D = self.params.D if D is None else D
+        c = -2*np.pi*D*self.params.RE**2*(1-basis.x**2)
+        value = c*basis.Sum(basis.dP, T_n)
+        derivatives = dict((name, c*basis.Sum(basis.dP, dT))
+            for name, dT in dT_n.items())
+        derivatives['D'] = derivatives['D'] + value/D
+        return value, derivatives
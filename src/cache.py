@@ -0,0 +1,87 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Bounded memoization cache used to avoid recomputing expensive, pure
+### functions of the model parameters (e.g. the H_n(x_i) integrals).
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import collections
+import numpy as np
+
+
+def ArrayKey(x):
+    """Returns a hashable key for a float or NumPy array x, for use as part of
+    a cache key.
+    """
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 0:
+        return float(x)
+    return (x.shape, x.tobytes())
+
+
+class Cache(object):
+    """A memoization cache of bounded size. When full, the least-recently used
+    (policy='lru') or the oldest (policy='fifo') entry is evicted. The numbers
+    of hits and misses are counted so that the effectiveness of the cache can
+    be checked (see Info()).
+    
+    Keys must contain everything that the cached value depends on (including
+    any parameters), so that changing a parameter gives a different key rather
+    than returning a stale value. NumPy arrays are stored read-only.
+    
+    --Args--
+    (maxsize) : int, maximum number of entries (0 disables caching).
+    (policy)  : str, eviction policy, 'lru' (default) or 'fifo'.
+    """
+    
+    def __init__(self, maxsize=128, policy='lru'):
+        if policy not in ('lru', 'fifo'):
+            raise ValueError("Cache policy must be 'lru' or 'fifo'")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def Get(self, key, function, *args):
+        """Returns the cached value for key if present, otherwise calculates
+        it as function(*args), stores it and returns it.
+        """
+        if key in self._data:
+            self.hits += 1
+            value = self._data[key]
+            if self.policy == 'lru':
+                del self._data[key]
+                self._data[key] = value
+            return value
+    
+        self.misses += 1
+        value = function(*args)
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        if self.maxsize > 0:
+            while len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+            self._data[key] = value
+        return value
+    
+    def Resize(self, maxsize):
+        """Change the maximum number of entries, evicting if necessary."""
+        self.maxsize = maxsize
+        while len(self._data) > max(maxsize, 0):
+            self._data.popitem(last=False)
+    
+    def Clear(self):
+        """Remove all entries and reset the hit/miss counters."""
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def Info(self):
+        """Returns a dictionary of the cache statistics."""
+        calls = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+            'size': len(self._data), 'maxsize': self.maxsize,
+            'policy': self.policy,
+            'hit_rate': (self.hits/calls if calls > 0 else 0.0)}
@@ -0,0 +1,321 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Continuation of the steady-state solution branch Q(x_i) of the analytic
+### EBM, and location of its saddle-node bifurcations (folds).
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import collections
+import parameters as pm, analytics as an
+import numpy as np
+import scipy.optimize as optimize
+
+
+# A section of the solution branch between folds (arrays of x_i and Q, and
+# whether the steady states on it are stable):
+Branch = collections.namedtuple('Branch', ['xi', 'Q', 'stable'])
+
+# A saddle-node bifurcation at (x_i, Q), a local 'maximum' or 'minimum' of
+# Q(x_i). Decreasing Q through a minimum leads to the snowball state (large
+# ice-cap instability) and increasing Q through a maximum leads to ice loss
+# (e.g. the small ice-cap instability):
+Fold = collections.namedtuple('Fold', ['xi', 'Q', 'kind'])
+
+
+def dQdxi(xi, D=None, smooth_coalbedo=False, params=None):
+    """Returns the gradient dQ/dx_i of the steady-state solution branch
+    (see analytics.Q()), calculated exactly (see
+    analytics.AnalyticSolution.QDerivatives()).
+    
+    --Args--
+    xi                : float or NumPy array, sine of ice-edge latitude.
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return an.QDerivatives(xi, D, smooth_coalbedo, params)[1]['xi']
+
+
+def TraceBranch(D=None, smooth_coalbedo=False, ds=0.01, ds_min=1E-5,
+    ds_max=0.05, max_angle=0.05, max_dQ_error=0.1, params=None):
+    """Trace the solution branch (Q(x_i), x_i) from x_i = 0 to x_i = 1 with
+    steps of arclength ds in the plane of (Q/Q0, x_i) (Q0 = params.Q), in the
+    direction of the tangent to the branch. Since Q is an explicit function
+    of x_i, the predicted point only needs its Q evaluated (there is no
+    corrector step). The step size is halved (down to ds_min) while the
+    tangent turns by more than max_angle [radians] in one step, i.e. near the
+    folds, or while dQ/dx_i at the middle of the step differs from the
+    linear interpolation between its ends by more than max_dQ_error times
+    their magnitude, and doubled (up to ds_max) where the branch is straight.
+    The second criterion resolves pairs of folds close to a cusp, where the
+    branch is nearly vertical (dQ/dx_i is small) and barely turns in this
+    plane. Returns NumPy arrays (xi, Q, dQ/dxi) at the points visited.
+    
+    --Args--
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (ds)              : float, initial arclength step.
+    (ds_min)          : float, minimum arclength step.
+    (ds_max)          : float, maximum arclength step.
+    (max_angle)       : float, maximum turning of the tangent per step.
+    (max_dQ_error)    : float, maximum relative error of the linear
+                        interpolation of dQ/dx_i over one step.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    params = pm.Get(params)
+    
+    def Points(xi):
+        Q, dQ = an.QDerivatives(xi, D, smooth_coalbedo, params)
+        dQ = dQ['xi']
+        tangent = np.array([dQ/params.Q, np.ones(np.shape(xi))])
+        return Q, dQ, tangent/np.sqrt(np.sum(tangent**2, axis=0))
+    
+    xi = [0.0]
+    Q, dQ, tangent = Points(0.0)
+    Q = [Q]; dQ = [dQ]
+    
+    while xi[-1] < 1.0:
+        xi_new = min(xi[-1] + ds*tangent[1], 1.0)
+        # The end and middle of the step:
+        Q_new, dQ_new, tangent_new = Points(np.array([xi_new,
+            0.5*(xi[-1] + xi_new)]))
+        angle = np.arccos(min(np.dot(tangent, tangent_new[:,0]), 1.0))
+        dQ_error = abs(dQ_new[1] - 0.5*(dQ[-1] + dQ_new[0])) / max(
+            abs(dQ[-1]), abs(dQ_new[0]))
+        if (angle > max_angle or dQ_error > max_dQ_error) and ds > ds_min:
+            ds = max(0.5*ds, ds_min)
+            continue
+        xi.append(xi_new); Q.append(Q_new[0]); dQ.append(dQ_new[0])
+        tangent = tangent_new[:,0]
+        # The interpolation error is proportional to ds^2:
+        if angle < 0.25*max_angle and dQ_error < 0.25*max_dQ_error:
+            ds = min(2*ds, ds_max)
+    
+    return np.array(xi), np.array(Q), np.array(dQ)
+
+
+def FindFolds(D=None, smooth_coalbedo=False, tol=1E-10, params=None,
+    **kwargs):
+    """Locate the saddle-node bifurcations (folds) of the solution branch, at
+    which dQ/dx_i = 0, to within tol in x_i. The branch is traced with
+    TraceBranch() (keyword arguments are passed to it) and each fold found
+    between consecutive points by Brent's method. Returns (folds, branches):
+    a list of Fold tuples, in order of increasing x_i, and a list of Branch
+    tuples for the sections of the branch between them (including the folds
+    at their ends). Steady states with dQ/dx_i > 0 are stable.
+    
+    --Args--
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (tol)             : float, tolerance on x_i of each fold.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    params = pm.Get(params)
+    xi, Q, dQ = TraceBranch(D, smooth_coalbedo, params=params, **kwargs)
+    
+    folds = []
+    for j in np.nonzero(np.sign(dQ[1:]) != np.sign(dQ[:-1]))[0]:
+        xi_fold = optimize.brentq(dQdxi, xi[j], xi[j+1],
+            args=(D, smooth_coalbedo, params), xtol=tol)
+        Q_fold = float(an.Q(xi_fold, D, smooth_coalbedo, params))
+        folds.append(Fold(xi_fold, Q_fold,
+            'maximum' if dQ[j] > 0 else 'minimum'))
+    
+    # Split the branch at the folds:
+    branches = []
+    xi_edges = [0.0] + [f.xi for f in folds] + [1.0]
+    for j in xrange(len(xi_edges)-1):
+        inside = (xi > xi_edges[j]) & (xi < xi_edges[j+1])
+        xi_branch = np.concatenate(([xi_edges[j]], xi[inside],
+            [xi_edges[j+1]]))
+        Q_branch = np.asarray(an.Q(xi_branch, D, smooth_coalbedo, params))
+        branches.append(Branch(xi_branch, Q_branch,
+            bool(Q_branch[-1] > Q_branch[0])))
+    
+    return folds, branches
+
+
+# The locus of one fold (saddle-node bifurcation) as a parameter is varied:
+# arrays of the parameter values p and of the fold position x_i and Q (NaN
+# where the fold does not exist, e.g. beyond a cusp where two folds merge),
+# and a list of the Cusp tuples at which it meets another fold curve:
+FoldCurve = collections.namedtuple('FoldCurve', ['kind', 'p', 'xi', 'Q',
+    'cusps'])
+
+# A cusp, at which a pair of folds (a minimum and a maximum of Q(x_i))
+# appears or merges, between p_values[index-1] and p_values[index]:
+Cusp = collections.namedtuple('Cusp', ['index', 'p', 'xi', 'Q'])
+
+
+def _ContinueFold(xi, k, step, kind, p_values, p_params, smooth_coalbedo,
+    tol, max_width):
+    """Returns the position of the fold of the given kind at p_values[k],
+    continued from its positions xi (an array over p_values) at k-step and
+    (if known) k-2*step, or NaN if it cannot be found (see TrackFolds()).
+    """
+    sign = 1 if kind == 'maximum' else -1 # sign of dQ/dxi below fold
+    j1 = k - step; j2 = k - 2*step
+    if 0 <= j2 < len(p_values) and not np.isnan(xi[j2]):
+        xi_predict = xi[j1] + (xi[j1]-xi[j2])*(
+            p_values[k]-p_values[j1])/(p_values[j1]-p_values[j2])
+        width = max(2*abs(xi[j1]-xi[j2]), 1E-3)
+    else:
+        xi_predict = xi[j1]
+        width = 1E-3
+    
+    args = (None, smooth_coalbedo, p_params[k])
+    while width <= max_width:
+        lo = max(xi_predict - width, 0.0)
+        hi = min(xi_predict + width, 1.0)
+        if sign*dQdxi(lo, *args) > 0 and sign*dQdxi(hi, *args) < 0:
+            return optimize.brentq(dQdxi, lo, hi, args=args, xtol=tol)
+        width *= 2
+    return np.nan
+
+
+def _LocateCusp(k_pair, k_none, xi_lo, xi_hi, kind_lo, param, p_values,
+    smooth_coalbedo, tol, params, n_bisect=40):
+    """Locate the cusp between p_values[k_pair], at which there is a pair of
+    folds at xi_lo < xi_hi (the lower being of kind kind_lo), and
+    p_values[k_none], at which there is not, by bisection in p. The pair
+    exists where the extremum of dQ/dx_i between them has the opposite sign
+    to dQ/dx_i outside them. Returns a Cusp tuple, or None if the pair is
+    not found.
+    """
+    sign = 1 if kind_lo == 'minimum' else -1 # sign of dQ/dxi between folds
+    half_width = max(xi_hi - xi_lo, 1E-3)
+    
+    def Extremum(p, xi_centre):
+        p_params = params._replace(**{param: p})
+        result = optimize.minimize_scalar(lambda x: -sign*dQdxi(x, None,
+            smooth_coalbedo, p_params), method='bounded', bounds=(
+            max(xi_centre - half_width, 0.0), min(xi_centre + half_width,
+            1.0)), options={'xatol': tol})
+        return result.x, -result.fun > 0
+    
+    p_pair, p_none = p_values[k_pair], p_values[k_none]
+    xi_cusp, exists = Extremum(p_pair, 0.5*(xi_lo + xi_hi))
+    if not exists:
+        return None
+    for j in xrange(n_bisect):
+        p_mid = 0.5*(p_pair + p_none)
+        xi_mid, exists = Extremum(p_mid, xi_cusp)
+        if exists:
+            p_pair, xi_cusp = p_mid, xi_mid
+        else:
+            p_none = p_mid
+    Q_cusp = float(an.Q(xi_cusp, None, smooth_coalbedo,
+        params._replace(**{param: p_pair})))
+    return Cusp(max(k_pair, k_none), p_pair, xi_cusp, Q_cusp)
+
+
+def _AddCusps(curves, k, step, param, p_values, smooth_coalbedo, tol,
+    params):
+    """For the fold curves which have a fold at p_values[k], find where each
+    ends in the direction of step (+1 or -1). Where a neighbouring minimum
+    and maximum end together, before the end of p_values, locate the cusp at
+    which they appear or merge and add it to both curves (see TrackFolds()).
+    """
+    ends = []
+    for c in curves:
+        j = k
+        while 0 <= j+step < len(p_values) and not np.isnan(c.xi[j+step]):
+            j += step
+        if 0 <= j+step < len(p_values):
+            ends.append((j, c.xi[j], c))
+    ends.sort(key=lambda end: end[:2])
+    j = 0
+    while j < len(ends)-1:
+        (k_lo, xi_lo, c_lo), (k_hi, xi_hi, c_hi) = ends[j], ends[j+1]
+        if k_lo == k_hi and c_lo.kind != c_hi.kind:
+            cusp = _LocateCusp(k_lo, k_lo+step, xi_lo, xi_hi, c_lo.kind,
+                param, p_values, smooth_coalbedo, tol, params)
+            if cusp is not None:
+                c_lo.cusps.append(cusp); c_hi.cusps.append(cusp)
+                j += 2
+                continue
+        j += 1
+
+
+def TrackFolds(p_values, param='D', smooth_coalbedo=False, tol=1E-10,
+    max_width=0.1, search_every=10, params=None):
+    """Track the saddle-node bifurcations of the solution branch through the
+    plane of (p, Q), where p is the diffusivity D or another model parameter
+    (e.g. 'B' or 'delta_x'), giving the critical Q (tipping point) as a
+    function of p. Each fold is followed through p_values by continuation:
+    its position at the next p is predicted by linear extrapolation from the
+    previous two, and corrected by Brent's method on dQ/dx_i = 0 in a
+    bracket about the prediction (widened up to max_width if necessary).
+    
+    The folds are located with FindFolds() at the first and last of
+    p_values, every search_every values, whenever a fold cannot be continued
+    (e.g. it has merged with another at a cusp, or left 0 < x_i < 1) and
+    while there are none. Any new fold is adopted, and continued back
+    through the previous p_values to where it appeared. Where a neighbouring
+    minimum and maximum appear or disappear together, the cusp at which
+    they meet is located by bisection in p, and added to both fold curves.
+    Returns a list of FoldCurve tuples (empty if there are no folds at any
+    of p_values, or p_values is empty).
+    
+    --Args--
+    p_values          : NumPy array, values of the parameter (ordered so that
+                        successive values are close).
+    (param)           : str, name of the parameter (a field of
+                        parameters.Parameters; default 'D').
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (tol)             : float, tolerance on x_i of each fold.
+    (max_width)       : float, maximum half-width of the bracket in x_i.
+    (search_every)    : int, number of p_values between searches for new
+                        folds (while the tracked folds can be continued).
+    (params)          : Parameters tuple of the other parameters (default:
+                        current values, see parameters.py).
+    """
+    params = pm.Get(params)
+    p_values = np.asarray(p_values, dtype=float)
+    p_params = [params._replace(**{param: p}) for p in p_values]
+    n_p = len(p_values)
+    track = (p_values, p_params, smooth_coalbedo, tol, max_width)
+    
+    curves = []
+    active = [] # the curves with a fold at the previous p
+    for k in xrange(n_p):
+        found = []; lost = []
+        for c in active:
+            c.xi[k] = _ContinueFold(c.xi, k, 1, c.kind, *track)
+            (lost if np.isnan(c.xi[k]) else found).append(c)
+    
+        if (k % search_every == 0 or k == n_p-1 or len(lost) > 0 or
+            len(found) == 0):
+            new = []
+            for fold in FindFolds(None, smooth_coalbedo, tol, p_params[k])[0]:
+                if not any(c.kind == fold.kind and abs(c.xi[k] - fold.xi) <
+                    max(1E3*tol, 1E-8) for c in found):
+                    new.append(FoldCurve(fold.kind, p_values,
+                        np.nan*np.zeros(n_p), np.nan*np.zeros(n_p), []))
+                    new[-1].xi[k] = fold.xi
+            # Continue the new folds back to where they appeared:
+            for c in new:
+                for j in xrange(k-1, -1, -1):
+                    c.xi[j] = _ContinueFold(c.xi, j, -1, c.kind, *track)
+                    if np.isnan(c.xi[j]):
+                        break
+            curves += new
+            found += new
+            _AddCusps(new, k, -1, param, p_values, smooth_coalbedo, tol,
+                params)
+    
+        _AddCusps(lost, k-1, 1, param, p_values, smooth_coalbedo, tol, params)
+        active = found
+    
+    for c in curves:
+        finite = ~np.isnan(c.xi)
+        c.Q[finite] = [float(an.Q(c.xi[k], None, smooth_coalbedo,
+            p_params[k])) for k in np.nonzero(finite)[0]]
+    return curves
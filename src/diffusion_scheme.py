@@ -4,17 +4,63 @@
 ### This code contains two sub-routines needed to solve the diffusion equation
 ### with variable diffusivity and non-zero source term. It does not include
 ### advection terms (dq/dx). SolveDiffusionEquation() integrates forward by one
-### time-step using SchemeMatrix() to calculate the diffusion operator, A.
+### time-step using SchemeMatrix() to calculate the diffusion operator, A, or
+### SchemeDiagonals() for its three non-zero diagonals (banded storage). The
+### DiffusionIntegrator class advances many time steps, reusing a single
+### factorisation of the implicit operator. Both also advance many independent
+### profiles at once (e.g. the members of an ensemble), given as the rows of a
+### 2D array, optionally each with its own diffusivity (see
+### TridiagonalSolve()).
 ### 
 ### See the repository documentation for further details.
 ### ---------------------------------------------------------------------------
 
 from __future__ import division
 import numpy as np
+import scipy.linalg as linalg, scipy.sparse as sparse
+import scipy.sparse.linalg as splinalg
 import matplotlib.pyplot as plt
+import profiling as prof
 
 
-def SchemeMatrix(N, k, L=1.0):
+@prof.Timed('diffusion_scheme.FaceDiffusivity')
+def FaceDiffusivity(N, k, L=1.0):
+    """Returns the diffusivity on the N+1 cell faces x_j = j*h (j = 0, ..., N,
+    h = L/N) of the grid used in the numerical scheme. The flux through the
+    boundary faces (j = 0, N) is zero for Neumann boundary conditions, so the
+    diffusivity there is set to zero (and k is never evaluated at x = 0, L).
+    
+    --Args--
+    N   : integer; number of grid cells.
+    k   : function of x, which should return the diffusivity at x. It is
+          called once with the array of interior face positions; if it cannot
+          operate on arrays, it is evaluated face by face instead.
+          Alternatively, a NumPy array of length N+1 containing precomputed
+          diffusivities on the cell faces, or of shape (M, N+1) containing
+          those of each of M independent profiles (in which case the result
+          has that shape).
+    (L) : float, upper limit of spatial domain (i.e. 0 < x < L), default L=1.0.
+    """
+    if callable(k):
+        k_faces = np.zeros(N+1)
+        x_faces = (L/N)*np.arange(1, N)
+        try:
+            k_faces[1:N] = k(x_faces)
+        except (TypeError, ValueError):
+            k_faces[1:N] = [k(x) for x in x_faces]
+    else:
+        k = np.asarray(k, dtype=float)
+        if k.ndim not in (1, 2) or k.shape[-1] != N+1:
+            raise ValueError('Face diffusivities must be an array of length '
+                + 'N+1 = %i (or of shape (M, N+1))' % (N+1))
+        k_faces = np.zeros(k.shape)
+        k_faces[...,1:N] = k[...,1:N]
+    
+    return k_faces
+
+
+@prof.Timed('diffusion_scheme.SchemeMatrix')
+def SchemeMatrix(N, k, L=1.0, form='dense'):
     """Calculate the matrix A which expresses the diffusion operator in the
     numerical scheme for solving the diffusion equation with spatially-variable
     diffusivity k(x) and source term S:
@@ -28,33 +74,155 @@ def SchemeMatrix(N, k, L=1.0):
     for details of how the matrix in this scheme is derived, or the repository
     documentation for a brief summary.
     
+    The matrix is tridiagonal, so it is assembled directly from its diagonals
+    (see SchemeDiagonals()) with k evaluated once on the cell faces.
+    
+    --Args--
+    N      : integer; number of grid cells.
+    k      : function; of x, which should return the diffusivity at x, or
+             array of diffusivities on the N+1 cell faces (see
+             FaceDiffusivity()).
+    (L)    : float, upper limit of spatial domain (i.e. 0 < x < L), default
+             L=1.0.
+    (form) : str, representation of A to return: 'dense' (default; NumPy
+             array of shape (N, N)), 'sparse' (SciPy CSR sparse matrix) or
+             'banded' (array of shape (3, N) in the format used by
+             scipy.linalg.solve_banded(), see BandedMatrix()).
+    """
+    lower, diag, upper = SchemeDiagonals(N, k, L)
+    if diag.ndim > 1:
+        raise ValueError("SchemeMatrix() requires a single diffusivity "
+            "profile (see SchemeDiagonals() for several)")
+    
+    if form == 'dense':
+        return np.diag(diag) + np.diag(lower[1:], -1) + np.diag(upper[:-1], 1)
+    elif form == 'sparse':
+        return sparse.diags([lower[1:], diag, upper[:-1]], [-1, 0, 1],
+            format='csr')
+    elif form == 'banded':
+        return BandedMatrix(lower, diag, upper)
+    else:
+        raise ValueError("form must be one of 'dense', 'sparse' or 'banded'")
+
+
+@prof.Timed('diffusion_scheme.SchemeDiagonals')
+def SchemeDiagonals(N, k, L=1.0):
+    """Calculate the three non-zero diagonals of the (tridiagonal) matrix A
+    which expresses the diffusion operator in the numerical scheme (see
+    SchemeMatrix()). Only O(N) storage is required. Returns NumPy arrays
+    (lower, diag, upper), each of length N, such that row i of A has elements
+    A[i][i-1] = lower[i], A[i][i] = diag[i] and A[i][i+1] = upper[i] (so that
+    lower[0] = upper[N-1] = 0). If k is an array of shape (M, N+1), giving the
+    diffusivity of each of M profiles, each has shape (M, N).
+    
     --Args--
     N   : integer; number of grid cells.
-    k   : function; of x, which should return the diffusivity at x.
+    k   : function; of x, which should return the diffusivity at x, or array
+          of diffusivities on the N+1 cell faces (see FaceDiffusivity()).
     (L) : float, upper limit of spatial domain (i.e. 0 < x < L), default L=1.0.
     """
     h = L / N
-    A = np.zeros( (N, N) )
+    k_faces = FaceDiffusivity(N, k, L)
+    
+    lower = k_faces[...,:-1] / h**2
+    upper = k_faces[...,1:] / h**2
+    diag = -(lower + upper)
     
-    # Inner elements (away from boundaries) - all rows except first and last:
-    for i in xrange(1, N-1):
-        for j in xrange(0, N):
-            A[i][j] = (i==(j+1)) * k((j+1)*h) + \
-                      (i==(j-1)) * k(j*h) + \
-                      ( i == j ) * -(k((j+1)*h) + k(j*h))
+    return lower, diag, upper
+
+
+@prof.Timed('diffusion_scheme.BandedMatrix')
+def BandedMatrix(lower, diag, upper, scale=1.0, shift=0.0):
+    """Returns the tridiagonal matrix shift*I + scale*A, where A has diagonals
+    (lower, diag, upper) as returned by SchemeDiagonals(), in the banded
+    storage format used by scipy.linalg.solve_banded() (an array of shape
+    (3, N)).
     
-    # Neumann boundaries - first and last rows:
-    A[0][0] = -k(h)
-    A[0][1] = k(h)
-    A[N-1][N-2] = k((N-1)*h)
-    A[N-1][N-1] = -k((N-1)*h)
+    --Args--
+    lower, diag, upper : NumPy arrays of length N, diagonals of A.
+    (scale)            : float, factor multiplying A.
+    (shift)            : float, multiple of the identity matrix to add.
+    """
+    ab = np.zeros( (3, len(diag)) )
+    ab[0,1:] = scale*upper[:-1]
+    ab[1,:] = shift + scale*diag
+    ab[2,:-1] = scale*lower[1:]
+    return ab
+
+
+@prof.Timed('diffusion_scheme.TridiagonalDot')
+def TridiagonalDot(lower, diag, upper, q):
+    """Returns the matrix-vector product A*q in O(N) operations, where A is
+    the tridiagonal matrix with diagonals (lower, diag, upper) as returned by
+    SchemeDiagonals(). For several profiles, the diagonals and q are arrays
+    of shape (M, N) (or (N,), if shared), which are broadcast against each
+    other.
+    
+    --Args--
+    lower, diag, upper : NumPy arrays of length N, diagonals of A.
+    q                  : NumPy array of length N.
+    """
+    Aq = diag*q
+    Aq[...,1:] += lower[...,1:]*q[...,:-1]
+    Aq[...,:-1] += upper[...,:-1]*q[...,1:]
+    return Aq
+
+
+@prof.Timed('diffusion_scheme.TridiagonalFactor')
+def TridiagonalFactor(lower, diag, upper):
+    """Factorise a batch of tridiagonal matrices, with diagonals (lower, diag,
+    upper) of shape (M, N) as returned by SchemeDiagonals() (any of which may
+    instead have shape (N,) if shared), for solving with TridiagonalSolve().
+    This is the forward elimination of the Thomas algorithm, carried out for
+    all M matrices at once, which is stable without pivoting for the
+    diagonally dominant matrices of the implicit scheme. The factors are
+    stored with the grid as their first axis, so that each step of the
+    elimination operates on a contiguous array of length M.
     
-    A /= h**2 
+    --Args--
+    lower, diag, upper : NumPy arrays of shape (M, N), diagonals.
+    """
+    lower, diag, upper = [np.moveaxis(np.asarray(a, dtype=float), -1, 0)
+        for a in np.broadcast_arrays(lower, diag, upper)]
+    N = diag.shape[0]
+    w = np.zeros(diag.shape) # reciprocals of the pivots
+    c = np.zeros(diag.shape) # upper diagonal divided by the pivots
+    w[0] = 1.0 / diag[0]
+    c[0] = upper[0]*w[0]
+    for i in xrange(1, N):
+        w[i] = 1.0 / (diag[i] - lower[i]*c[i-1])
+        c[i] = upper[i]*w[i]
+    return np.ascontiguousarray(lower), w, c
+
+
+@prof.Timed('diffusion_scheme.TridiagonalSolve')
+def TridiagonalSolve(factors, d):
+    """Solve the batch of tridiagonal systems A_m q_m = d_m (m = 1, ..., M)
+    factorised by TridiagonalFactor(), by the forward and back substitutions
+    of the Thomas algorithm for all M systems at once. The cost of the Python
+    loop over the N grid cells is independent of M, so that many profiles
+    are solved for about the cost of one. Returns q, of shape (M, N).
     
-    return A
+    --Args--
+    factors : tuple returned by TridiagonalFactor().
+    d       : NumPy array of shape (M, N), right-hand sides (or (N,), if
+              shared).
+    """
+    lower, w, c = factors
+    d = np.moveaxis(np.asarray(d, dtype=float), -1, 0)
+    N = w.shape[0]
+    q = np.zeros(np.broadcast(d, w).shape)
+    q[0] = d[0]*w[0]
+    for i in xrange(1, N):
+        q[i] = (d[i] - lower[i]*q[i-1])*w[i]
+    for i in xrange(N-2, -1, -1):
+        q[i] -= c[i]*q[i+1]
+    return np.moveaxis(q, 0, -1)
 
 
-def SolveDiffusionEquation(q_old, S_old, S_new, k, dt, L=1.0, theta=1.0):
+@prof.Timed('diffusion_scheme.SolveDiffusionEquation')
+def SolveDiffusionEquation(q_old, S_old, S_new, k, dt, L=1.0, theta=1.0,
+    banded=True):
     """Solves the diffusion equation with spatially-variable diffusivity and
     variable source term:
     
@@ -65,6 +233,15 @@ def SolveDiffusionEquation(q_old, S_old, S_new, k, dt, L=1.0, theta=1.0):
     and q is given at q_j=q(x_j) where x_j = h/2 + j*h. Neumann boundary
     conditions are assumed. Returns the profile of q at the next time level.
     
+    Many independent profiles (e.g. the members of an ensemble) may be
+    advanced at once by passing q_old as an array of shape (M, N), one
+    profile per row, with S_old and S_new of shape (M, N) or (N,) (if
+    shared). If they share the diffusivity, all are solved with a single
+    banded factorisation; otherwise k is an array of shape (M, N+1) and the
+    systems are solved together by the batched Thomas algorithm (see
+    TridiagonalSolve()). Either way, the cost of the Python calls does not
+    grow with M.
+    
     See http://www.csc.kth.se/utbildning/kth/kurser/DN2255/ndiff13/Lecture3.pdf
     for details of how this scheme is derived, or the repository documentation
     for a brief summary.
@@ -73,23 +250,192 @@ def SolveDiffusionEquation(q_old, S_old, S_new, k, dt, L=1.0, theta=1.0):
     q_old   : NumPy array of length N, q at the current time level.
     S_old   : NumPy array of length N, S(x) at the current time step.
     S_new   : NumPy array of length N, S(x) at the next time step.
-    k       : function of x, which should return the diffusivity at x.
+    k       : function of x, which should return the diffusivity at x, or
+              array of diffusivities on the N+1 cell faces (or of shape
+              (M, N+1), for each profile).
     dt      : float, time step.
     (L)     : float, upper limit of spatial domain (i.e. 0 < x < L), default
               L=1.0.
     (theta) : float, between 0 and 1, specifies which scheme is used (0 is
               forward-Euler, 0.5 is Crank-Nicholson, 1 is backward-Euler).
               Default theta=1.
+    (banded): bool, whether to store the diffusion operator as its three
+              diagonals and solve the (tridiagonal) implicit system in O(N)
+              operations and memory (default). Otherwise the dense matrix
+              inverse is used (which requires a shared diffusivity).
     """
     
-    N = len(q_old)
+    q_old = np.asarray(q_old, dtype=float)
+    N = q_old.shape[-1]
+    
+    if banded:
+        lower, diag, upper = SchemeDiagonals(N, k, L)
+        M2 = q_old + (1-theta)*dt*TridiagonalDot(lower, diag, upper, q_old) + \
+            dt*(theta*S_new + (1-theta)*S_old)
+        if diag.ndim > 1:
+            return TridiagonalSolve(TridiagonalFactor(-theta*dt*lower,
+                1.0 - theta*dt*diag, -theta*dt*upper), M2)
+        M1 = BandedMatrix(lower, diag, upper, -theta*dt, 1.0)
+        # Profiles are the columns of the right-hand side of solve_banded():
+        return linalg.solve_banded((1, 1), M1, M2.T).T
     
     A = SchemeMatrix(N, k, L)
     
     M1 = np.linalg.inv( np.eye(N) - theta*dt*A )
-    M2 = np.dot(np.eye(N) + (1-theta)*dt*A, q_old) + \
+    M2 = np.dot(q_old, (np.eye(N) + (1-theta)*dt*A).T) + \
         dt*(theta*S_new + (1-theta)*S_old)
     
-    q_new = np.dot(M1, M2) 
+    q_new = np.dot(M2, M1.T) 
     
     return q_new
+
+
+class DiffusionIntegrator(object):
+    """Integrates the diffusion equation (see SolveDiffusionEquation()), with
+    an optional linear decay term:
+    
+       dq/dt - d/dx[k(x)dq/dx] + lambda*q = S(x,t)
+    
+    over many time steps. The decay term (lambda >= 0) is included in the
+    implicit operator (A -> A - lambda*I). Since the diffusivity k, time step
+    dt and scheme (theta) are normally fixed, the implicit operator
+    (I - theta*dt*A) is factorised (sparse LU decomposition) and the explicit
+    operator (I + (1-theta)*dt*A) is stored once, so that each step costs one
+    sparse matrix-vector product and one pair of triangular solves. The
+    factorisation is only recomputed if dt or k is changed with Update().
+    
+    Many independent profiles may be integrated at once, as the rows of an
+    array of shape (M, N) (see SolveDiffusionEquation()). If they share k
+    and lambda, each step solves for all of them with the single sparse LU
+    factorisation. If k has shape (M, N+1) or decay has shape (M,), giving
+    each profile its own operator, the operators are instead factorised
+    together by the batched Thomas algorithm (see TridiagonalFactor()).
+    
+    --Args--
+    N       : integer; number of grid cells.
+    k       : function of x, which should return the diffusivity at x, or
+              array of diffusivities on the N+1 cell faces (or of shape
+              (M, N+1), for each of M profiles).
+    dt      : float, time step.
+    (L)     : float, upper limit of spatial domain (i.e. 0 < x < L), default
+              L=1.0.
+    (theta) : float, between 0 and 1, specifies which scheme is used (0 is
+              forward-Euler, 0.5 is Crank-Nicholson, 1 is backward-Euler).
+              Default theta=1.
+    (decay) : float, decay rate lambda (default 0, pure diffusion), or
+              array of shape (M,), for each of M profiles.
+    """
+    
+    @prof.Timed('diffusion_scheme.DiffusionIntegrator.__init__')
+    def __init__(self, N, k, dt, L=1.0, theta=1.0, decay=0.0):
+        self.N = N
+        self.L = L
+        self.theta = theta
+        self.decay = decay
+        self.k = k
+        self.dt = dt
+        self.x = (L/N)*(0.5 + np.arange(N))
+        self._Factorise()
+    
+    @prof.Timed('diffusion_scheme.DiffusionIntegrator._Factorise')
+    def _Factorise(self):
+        """Calculate and store the explicit operator and the factorised
+        implicit operator for the current k and dt."""
+        self._batched = np.ndim(self.k) > 1 or np.ndim(self.decay) > 0
+        if self._batched:
+            lower, diag, upper = SchemeDiagonals(self.N, self.k, self.L)
+            diag = diag - np.asarray(self.decay, dtype=float)[...,np.newaxis]
+            self._diagonals = (lower, diag, upper)
+            self._factors = TridiagonalFactor(-self.theta*self.dt*lower,
+                1.0 - self.theta*self.dt*diag, -self.theta*self.dt*upper)
+            return
+        I = sparse.identity(self.N, format='csr')
+        A = SchemeMatrix(self.N, self.k, self.L, form='sparse') - self.decay*I
+        self._explicit = I + (1-self.theta)*self.dt*A
+        self._implicit = splinalg.splu( (I - self.theta*self.dt*A).tocsc() )
+    
+    @prof.Timed('diffusion_scheme.DiffusionIntegrator.Update')
+    def Update(self, dt=None, k=None):
+        """Change the time step and/or diffusivity, re-factorising the
+        implicit operator only if either has changed.
+        
+        --Args--
+        (dt) : float, new time step.
+        (k)  : function or array, new diffusivity (see DiffusionIntegrator).
+        """
+        changed = False
+        if dt is not None and dt != self.dt:
+            self.dt = dt
+            changed = True
+        if k is not None and k is not self.k:
+            self.k = k
+            changed = True
+        if changed:
+            self._Factorise()
+    
+    @prof.Timed('diffusion_scheme.DiffusionIntegrator.Step')
+    def Step(self, q_old, S_old, S_new):
+        """Advance q by one time step, returning q at the next time level.
+        For M profiles, each of the arguments may have shape (M, N).
+        
+        --Args--
+        q_old : NumPy array of length N, q at the current time level.
+        S_old : NumPy array of length N, S(x) at the current time step.
+        S_new : NumPy array of length N, S(x) at the next time step.
+        """
+        q_old = np.asarray(q_old, dtype=float)
+        S = self.dt*(self.theta*S_new + (1-self.theta)*S_old)
+        if self._batched:
+            M2 = q_old + (1-self.theta)*self.dt*TridiagonalDot(
+                *(self._diagonals + (q_old,))) + S
+            return TridiagonalSolve(self._factors, M2)
+        if q_old.ndim == 1 and np.ndim(S) == 1:
+            return self._implicit.solve(self._explicit.dot(q_old) + S)
+        # Profiles are the columns of the right-hand side:
+        M2 = self._explicit.dot(q_old.T).T + S
+        return self._implicit.solve(np.ascontiguousarray(M2.T)).T
+    
+    @prof.Timed('diffusion_scheme.DiffusionIntegrator.Run')
+    def Run(self, q_init, S, n_steps, t_init=0.0, callback=None,
+        output_every=1):
+        """Advance q through n_steps time steps. Returns (t, q, q_final) where
+        t is a NumPy array of the output times and q an array of shape
+        (len(t), N) of the profiles at those times (every output_every steps,
+        including the initial state), and q_final is the last profile. For M
+        profiles, q_init has shape (M, N) (so q has shape (len(t), M, N)) and
+        the source terms have shape (M, N) or (N,).
+        
+        --Args--
+        q_init         : NumPy array of length N, initial profile of q.
+        S              : NumPy array of length N, source term (constant in
+                         time), or function S(t, q) returning the source term
+                         at time t given the current profile q.
+        n_steps        : int, number of time steps to take.
+        (t_init)       : float, initial time.
+        (callback)     : function callback(t, q) called after every step; if
+                         it returns True, integration stops early.
+        (output_every) : int, steps between stored outputs (0 stores none, so
+                         that only q_final is kept).
+        """
+        source = S if callable(S) else (lambda t, q: S)
+        
+        t = t_init
+        q = np.array(q_init, dtype=float)
+        S_old = source(t, q)
+        t_out = [t]; q_out = [q]
+        
+        for j in xrange(1, n_steps+1):
+            S_new = source(t + self.dt, q)
+            q = self.Step(q, S_old, S_new)
+            t = t_init + j*self.dt
+            S_old = S_new
+            
+            stop = callback is not None and callback(t, q)
+            if output_every > 0 and (j % output_every == 0 or stop):
+                t_out.append(t); q_out.append(q)
+            if stop:
+                break
+        
+        if output_every == 0:
+            t_out = []; q_out = []
+        return np.array(t_out), np.array(q_out), q
@@ -0,0 +1,373 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Monte Carlo ensembles of the analytic solution with uncertain parameters
+### (A, B, D, ai, af, S2 and Q). Members are evaluated in batches: the terms
+### H_n(x_i) are linear in ai, af, ai*S2 and af*S2, so they are calculated
+### once for unit values of these and each member's Q(x_i) and T_n are
+### obtained by rescaling. Summary statistics are accumulated in histograms
+### batch by batch, so that individual members are not kept in memory.
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import collections
+import numpy as np
+import parameters as pm, analytics as an, spectral
+
+
+# Model parameters which may be sampled in an ensemble:
+sampled_parameters = ('A', 'B', 'D', 'ai', 'af', 'S2', 'Q')
+
+
+def SampleBatches(distributions, n_members, method='uniform', batch_size=10000,
+    seed=None):
+    """Generate random samples of the parameters in batches. Each batch is a
+    dictionary of NumPy arrays (one per parameter) of length batch_size (the
+    last may be shorter).
+    
+    For method='uniform' and method='lhs' (Latin hypercube: each parameter's
+    range is divided into n_members equal strata, each of which is sampled
+    exactly once, in a random order independent of the other parameters) the
+    parameters are uniformly distributed between a and b. For
+    method='normal' they are normally distributed with mean a and standard
+    deviation b.
+    
+    --Args--
+    distributions : list of (name, a, b) for each sampled parameter.
+    n_members     : int, total number of samples.
+    (method)      : str, 'uniform' (default), 'normal' or 'lhs'.
+    (batch_size)  : int, number of samples per batch.
+    (seed)        : int, seed of the random number generator.
+    """
+    if method not in ('uniform', 'normal', 'lhs'):
+        raise ValueError("Sampling method must be 'uniform', 'normal' or "
+            "'lhs'")
+    rng = np.random.RandomState(seed)
+    if method == 'lhs':
+        strata = [rng.permutation(n_members) for d in distributions]
+    
+    for j in xrange(0, n_members, batch_size):
+        m = min(batch_size, n_members-j)
+        batch = {}
+        for k, (name, a, b) in enumerate(distributions):
+            if method == 'normal':
+                batch[name] = a + b*rng.standard_normal(m)
+            elif method == 'lhs':
+                u = (strata[k][j:j+m] + rng.random_sample(m)) / n_members
+                batch[name] = a + (b-a)*u
+            else:
+                batch[name] = rng.uniform(a, b, m)
+        yield batch
+
+
+class StreamingHistogram(object):
+    """Histogram(s) of a quantity accumulated over batches of samples, from
+    which quantiles, the mean and the variance are estimated without storing
+    the samples. The quantity may be a scalar or an array of a fixed shape
+    (e.g. a profile on a grid of x), in which case there is one histogram per
+    element. Values outside the range of the bins are counted (and are placed
+    at the nearest edge when estimating quantiles); NaN values are ignored.
+    
+    --Args--
+    edges   : NumPy array, edges of the bins (increasing).
+    (shape) : tuple, shape of one sample of the quantity (default scalar).
+    """
+    
+    def __init__(self, edges, shape=()):
+        self.edges = np.asarray(edges, dtype=float)
+        self.shape = tuple(shape)
+        n_bins = len(self.edges) - 1
+        # counts[...,0] and counts[...,-1] are below and above the range:
+        self.counts = np.zeros(self.shape + (n_bins+2,), dtype=np.int64)
+        self.n = np.zeros(self.shape, dtype=np.int64)
+        self.n_nan = np.zeros(self.shape, dtype=np.int64)
+        self.mean = np.zeros(self.shape)
+        self._M2 = np.zeros(self.shape)
+        self.min = np.inf*np.ones(self.shape)
+        self.max = -np.inf*np.ones(self.shape)
+    
+    def Add(self, values):
+        """Add a batch of samples (NumPy array of shape (m,) + shape)."""
+        values = np.asarray(values, dtype=float).reshape((-1,) + self.shape)
+        valid = ~np.isnan(values)
+        n_batch = np.sum(valid, axis=0)
+        self.n_nan += len(values) - n_batch
+    
+        n_bins = len(self.edges) - 1
+        index = np.searchsorted(self.edges, values, side='right')
+        index[values == self.edges[-1]] = n_bins # include the upper edge
+        element = np.arange(int(np.prod(self.shape)))*(n_bins+2)
+        flat = (index + element.reshape(self.shape))[valid]
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(
+            self.counts.shape)
+    
+        # Combine the mean and sum of squared deviations of this batch with
+        # those of the previous batches (Chan et al. 1979):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_batch = np.nansum(values, axis=0) / n_batch
+            M2_batch = np.nansum((values - mean_batch)**2, axis=0)
+            n_total = self.n + n_batch
+            delta = np.where(n_batch > 0, mean_batch - self.mean, 0.0)
+            self.mean = np.where(n_total > 0,
+                self.mean + delta*n_batch/n_total, 0.0)
+            self._M2 = self._M2 + np.where(n_batch > 0, M2_batch, 0.0) + \
+                np.where(n_total > 0, delta**2*self.n*n_batch/n_total, 0.0)
+        self.n = n_total
+        if len(values) > 0:
+            self.min = np.fmin(self.min, np.fmin.reduce(values, axis=0))
+            self.max = np.fmax(self.max, np.fmax.reduce(values, axis=0))
+    
+    def Variance(self):
+        """Returns the sample variance."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.n > 1, self._M2/(self.n-1), np.nan)
+    
+    def Quantile(self, q):
+        """Returns the q-th quantile(s), estimated by linear interpolation
+        within the bins, as a NumPy array of shape q.shape + shape (NaN where
+        there are no samples).
+    
+        --Args--
+        q : float or NumPy array, quantile(s) between 0 and 1.
+        """
+        q = np.asarray(q, dtype=float)
+        n_bins = len(self.edges) - 1
+        lo = np.concatenate(([self.edges[0]], self.edges[:-1],
+            [self.edges[-1]]))
+        hi = np.concatenate(([self.edges[0]], self.edges[1:],
+            [self.edges[-1]]))
+        counts = self.counts.reshape(-1, n_bins+2)
+        n = self.n.ravel()
+        cumulative = np.cumsum(counts, axis=1)
+        rows = np.arange(len(counts))
+    
+        result = np.zeros((q.size, len(counts)))
+        for k, q_k in enumerate(q.flat):
+            target = q_k*n
+            j = np.minimum(np.sum(cumulative < target[:,np.newaxis], axis=1),
+                n_bins+1)
+            below = np.where(j > 0, cumulative[rows,j-1], 0)
+            count = counts[rows,j]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                fraction = np.where(count > 0,
+                    np.clip((target - below)/count, 0.0, 1.0), 0.0)
+            result[k] = lo[j] + fraction*(hi[j] - lo[j])
+        result[:,n == 0] = np.nan
+        return result.reshape(q.shape + self.shape)
+    
+    def Density(self):
+        """Returns the probability density in each bin (normalised by the
+        number of samples, including those outside the range of the bins).
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.counts[...,1:-1] / (np.diff(self.edges) *
+                self.n[...,np.newaxis])
+
+
+class EnsembleSolution(object):
+    """The analytic solution on a fixed grid of ice-edge positions xi (see
+    analytics.AnalyticSolution()), for batches of ensemble members with
+    different parameters. Since
+    
+        H_n = af*(F_n + S2*G_n) + ai*(F'_n + S2*G'_n),
+    
+    where F_n, G_n, F'_n and G'_n are H_n for unit values of (af, S2*af, ai,
+    S2*ai), these four terms are calculated once (see analytics.HnTerms(),
+    for either coalbedo) and Q(x_i) for a whole batch is one matrix product.
+    The smoothing width delta_x, T_ice_edge and nmax are not sampled and are
+    taken from params.
+    
+    --Args--
+    xi                : NumPy array, evenly-spaced grid of ice-edge positions.
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple of the values used for parameters
+                        which are not sampled (default: current values, see
+                        parameters.py).
+    """
+    
+    def __init__(self, xi, smooth_coalbedo=False, params=None):
+        self.xi = np.asarray(xi, dtype=float)
+        self.smooth_coalbedo = smooth_coalbedo
+        self.params = pm.Get(params)
+        self.n = spectral.Degrees(self.params.nmax)
+        P_n_xi = spectral.LegendreP(self.n[-1], self.xi)[...,self.n]
+        # Shape (4, len(n), len(xi)), to be contracted against the per-member
+        # weights of each term and each degree n:
+        self._G = np.swapaxes(self.HnTerms(self.xi)*P_n_xi, 1, 2)
+    
+    def HnTerms(self, xi):
+        """Returns the four terms (F_n, G_n, F'_n, G'_n) of H_n(x_i) (see
+        EnsembleSolution) as a NumPy array of shape (4,) + xi.shape +
+        (number of degrees,).
+        """
+        return an.HnTerms(xi, self.smooth_coalbedo, self.params)
+    
+    def _Values(self, batch):
+        """Returns the arrays of each sampled parameter in batch, with the
+        default (params) value for any parameter not sampled, each of shape
+        (m, 1)."""
+        m = max([len(v) for v in batch.itervalues()])
+        return dict((name, (np.asarray(batch[name], dtype=float) if name in
+            batch else getattr(self.params, name)*np.ones(m))[:,np.newaxis])
+            for name in sampled_parameters)
+    
+    def _Weights(self, v):
+        """Returns the coefficients of the four terms of H_n, shape (m, 4)."""
+        return np.concatenate((v['af'], v['af']*v['S2'], v['ai'],
+            v['ai']*v['S2']), axis=1)
+    
+    def Q(self, batch):
+        """Returns Q(x_i) [W m^-2] for each member of the batch, a NumPy
+        array of shape (m, len(xi)).
+    
+        --Args--
+        batch : dictionary of NumPy arrays of sampled parameters.
+        """
+        v = self._Values(batch)
+        Ln = self.n*(self.n+1)*v['D'] + v['B'] # shape (m, len(n))
+        W = self._Weights(v)[:,:,np.newaxis] / Ln[:,np.newaxis,:]
+        sumterm = np.dot(W.reshape(len(W), -1),
+            self._G.reshape(-1, len(self.xi)))
+        return (v['A'] + v['B']*self.params.T_ice_edge) / (v['B']*sumterm)
+    
+    def Folds(self, Q):
+        """Returns NumPy arrays (xi_min, Q_min, xi_max, Q_max) of the first
+        local minimum and the first local maximum of each row of Q (one
+        per member, see Q()), refined by fitting a parabola through the three
+        nearest points, with NaN where there is none.
+    
+        --Args--
+        Q : NumPy array of shape (m, len(xi)).
+        """
+        dQ = np.diff(Q, axis=1)
+        result = []
+        for mask in [(dQ[:,:-1] < 0) & (dQ[:,1:] >= 0),
+            (dQ[:,:-1] > 0) & (dQ[:,1:] <= 0)]:
+            found = np.any(mask, axis=1)
+            j = np.argmax(mask, axis=1) + 1
+            rows = np.arange(len(Q))
+            Q_lo, Q_0, Q_hi = Q[rows,j-1], Q[rows,j], Q[rows,j+1]
+            curvature = Q_hi - 2*Q_0 + Q_lo
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shift = np.where(curvature != 0,
+                    0.5*(Q_lo - Q_hi)/curvature, 0.0)
+            h = self.xi[1] - self.xi[0]
+            result.append(np.where(found, self.xi[j] + shift*h, np.nan))
+            result.append(np.where(found,
+                Q_0 - 0.25*(Q_lo - Q_hi)*shift, np.nan))
+        return tuple(result)
+    
+    def IceEdge(self, Q, batch):
+        """Returns the ice edge of the stable steady state of each member at
+        its value of Q (the largest x_i at which Q(x_i) crosses Q with
+        dQ/dx_i > 0, by linear interpolation). Where there is no such
+        crossing, x_i = 1 (ice free) if Q exceeds Q(x_i = 1), otherwise
+        x_i = 0 (snowball).
+    
+        --Args--
+        Q     : NumPy array of shape (m, len(xi)), see Q().
+        batch : dictionary of NumPy arrays of sampled parameters.
+        """
+        Q_member = self._Values(batch)['Q']
+        crossing = (Q[:,:-1] < Q_member) & (Q[:,1:] >= Q_member)
+        found = np.any(crossing, axis=1)
+        j = Q.shape[1] - 2 - np.argmax(crossing[:,::-1], axis=1)
+        rows = np.arange(len(Q))
+        fraction = (Q_member[:,0] - Q[rows,j]) / (Q[rows,j+1] - Q[rows,j])
+        xi = self.xi[j] + fraction*(self.xi[j+1] - self.xi[j])
+        no_ice = Q_member[:,0] > Q[:,-1]
+        return np.where(found, xi, np.where(no_ice, 1.0, 0.0))
+    
+    def TnCoefficients(self, xi, batch):
+        """Returns the coefficients T_n [degC] of the steady state of each
+        member with ice edge xi (see analytics.Tn()), a NumPy array of shape
+        (m, number of degrees).
+    
+        --Args--
+        xi    : NumPy array of length m, ice edge of each member.
+        batch : dictionary of NumPy arrays of sampled parameters.
+        """
+        v = self._Values(batch)
+        Hn = np.einsum('mk,kmn->mn', self._Weights(v), self.HnTerms(xi))
+        Ln = self.n*(self.n+1)*v['D'] + v['B']
+        return v['Q']*Hn/Ln - (self.n==0)*(v['A']/v['B'])
+
+
+# Summary statistics of an ensemble (StreamingHistogram objects) of the ice
+# edge and the fold (tipping point) positions and values, and of the profiles
+# of Q(x_i) and of the steady-state temperature T(x):
+EnsembleStatistics = collections.namedtuple('EnsembleStatistics', ['xi',
+    'xi_min', 'Q_min', 'xi_max', 'Q_max', 'Q_profile', 'T_profile'])
+
+
+def RunEnsemble(distributions, n_members, method='uniform',
+    smooth_coalbedo=False, xi=np.linspace(0.0, 1.0, 501),
+    x=np.linspace(0.0, 1.0, 101), batch_size=10000, seed=None, n_bins=200,
+    params=None):
+    """Run a Monte Carlo ensemble of the analytic solution with the
+    parameters sampled from the given distributions (see SampleBatches()),
+    returning EnsembleStatistics of:
+    
+        xi           : the ice edge of the stable steady state (see
+                       EnsembleSolution.IceEdge()),
+        xi_min/Q_min : the position and value of the first minimum of Q(x_i)
+                       (the large ice-cap instability; tipping point to the
+                       snowball state),
+        xi_max/Q_max : the position and value of the first maximum of Q(x_i)
+                       (the small ice-cap instability),
+        Q_profile    : Q(x_i) at each xi,
+        T_profile    : the temperature T(x) [degC] of the stable steady state
+                       at each x.
+    
+    Members are evaluated in batches of batch_size and discarded once added
+    to the statistics, so memory use does not grow with n_members.
+    
+    --Args--
+    distributions     : list of (name, a, b) for each sampled parameter (any
+                        of 'A', 'B', 'D', 'ai', 'af', 'S2' and 'Q').
+    n_members         : int, number of ensemble members.
+    (method)          : str, sampling method, 'uniform' (default), 'normal' or
+                        'lhs'.
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (xi)              : NumPy array, evenly-spaced grid of ice-edge positions
+                        on which Q(x_i) is evaluated (its spacing limits the
+                        accuracy of the folds and ice edge).
+    (x)               : NumPy array, grid of x for the temperature profiles.
+    (batch_size)      : int, number of members evaluated together.
+    (seed)            : int, seed of the random number generator.
+    (n_bins)          : int, number of histogram bins for each quantity.
+    (params)          : Parameters tuple of the values used for parameters
+                        which are not sampled (default: current values, see
+                        parameters.py).
+    """
+    for name, a, b in distributions:
+        if name not in sampled_parameters:
+            raise ValueError("Cannot sample parameter '%s'" % name)
+    
+    solution = EnsembleSolution(xi, smooth_coalbedo, params)
+    basis = spectral.GetSpectralBasis(solution.params.nmax, x)
+    Q0 = solution.params.Q
+    Q_edges = np.linspace(0.5*Q0, 2.0*Q0, n_bins+1)
+    statistics = EnsembleStatistics(
+        StreamingHistogram(np.linspace(0.0, 1.0, n_bins+1)),
+        StreamingHistogram(np.linspace(0.0, 1.0, n_bins+1)),
+        StreamingHistogram(Q_edges),
+        StreamingHistogram(np.linspace(0.0, 1.0, n_bins+1)),
+        StreamingHistogram(Q_edges),
+        StreamingHistogram(Q_edges, solution.xi.shape),
+        StreamingHistogram(np.linspace(-80.0, 50.0, n_bins+1), basis.x.shape))
+    
+    for batch in SampleBatches(distributions, n_members, method, batch_size,
+        seed):
+        Q = solution.Q(batch)
+        xi_edge = solution.IceEdge(Q, batch)
+        folds = solution.Folds(Q)
+        T_n = solution.TnCoefficients(xi_edge, batch)
+    
+        statistics.xi.Add(xi_edge)
+        for histogram, values in zip(statistics[1:5], folds):
+            histogram.Add(values)
+        statistics.Q_profile.Add(Q)
+        statistics.T_profile.Add(np.dot(T_n, basis.P.T))
+    
+    return statistics
@@ -5,37 +5,218 @@
 ### ---------------------------------------------------------------------------
 
 from __future__ import division
-import sys, os, numpy as np, matplotlib.pyplot as plt
+import sys, os, pickle, numpy as np
+import matplotlib as mpl, matplotlib.pyplot as plt, matplotlib.font_manager
+import concurrent.futures as futures
+import profiling as prof
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-def SaveFigures(figures, subdir, ext='.pdf'):
-    """Save several figures to plots\subdir with filenames given by their
-    canvas window titles. Makes the directory if it does not exist and warns/
-    aborts if about to over-write a file.
+# Default overwrite policy of SaveFigures(): 'ask' (prompt before over-writing
+# an existing file), 'always' or 'never'. If None, 'ask' is used unless
+# running headless (see SetHeadless()), in which case 'never' is used:
+overwrite_policy = None
+
+
+def SetHeadless():
+    """Switch MatPlotLib to the non-interactive Agg backend, so that figures
+    can be made and saved without a display (e.g. in batch jobs). Figures
+    are then not shown and SaveFigures() never prompts.
+    """
+    plt.switch_backend('Agg')
+
+
+def Headless():
+    """Returns whether MatPlotLib is using the non-interactive Agg backend.
+    """
+    return mpl.get_backend().lower() == 'agg'
+
+
+def HandleFlags(argv):
+    """Apply the command-line flags common to the scripts in bin/, removing
+    them from argv: 'headless' (see SetHeadless()) and 'overwrite' (over-write
+    existing figures without prompting).
     
     --Args--
-    figures : list of MatPlotLib figure objects.
-    subdir  : string, name of sub-directory to which figures should be saved.
-    (ext)   : string, type of file to save as its extension (default '.pdf').
+    argv : list of command-line arguments (e.g. sys.argv), modified in place.
+    """
+    global overwrite_policy
+    if 'headless' in argv:
+        argv.remove('headless')
+        SetHeadless()
+    if 'overwrite' in argv:
+        argv.remove('overwrite')
+        overwrite_policy = 'always'
+
+
+def FigureName(fig):
+    """Returns the name of a figure: its label (see plotting.py), otherwise
+    its canvas window title if it has a window, otherwise 'Figure <number>'
+    (as the default window title).
+    """
+    if fig.get_label():
+        return fig.get_label()
+    try:
+        return str(fig.canvas.manager.window.wm_title())
+    except AttributeError:
+        return 'Figure %d' % fig.number
+
+
+@prof.Timed('fileIO._SaveFigure')
+def _SaveFigure(data, filenames):
+    """Unpickle a figure (with the Agg backend) and save it to each of
+    filenames. Used by SaveFigures() in worker processes."""
+    plt.switch_backend('Agg')
+    # Fonts opened by the parent process share its file positions, so they
+    # must be reopened in this process:
+    font_cache = getattr(mpl.font_manager, '_get_font', None)
+    if hasattr(font_cache, 'cache_clear'):
+        font_cache.cache_clear()
+    fig = pickle.loads(data)
+    for filename in filenames:
+        fig.savefig(filename)
+    plt.close(fig)
+
+
+@prof.Timed('fileIO.SaveFigures')
+def SaveFigures(figures, subdir, ext='.pdf', filenames=None, overwrite=None,
+    processes=1):
+    """Save several figures to plots\subdir, in one or more formats, with
+    filenames given by their names (see FigureName()) unless given
+    explicitly. Makes the directory if it does not exist. Existing files are
+    handled according to the overwrite policy: 'ask' warns and prompts
+    before over-writing (answering Y-ALL over-writes all further files
+    without prompting), 'always' over-writes and 'never' skips them.
+    
+    Saving (rendering) figures may take a while, so it may be done in a pool
+    of processes, to which the figures are sent pickled; this requires that
+    they can be pickled (e.g. they contain no lambda functions).
+    
+    --Args--
+    figures     : list of MatPlotLib figure objects.
+    subdir      : string, name of sub-directory to which figures should be
+                  saved.
+    (ext)       : string or list of strings, type(s) of file to save as
+                  their extension (default '.pdf').
+    (filenames) : list of strings, names of the files (without extension) of
+                  each figure (default: the figure names).
+    (overwrite) : string, 'ask', 'always' or 'never' (default
+                  overwrite_policy, see above).
+    (processes) : int, number of processes in which to save the figures (if
+                  1, they are saved in this process).
     """
     dirname = os.path.join(os.path.dirname(__file__), '..', 'plots', subdir)
     if not os.path.isdir(dirname):
-        os.mkdir(dirname)
+        os.makedirs(dirname)
+    exts = [ext] if isinstance(ext, basestring) else list(ext)
+    if filenames is None:
+        filenames = [FigureName(f) for f in figures]
+    if overwrite is None:
+        overwrite = overwrite_policy
+    if overwrite is None:
+        overwrite = 'never' if Headless() else 'ask'
+    if overwrite not in ('ask', 'always', 'never'):
+        raise ValueError("Overwrite policy must be 'ask', 'always' or 'never'")
+    
+    # Decide which files to save before saving any:
     passall = False
-    for f in figures:
-        filename_to_save = str(f.canvas.manager.window.wm_title()) + ext
-        if passall:
-            f.savefig(os.path.join(dirname, filename_to_save))
-        else:
-            if os.path.isfile(os.path.join(dirname, filename_to_save)):
-                prt='About to overwrite \"%s\"! Continue? [Y / Y-ALL / N] > '%(
-                    filename_to_save)
-                check = raw_input(prt)
-                if not (check == 'Y' or check == 'Y-ALL'):
-                    pass
-                else:
-                    f.savefig(os.path.join(dirname, filename_to_save))
-                passall = check=='Y-ALL'
-            else:
-                f.savefig(os.path.join(dirname, filename_to_save))
-    pass
+    to_save = []
+    for f, filename in zip(figures, filenames):
+        paths = []
+        for e in exts:
+            filename_to_save = filename + e
+            path = os.path.join(dirname, filename_to_save)
+            if os.path.isfile(path) and not passall:
+                if overwrite == 'never':
+                    print 'Not overwriting \"%s\"' % filename_to_save
+                    continue
+                elif overwrite == 'ask':
+                    prt = ('About to overwrite \"%s\"! Continue? '
+                        '[Y / Y-ALL / N] > ' % filename_to_save)
+                    check = raw_input(prt)
+                    passall = check=='Y-ALL'
+                    if not (check == 'Y' or check == 'Y-ALL'):
+                        continue
+            paths.append(path)
+        if len(paths) > 0:
+            to_save.append((f, paths))
+    
+    prof.Count('fileIO.files_saved', sum(len(p) for f, p in to_save))
+    if processes == 1:
+        for f, paths in to_save:
+            for path in paths:
+                f.savefig(path)
+    else:
+        with futures.ProcessPoolExecutor(processes) as executor:
+            jobs = [executor.submit(_SaveFigure, pickle.dumps(f, 2), paths)
+                for f, paths in to_save]
+            for job in jobs:
+                job.result()
+
+
+# Parsed heat transport observations, keyed by (source, component,
+# hemisphere) (see LoadHeatTransport()):
+_heat_transport_cache = {}
+
+
+@prof.Timed('fileIO._ReadHeatTransportFile')
+def _ReadHeatTransportFile(component, source):
+    """Returns NumPy arrays (latitude [deg], heat transport [W]) read from
+    data/<component>_<source>.txt, in order of increasing latitude."""
+    filename = os.path.join(os.path.dirname(__file__), '..', 'data',
+        '%s_%s.txt' % (component, source))
+    data = np.loadtxt(filename)
+    order = np.argsort(data[:,0])
+    return data[order,0], 1E15*data[order,1]
+
+
+@prof.Timed('fileIO.LoadHeatTransport')
+def LoadHeatTransport(source='MEAN', component='total', hemisphere='north'):
+    """Load the observed northward heat transport in the data directory and
+    return NumPy arrays (x, HT) of x = sin(latitude) (increasing, 0 < x < 1)
+    and poleward heat transport [W], for comparison with the model (see
+    analytics.HeatTransport()). The files give latitude [deg] and heat
+    transport [PW]. Results are parsed once and cached (the returned arrays
+    are read-only).
+    
+    --Args--
+    (source)     : str, 'MEAN' (default), 'NCEP' or 'ECMWF'.
+    (component)  : str, 'AT' (atmosphere), 'OC' (ocean) or 'total' (default;
+                   the sum, with the ocean transport interpolated onto the
+                   atmosphere latitudes and tapered to zero at the poles).
+    (hemisphere) : str, 'north' (default), 'south' (sign reversed so that it
+                   is poleward) or 'mean' (of the two, with the southern
+                   values interpolated onto the northern latitudes).
+    """
+    key = (source, component, hemisphere)
+    if key in _heat_transport_cache:
+        return _heat_transport_cache[key]
+    
+    if component == 'total':
+        lat, HT = _ReadHeatTransportFile('AT', source)
+        lat_OC, HT_OC = _ReadHeatTransportFile('OC', source)
+        HT = HT + np.interp(lat, np.concatenate(([-90.0], lat_OC, [90.0])),
+            np.concatenate(([0.0], HT_OC, [0.0])))
+    elif component in ('AT', 'OC'):
+        lat, HT = _ReadHeatTransportFile(component, source)
+    else:
+        raise ValueError("Heat transport component must be 'AT', 'OC' or "
+            "'total'")
+    
+    x = np.sin(np.radians(lat))
+    north = x > 0
+    x_north, HT_north = x[north], HT[north]
+    x_south, HT_south = -x[~north][::-1], -HT[~north][::-1]
+    if hemisphere == 'north':
+        x, HT = x_north, HT_north
+    elif hemisphere == 'south':
+        x, HT = x_south, HT_south
+    elif hemisphere == 'mean':
+        x, HT = x_north, 0.5*(HT_north + np.interp(x_north, x_south,
+            HT_south))
+    else:
+        raise ValueError("Hemisphere must be 'north', 'south' or 'mean'")
+    
+    x.flags.writeable = False
+    HT.flags.writeable = False
+    _heat_transport_cache[key] = (x, HT)
+    return x, HT
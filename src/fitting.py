@@ -0,0 +1,165 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tuning of the model parameters (D, and optionally A, B and the ice edge
+### x_i) by least-squares fitting of the analytic heat transport to
+### observations (see fileIO.LoadHeatTransport()).
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import collections, warnings
+import parameters as pm, analytics as an
+import numpy as np
+import scipy.optimize as optimize
+
+
+# Parameters which may be fitted, and bounds on their values:
+fit_parameters = ('D', 'A', 'B', 'xi')
+_bounds = {'D': (0.0, np.inf), 'A': (-np.inf, np.inf), 'B': (0.0, np.inf),
+    'xi': (0.0, 1.0)}
+
+# The fitted parameters are taken to be unidentifiable (and a warning given)
+# if some relative change in them, dp/p, changes the heat transport by less
+# than this fraction of dp/p times the observed heat transport (e.g. where D
+# is so large that the temperature is almost uniform and the heat transport
+# no longer depends on D):
+_min_sensitivity = 1E-3
+
+# Result of a fit: the Parameters tuple with the fitted values, the ice edge
+# and Q of the fitted solution, the root-mean-square error of the heat
+# transport [W] and whether the optimizer converged:
+Fit = collections.namedtuple('Fit', ['params', 'xi', 'Q', 'rms', 'success'])
+
+
+def HeatTransportJacobian(x, xi, Q=None, smooth_coalbedo=False,
+    steady_state=False, params=None):
+    """Returns the heat transport HT(x) [W] (see analytics.HeatTransport())
+    and its derivatives with respect to D, A, B and x_i, calculated
+    exactly (see analytics.AnalyticSolution.HeatTransportDerivatives()) from
+    the spectral form
+    
+        HT = -2 pi RE^2 (1-x^2) D Q sum_n H_n(x_i) P_n'(x) / L_n,
+    
+    with L_n = n(n+1)D + B. For fixed Q, HT does not depend on A. If
+    steady_state is True, Q is instead the value for which x_i is a steady
+    state (see analytics.Q()), which depends on all of the parameters. Returns
+    (HT, J) where J is a dictionary of NumPy arrays dHT/dp (the same shape
+    as x) for p in fit_parameters.
+    
+    --Args--
+    x                 : NumPy array, sine of latitude.
+    xi                : float, sine of ice-edge latitude.
+    (Q)               : float, solar constant divided by 4 [W m^-2] (default
+                        params.Q).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (steady_state)    : bool, whether to use Q(x_i) in place of Q.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    solution = an.AnalyticSolution(xi, smooth_coalbedo, params)
+    if steady_state:
+        Q, dQ = solution.QDerivatives()
+    HT, dHT = solution.HeatTransportDerivatives(x, Q)
+    J = dict((k, dHT[k]) for k in fit_parameters)
+    if steady_state:
+        # Chain rule through Q(x_i; D, A, B):
+        for k in fit_parameters:
+            J[k] = J[k] + dHT['Q']*dQ[k]
+    return HT, J
+
+
+def FitHeatTransport(x, HT, fit=('D',), xi=0.95, Q=None,
+    smooth_coalbedo=False, steady_state=True, weights=None, params=None,
+    **kwargs):
+    """Fit the parameters named in fit (any of 'D', 'A', 'B' and 'xi') so
+    that the analytic heat transport best matches HT in the (weighted)
+    least-squares sense, using the analytic Jacobian (see
+    HeatTransportJacobian()) with scipy.optimize.least_squares() (further
+    keyword arguments are passed to it). Returns a Fit tuple.
+    
+    By default (steady_state=True), Q is not fixed but is the value for
+    which the ice edge is a steady state (as in bin/heattransports.py), so
+    that the fitted solution is an equilibrium. Otherwise Q is held fixed,
+    and the heat transport does not depend on A, which cannot then be
+    fitted. The model transports heat by diffusion in the atmosphere only,
+    so it should be fitted to the atmospheric heat transport (component
+    'AT' in fileIO.LoadHeatTransport()); the total transport is larger than
+    any D can give, and D then grows without bound.
+    
+    A RuntimeWarning is given if a fitted parameter ends at one of its
+    bounds, or if the Jacobian shows that the heat transport is (almost)
+    insensitive to the fitted parameters, which cannot then be identified.
+    
+    --Args--
+    x                 : NumPy array, sine of latitude of the observations
+                        (see fileIO.LoadHeatTransport()).
+    HT                : NumPy array, observed poleward heat transport [W].
+    (fit)             : sequence of names of the parameters to fit.
+    (xi)              : float, sine of ice-edge latitude (the initial guess,
+                        if it is fitted).
+    (Q)               : float, solar constant divided by 4 [W m^-2], if
+                        steady_state is False (default params.Q).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (steady_state)    : bool, whether to use Q(x_i) in place of Q (default
+                        True).
+    (weights)         : NumPy array, weight of each observation (default
+                        uniform).
+    (params)          : Parameters tuple of the initial guess and the values
+                        of parameters which are not fitted (default: current
+                        values, see parameters.py).
+    """
+    for name in fit:
+        if name not in fit_parameters:
+            raise ValueError("Cannot fit parameter '%s'" % name)
+    if 'A' in fit and not steady_state:
+        raise ValueError("A can only be fitted with steady_state=True")
+    params = pm.Get(params)
+    x = np.asarray(x, dtype=float)
+    weights = np.ones(len(x)) if weights is None else np.asarray(weights)
+    scale = 1E-15 # work in PW
+    
+    def Unpack(v):
+        values = dict(zip(fit, v))
+        xi_v = values.pop('xi', xi)
+        return params._replace(**values), xi_v
+    
+    def Residual(v):
+        p, xi_v = Unpack(v)
+        HT_model = HeatTransportJacobian(x, xi_v, Q, smooth_coalbedo,
+            steady_state, p)[0]
+        return scale*weights*(HT_model - HT)
+    
+    def Jacobian(v):
+        p, xi_v = Unpack(v)
+        J = HeatTransportJacobian(x, xi_v, Q, smooth_coalbedo, steady_state,
+            p)[1]
+        return np.stack([scale*weights*J[name] for name in fit], axis=-1)
+    
+    v0 = [xi if name == 'xi' else getattr(params, name) for name in fit]
+    bounds = ([_bounds[name][0] for name in fit],
+        [_bounds[name][1] for name in fit])
+    result = optimize.least_squares(Residual, v0, jac=Jacobian,
+        bounds=bounds, x_scale='jac', **kwargs)
+    
+    for name, active in zip(fit, result.active_mask):
+        if active:
+            warnings.warn("Fitted %s is at its %s bound" % (name,
+                'lower' if active < 0 else 'upper'), RuntimeWarning)
+    
+    # Sensitivity of the heat transport to relative changes of the fitted
+    # parameters (the smallest singular value of the scaled Jacobian):
+    J = result.jac*np.where(result.x == 0.0, 1.0, abs(result.x))
+    sensitivity = np.linalg.svd(J, compute_uv=False)[-1]
+    if sensitivity < _min_sensitivity*np.linalg.norm(scale*weights*HT):
+        warnings.warn("The heat transport is insensitive to %s at the fit "
+            "(%s), which cannot be identified" % (', '.join(fit),
+            ', '.join('%s = %g' % (name, v) for name, v in zip(fit,
+            result.x))), RuntimeWarning)
+    
+    p, xi_fit = Unpack(result.x)
+    if steady_state:
+        Q_fit = float(an.Q(xi_fit, None, smooth_coalbedo, p))
+    else:
+        Q_fit = p.Q if Q is None else Q
+    rms = np.sqrt(np.mean((result.fun/(scale*weights))**2))
+    return Fit(p, xi_fit, Q_fit, rms, result.success)
@@ -0,0 +1,277 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Precomputed lookup tables of the steady-state solution branch Q(x_i) of
+### the analytic EBM, for fast evaluation of Q(x_i), the inverse x_i(Q) on
+### every section of the branch, and stability. Tables are saved in the store
+### (see store.py) and regenerated automatically when the parameters change.
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import numpy as np
+import scipy.optimize as optimize
+import parameters as pm, analytics as an, continuation as ct, cache
+import store as st
+
+# Tables already loaded or built in this process, keyed by store.Key():
+table_cache = cache.Cache(pm.Q_table_cache_size)
+
+# The parameters on which Q(x_i) depends (it does not depend on Q itself, C
+# or RE):
+_table_parameters = ('A', 'B', 'ai', 'af', 'delta_x', 'S2', 'D',
+    'T_ice_edge', 'nmax', 'nmax_Q_tol', 'nmax_T_tol', 'nmax_limit', 'Hn_tol')
+
+
+class QTable(object):
+    """A lookup table of the solution branch Q(x_i) for one set of parameters
+    (see BuildQTable() and GetQTable()). The branch is divided at its folds
+    (saddle-node bifurcations, see continuation.FindFolds()) into sections
+    on which Q(x_i) is monotonic, each of which is stable (dQ/dx_i > 0) or
+    unstable. Q and its exact derivative dQ/dx_i are tabulated on a grid of
+    knots in x_i which includes the folds, and interpolated by cubic Hermite
+    polynomials (whose coefficients are calculated on construction), so that
+    every query is a binary search and a few arithmetic operations on NumPy
+    arrays.
+    
+    --Args--
+    xi     : NumPy array, increasing knots in x_i (from 0 to 1).
+    Q      : NumPy array, Q(x_i) at the knots [W m^-2].
+    dQ     : NumPy array, dQ/dx_i at the knots [W m^-2].
+    edges  : NumPy array of int, indices of the knots at the ends of each
+             section of the branch (0, the folds and len(xi)-1).
+    stable : NumPy array of bool, whether the steady states on each section
+             are stable.
+    """
+    
+    def __init__(self, xi, Q, dQ, edges, stable):
+        self.xi = np.asarray(xi, dtype=float)
+        self.Q_knots = np.asarray(Q, dtype=float)
+        self.dQ_knots = np.asarray(dQ, dtype=float)
+        self.edges = np.asarray(edges, dtype=int)
+        self.stable = np.asarray(stable, dtype=bool)
+        for a in [self.xi, self.Q_knots, self.dQ_knots, self.edges,
+            self.stable]:
+            a.flags.writeable = False
+        self.folds = [ct.Fold(self.xi[k], self.Q_knots[k],
+            'maximum' if self.stable[j] else 'minimum')
+            for j, k in enumerate(self.edges[1:-1])]
+        
+        # Coefficients of Q = c0 + c1*t + c2*t^2 + c3*t^3 on each interval,
+        # where t = (x_i - xi[j])/h[j]:
+        self._h = np.diff(self.xi)
+        Q0 = self.Q_knots[:-1]; Q1 = self.Q_knots[1:]
+        m0 = self._h*self.dQ_knots[:-1]; m1 = self._h*self.dQ_knots[1:]
+        self._c = np.stack((Q0, m0, 3*(Q1-Q0) - 2*m0 - m1,
+            2*(Q0-Q1) + m0 + m1))
+    
+    def _Cubic(self, j, t):
+        """Returns Q and dQ/dt on the intervals j at t (see __init__())."""
+        c0, c1, c2, c3 = self._c[:,j]
+        return c0 + t*(c1 + t*(c2 + t*c3)), c1 + t*(2*c2 + 3*t*c3)
+    
+    def _Interval(self, xi):
+        """Returns the index of the interval between knots containing xi."""
+        j = np.searchsorted(self.xi, xi, side='right') - 1
+        return np.clip(j, 0, len(self.xi)-2)
+    
+    def Q(self, xi):
+        """Returns Q(x_i) [W m^-2] (xi a float or NumPy array in [0, 1])."""
+        xi = np.asarray(xi, dtype=float)
+        j = self._Interval(xi)
+        return self._Cubic(j, (xi - self.xi[j])/self._h[j])[0]
+    
+    def dQdxi(self, xi):
+        """Returns dQ/dx_i [W m^-2] (xi a float or NumPy array in [0, 1])."""
+        xi = np.asarray(xi, dtype=float)
+        j = self._Interval(xi)
+        return self._Cubic(j, (xi - self.xi[j])/self._h[j])[1]/self._h[j]
+    
+    def Stable(self, xi):
+        """Returns whether the steady state at each ice edge xi is stable
+        (i.e. the section of the branch containing xi is stable)."""
+        section = np.searchsorted(self.xi[self.edges[1:-1]], xi)
+        return self.stable[section]
+    
+    def IceEdges(self, Q, tol=1E-12, max_iterations=50):
+        """Returns (xi, stable): the ice edges x_i of the steady states for
+        each value of Q, as a NumPy array of shape Q.shape + (number of
+        sections of the branch,) which is NaN where Q is outside the range of
+        a section, and whether the steady states on each section are stable.
+        In each section, the interval between knots containing Q is found by
+        binary search and the Hermite polynomial inverted by Newton's method,
+        safeguarded by bisection.
+    
+        --Args--
+        Q                : float or NumPy array, solar constant divided by 4
+                           [W m^-2].
+        (tol)            : float, tolerance on x_i relative to the spacing
+                           of the knots (or Q to within rounding error).
+        (max_iterations) : int, maximum number of Newton iterations.
+        """
+        Q = np.asarray(Q, dtype=float)
+        q = Q.ravel()
+        xi = np.nan*np.zeros((len(q), len(self.stable)))
+        for b in xrange(len(self.stable)):
+            k0, k1 = self.edges[b], self.edges[b+1]
+            sign = 1.0 if self.stable[b] else -1.0
+            Q_b = sign*self.Q_knots[k0:k1+1]
+            inside = np.nonzero((sign*q >= Q_b[0]) & (sign*q <= Q_b[-1]))[0]
+            if len(inside) == 0:
+                continue
+            target = q[inside]
+            j = k0 + np.clip(np.searchsorted(Q_b, sign*target) - 1, 0,
+                k1-k0-1)
+    
+            # Newton's method in t = (x - xi[j])/h, keeping a bracket [lo, hi]
+            # in which sign*(Q - target) changes sign:
+            lo = np.zeros(len(j)); hi = np.ones(len(j))
+            eps = np.finfo(float).eps
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.clip((target - self.Q_knots[j])/(self.Q_knots[j+1]
+                    - self.Q_knots[j]), 0.0, 1.0)
+                t[~np.isfinite(t)] = 0.5
+                for k in xrange(max_iterations):
+                    value, slope = self._Cubic(j, t)
+                    f = sign*(value - target)
+                    hi = np.where(f > 0, t, hi)
+                    lo = np.where(f > 0, lo, t)
+                    t_new = t - (value - target)/slope
+                    bisect = ~((t_new >= lo) & (t_new <= hi))
+                    t_new[bisect] = 0.5*(lo + hi)[bisect]
+                    # Converged when the step is below tol or Q is within
+                    # rounding error of the target:
+                    converged = np.all((np.abs(t_new - t) < tol) | (
+                        np.abs(value - target) <= 8*eps*np.abs(target)))
+                    t = t_new
+                    if converged:
+                        break
+            xi[inside,b] = self.xi[j] + self._h[j]*t
+        return xi.reshape(Q.shape + (len(self.stable),)), self.stable
+
+
+def _Knots(xi_folds, n_xi):
+    """Returns (xi, edges): knots in x_i from 0 to 1 which include xi_folds,
+    each section between them having a number of evenly-spaced knots in
+    proportion to its width (n_xi in total), and the indices of the knots at
+    the ends of the sections."""
+    xi_edges = [0.0] + list(xi_folds) + [1.0]
+    xi = [np.array([0.0])]
+    edges = [0]
+    for j in xrange(len(xi_edges)-1):
+        n = max(int(np.ceil((n_xi-1)*(xi_edges[j+1]-xi_edges[j]))), 1)
+        xi.append(np.linspace(xi_edges[j], xi_edges[j+1], n+1)[1:])
+        edges.append(edges[-1] + n)
+    return np.concatenate(xi), edges
+
+
+def BuildQTable(smooth_coalbedo=False, n_xi=None, tol=1E-10, params=None):
+    """Build the lookup table of Q(x_i) (see QTable). The folds are located
+    with continuation.FindFolds() and each section of the branch between
+    them is given a number of evenly-spaced knots in proportion to its width,
+    n_xi in total, at which Q and dQ/dx_i are evaluated exactly in one pass
+    (see analytics.AnalyticSolution.QDerivatives()).
+    
+    The sign of dQ/dx_i is then checked at every knot: if it changes within
+    a section (a fold which FindFolds() missed, e.g. one of a close pair
+    near a cusp), the fold is located between the knots by Brent's method,
+    the section is split there and the knots are recomputed, so that Q is
+    monotonic between the knots of each section.
+    
+    --Args--
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (n_xi)            : int, approximate number of knots (default
+                        parameters.Q_table_n_xi).
+    (tol)             : float, tolerance on x_i of any folds missed by
+                        FindFolds().
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    params = pm.Get(params)
+    n_xi = pm.Q_table_n_xi if n_xi is None else n_xi
+    xi_folds = [f.xi for f in ct.FindFolds(None, smooth_coalbedo, tol,
+        params=params)[0]]
+    
+    while True:
+        xi, edges = _Knots(xi_folds, n_xi)
+        Q, dQ = an.QDerivatives(xi, None, smooth_coalbedo, params)
+        dQ = dQ['xi']
+        dQ[edges[1:-1]] = 0.0 # exactly zero at the folds
+        missed = np.nonzero(dQ[1:]*dQ[:-1] < 0)[0]
+        if len(missed) == 0:
+            break
+        xi_folds = sorted(xi_folds + [optimize.brentq(ct.dQdxi, xi[j],
+            xi[j+1], args=(None, smooth_coalbedo, params), xtol=tol)
+            for j in missed])
+    
+    stable = [np.sum(dQ[edges[j]:edges[j+1]+1]) > 0
+        for j in xrange(len(edges)-1)]
+    return QTable(xi, Q, dQ, edges, stable)
+
+
+def _BuildQTableArrays(smooth_coalbedo, n_xi, table_params):
+    """Returns the arrays (xi, Q, dQ, edges, stable) of the table built by
+    BuildQTable() (see QTable), for the values table_params (a dictionary) of
+    _table_parameters, so that it may be stored with store.Cached()."""
+    params = pm.Current()._replace(**table_params)
+    table = BuildQTable(smooth_coalbedo, n_xi, params=params)
+    return (table.xi, table.Q_knots, table.dQ_knots, table.edges,
+        table.stable)
+
+
+def _LoadOrBuildQTable(smooth_coalbedo, n_xi, table_params, persist):
+    """Returns the table from the store if it has been built before (see
+    store.Cached()), otherwise builds it (and stores it if persist is
+    True)."""
+    if persist:
+        return QTable(*st.Cached(_BuildQTableArrays, smooth_coalbedo, n_xi,
+            table_params))
+    return QTable(*_BuildQTableArrays(smooth_coalbedo, n_xi, table_params))
+
+
+def GetQTable(D=None, smooth_coalbedo=False, n_xi=None, params=None,
+    persist=True):
+    """Returns the lookup table of Q(x_i) (see QTable) for the given
+    parameters. Tables are kept in memory (see table_cache) and in the store
+    (see store.py), keyed by store.Key() of the values of all of the
+    parameters on which Q(x_i) depends, so that a table is built once for
+    each set of parameters and is rebuilt automatically if any of them (or
+    store.store_version) changes.
+    
+    --Args--
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (n_xi)            : int, approximate number of knots (default
+                        parameters.Q_table_n_xi).
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    (persist)         : bool, whether to load/save the table from/to the
+                        store.
+    """
+    params = pm.Get(params)
+    if D is not None:
+        params = params._replace(D=D)
+    n_xi = int(pm.Q_table_n_xi if n_xi is None else n_xi)
+    smooth_coalbedo = bool(smooth_coalbedo)
+    table_params = dict((name, getattr(params, name))
+        for name in _table_parameters)
+    key = st.Key('Q_table', smooth_coalbedo, n_xi, table_params)
+    return table_cache.Get(key, _LoadOrBuildQTable, smooth_coalbedo, n_xi,
+        table_params, persist)
+
+
+def IceEdges(Q, D=None, smooth_coalbedo=False, params=None):
+    """Returns (xi, stable): all of the steady-state ice edges x_i for each
+    value of Q, one per section of the solution branch (NaN where there is
+    none), and whether each section is stable (see QTable.IceEdges()).
+    
+    --Args--
+    Q                 : float or NumPy array, solar constant divided by 4
+                        [W m^-2].
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return GetQTable(D, smooth_coalbedo, params=params).IceEdges(Q)
@@ -0,0 +1,527 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Time-dependent numerical solution of the classic EBM with the ice-albedo
+### feedback,
+###
+###     C dT/dt = d/dx[D(1-x^2)dT/dx] - (A + BT) + QS(x)a(x,x_i),
+###
+### using the finite-volume diffusion scheme (diffusion_scheme.py) on a grid
+### of n_grid cells in 0 < x < 1, either by time stepping (NumericalEBM) or
+### directly for the steady state by Newton's method (SteadyState). With the
+### seasonal cycle of insolation, S(x,t), both hemispheres (-1 < x < 1) are
+### modelled and the periodic steady state is found directly by shooting
+### (NumericalEBM.PeriodicEquilibrium()).
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import parameters as pm, diffusion_scheme as ds
+import numpy as np
+import scipy.special as spec, scipy.sparse as sparse
+import scipy.sparse.linalg as splinalg, scipy.optimize as optimize
+
+
+def Grid(N=pm.n_grid):
+    """Returns the cell-centre coordinates x_j = h/2 + j*h (h = 1/N) of the
+    grid used by the numerical scheme.
+    
+    --Args--
+    (N) : int, number of grid cells.
+    """
+    return (0.5 + np.arange(N)) / N
+
+
+def Insolation(x, params=None):
+    """Spatial distribution of the annual-mean insolation, S(x) = 1 + S2*P2(x)
+    [dimensionless].
+    
+    --Args--
+    x        : float or NumPy array, sine of latitude.
+    (params) : Parameters tuple (default: current values, see parameters.py).
+    """
+    return 1.0 + pm.Get(params).S2*0.5*(3*x**2 - 1)
+
+
+def SeasonalInsolation(x, t, params=None):
+    """Spatial distribution of the insolation including its seasonal cycle,
+    S(x,t) = max(1 + S1*cos(2 pi t)*P1(x) + S2*P2(x), 0) [dimensionless], for
+    both hemispheres (-1 < x < 1). Time t is in years from the northern
+    winter solstice. The truncated series is negative near the winter pole,
+    where the insolation is set to zero (polar night); elsewhere its annual
+    mean is Insolation(x).
+    
+    --Args--
+    x        : float or NumPy array, sine of latitude.
+    t        : float, time [yr].
+    (params) : Parameters tuple (default: current values, see parameters.py).
+    """
+    p = pm.Get(params)
+    return np.maximum(Insolation(x, p) + p.S1*np.cos(2*np.pi*t)*x, 0.0)
+
+
+def Coalbedo(x, xi, smooth_coalbedo=False, h=None, params=None):
+    """Returns the coalbedo a(x, x_i) [dimensionless] (see analytics.py for the
+    step and smoothed forms). If h is given, the step coalbedo is averaged over
+    each grid cell of width h centred on x, so that it varies continuously
+    with the ice edge (the cell containing x_i takes a weighted mean of af and
+    ai).
+    
+    --Args--
+    x                 : float or NumPy array, sine of latitude.
+    xi                : float, sine of ice-edge latitude.
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (h)               : float, grid cell width for the step coalbedo.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    p = pm.Get(params)
+    if smooth_coalbedo:
+        return 0.5*(p.ai+p.af) + 0.5*(p.ai-p.af)*spec.erf((x-xi)/p.delta_x)
+    if h is None:
+        return np.where(x < xi, p.af, p.ai)
+    ice_free_fraction = np.clip((xi - (x - 0.5*h))/h, 0.0, 1.0)
+    return p.af*ice_free_fraction + p.ai*(1-ice_free_fraction)
+
+
+def CoalbedoDerivative(x, xi, smooth_coalbedo=False, h=None, params=None):
+    """Returns the derivative da/dx_i of the coalbedo (see Coalbedo()) with
+    respect to the ice-edge position. For the step coalbedo this requires the
+    cell width h (it is non-zero only in the cell containing x_i).
+    
+    --Args--
+    x                 : float or NumPy array, sine of latitude.
+    xi                : float, sine of ice-edge latitude.
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (h)               : float, grid cell width for the step coalbedo.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    p = pm.Get(params)
+    if smooth_coalbedo:
+        return -(p.ai-p.af)*np.exp(-((x-xi)/p.delta_x)**2) / (
+            np.sqrt(np.pi)*p.delta_x)
+    ice_free_fraction = (xi - (x - 0.5*h))/h
+    in_cell = (ice_free_fraction > 0.0) & (ice_free_fraction < 1.0)
+    return np.where(in_cell, (p.af-p.ai)/h, 0.0)
+
+
+def IceEdge(x, T, params=None):
+    """Returns the ice-edge position x_i, defined as the first (most
+    equatorward) location at which T falls to T_ice_edge, by linear
+    interpolation of T between grid points. The boundary values T(0) = T[0]
+    and T(1) = T[-1] are used outside of the grid (consistent with the Neumann
+    boundary conditions), so x_i = 0 for a snowball state and x_i = 1 for an
+    ice-free state.
+    
+    --Args--
+    x        : NumPy array, grid points (cell centres, increasing, within 0
+               and 1).
+    T        : NumPy array, temperature [degC] at each x.
+    (params) : Parameters tuple (default: current values, see parameters.py).
+    """
+    T_ice_edge = pm.Get(params).T_ice_edge
+    x = np.concatenate(([0.0], x, [1.0]))
+    T = np.concatenate(([T[0]], T, [T[-1]]))
+    cold = np.nonzero(T < T_ice_edge)[0]
+    if len(cold) == 0:
+        return 1.0
+    j = cold[0]
+    if j == 0:
+        return 0.0
+    return x[j-1] + (x[j]-x[j-1])*(T[j-1]-T_ice_edge)/(T[j-1]-T[j])
+
+
+class NumericalEBM(object):
+    """Time-dependent numerical EBM with the ice-albedo feedback. The diffusion
+    term and the linear part of the outgoing longwave radiation (-BT) are
+    integrated implicitly with a DiffusionIntegrator, with diffusivity
+    k(x) = D(1-x^2)/C and decay rate B/C, which is factorised once. The
+    absorbed solar radiation is a source term, with the ice edge (and hence
+    the coalbedo) updated from the temperature at the start of each step.
+    Time is in years. If seasonal is True, the insolation varies through the
+    year (see SeasonalInsolation()), so that there is a periodic (rather than
+    steady) equilibrium (see PeriodicEquilibrium()). The hemispheres are then
+    in opposite seasons, so both are modelled, on a grid of 2N cells in
+    -1 < x < 1 (self.x), each with its own ice edge (see IceEdges()), and
+    temperature profiles have length 2N.
+    
+    --Args--
+    (Q)               : float, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (N)               : int, number of grid cells (in each hemisphere).
+    (dt)              : float, time step [yr].
+    (theta)           : float, implicitness of the scheme (see
+                        diffusion_scheme.SolveDiffusionEquation()).
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    (seasonal)        : bool, whether to include the seasonal cycle of
+                        insolation.
+    """
+    
+    def __init__(self, Q=None, D=None, smooth_coalbedo=False, N=pm.n_grid,
+        dt=pm.dt, theta=1.0, params=None, seasonal=False):
+        p = self.params = pm.Get(params)
+        self.Q = p.Q if Q is None else Q
+        self._D = p.D if D is None else D
+        self.smooth_coalbedo = smooth_coalbedo
+        self.N = N
+        self.seasonal = seasonal
+        # The integrator's domain is 0 < x - x_south < L:
+        if seasonal:
+            self.x = 2*Grid(2*N) - 1
+            self.x_south, L = -1.0, 2.0
+        else:
+            self.x = Grid(N)
+            self.x_south, L = 0.0, 1.0
+        self.S = Insolation(self.x, p)
+        self.integrator = ds.DiffusionIntegrator(len(self.x),
+            self._Diffusivity(), dt, L=L, theta=theta, decay=p.B/p.C)
+    
+    @property
+    def D(self):
+        """Large-scale constant diffusivity [W m^-2 degC^-1]. Setting it
+        re-factorises the implicit operator (like Q, it may be changed
+        between runs)."""
+        return self._D
+    
+    @D.setter
+    def D(self, D):
+        self._D = D
+        self.integrator.Update(k=self._Diffusivity())
+    
+    def _Diffusivity(self):
+        """Returns the diffusivity k(x) = D(1-x^2)/C for the integrator, with
+        the current value of D captured (the integrator factorises it once).
+        """
+        D, C, x_south = self._D, self.params.C, self.x_south
+        return lambda x: D*(1-(x+x_south)**2)/C
+    
+    def IceEdges(self, T):
+        """Returns the ice edges (x_i in the northern hemisphere, |x_i| in the
+        southern hemisphere) of the temperature profile T (see IceEdge()),
+        which are the same unless the model is seasonal. The equator
+        temperature is interpolated between the hemispheres.
+        """
+        if not self.seasonal:
+            xi = IceEdge(self.x, T, self.params)
+            return xi, xi
+        N = self.N
+        T_equator = 0.5*(T[N-1] + T[N])
+        return tuple(IceEdge(np.concatenate(([0.0], x)), np.concatenate((
+            [T_equator], T_hemisphere)), self.params) for x, T_hemisphere in
+            [(self.x[N:], T[N:]), (-self.x[N-1::-1], T[N-1::-1])])
+    
+    def Source(self, t, T):
+        """Returns the source term (QS(x,t)a(x,x_i) - A)/C [degC yr^-1], with
+        x_i diagnosed from the temperature profile T.
+        """
+        p = self.params
+        h = 1.0/self.N
+        if self.seasonal:
+            xi_north, xi_south = self.IceEdges(T)
+            a = np.where(self.x > 0,
+                Coalbedo(self.x, xi_north, self.smooth_coalbedo, h, p),
+                Coalbedo(-self.x, xi_south, self.smooth_coalbedo, h, p))
+            S = SeasonalInsolation(self.x, t, p)
+        else:
+            a = Coalbedo(self.x, IceEdge(self.x, T, p), self.smooth_coalbedo,
+                h, p)
+            S = self.S
+        return (self.Q*S*a - p.A) / p.C
+    
+    def Run(self, T_init, years, output_every=0, callback=None,
+        t_init=0.0):
+        """Integrate forward from the temperature profile T_init for the given
+        number of years. Returns (t, T, T_final) as for
+        DiffusionIntegrator.Run().
+    
+        --Args--
+        T_init         : NumPy array of length N (2N if seasonal), initial
+                         temperature [degC].
+        years          : float, length of integration [yr].
+        (output_every) : int, steps between stored outputs (0 stores none).
+        (callback)     : function callback(t, T); integration stops early if
+                         it returns True.
+        (t_init)       : float, initial time [yr] (which matters only for
+                         the seasonal cycle).
+        """
+        n_steps = int(np.ceil(years/self.integrator.dt))
+        return self.integrator.Run(T_init, self.Source, n_steps, t_init,
+            callback=callback, output_every=output_every)
+    
+    def Equilibrium(self, T_init=None, tol=pm.dTdt_tol,
+        max_years=pm.max_years):
+        """Integrate from T_init until max|dT/dt| < tol (or max_years is
+        reached). Returns (T, xi, converged): the final temperature profile,
+        its ice edge and whether the convergence criterion was met.
+    
+        --Args--
+        (T_init)    : NumPy array of length N, initial temperature [degC]
+                      (default is uniform and ice free, T = 10 degC).
+        (tol)       : float, tolerance on max|dT/dt| [degC yr^-1].
+        (max_years) : float, maximum length of integration [yr].
+        """
+        if self.seasonal:
+            raise ValueError("The seasonal model has no steady state (see "
+                "PeriodicEquilibrium())")
+        if T_init is None:
+            T_init = 10.0*np.ones(len(self.x))
+        state = {'T': np.array(T_init, dtype=float), 'converged': False}
+    
+        def Converged(t, T):
+            dTdt = np.max(abs(T - state['T'])) / self.integrator.dt
+            state['T'] = T
+            state['converged'] = dTdt < tol
+            return state['converged']
+    
+        T = self.Run(T_init, max_years, callback=Converged)[2]
+        return T, IceEdge(self.x, T, self.params), state['converged']
+    
+    def PeriodicEquilibrium(self, T_init=None, tol=1E-8, max_iter=50,
+        output_every=1):
+        """Find the periodic equilibrium (seasonal cycle) directly, by solving
+        for the temperature at the start of the year, T_0, such that
+        P(T_0) = T_0, where P(T_0) is the temperature after integrating for
+        one year. Each evaluation of P costs one year of integration.
+        
+        Away from bifurcations the transients decay quickly (the decay rate
+        B/C alone reduces them by a factor of about 500 per year), so the
+        fixed-point iteration T_0 -> P(T_0), i.e. integrating year by year,
+        converges in a few years; this is used while the residual
+        |P(T_0) - T_0| falls by at least a factor of ten per year. When the
+        convergence is slower (near a saddle-node bifurcation, where spinning
+        up would take many years), P(T_0) - T_0 = 0 is instead solved by the
+        Jacobian-free Newton-Krylov method (scipy.optimize.newton_krylov()),
+        starting from the current iterate (if this fails, the fixed-point
+        iteration is continued). Without the seasonal cycle, this is the
+        steady state. Returns (t, T, xi, converged): the output times
+        over one year (as for Run()), the temperature profiles and northern
+        ice edges at those times and whether |P(T_0) - T_0| < tol. (The
+        southern hemisphere is the same half a year later, since the seasonal
+        cycle of insolation is antisymmetric about the equator.)
+        
+        --Args--
+        (T_init)       : NumPy array of length N (2N if seasonal), initial
+                         guess for T_0 [degC] (default is uniform and ice
+                         free, T = 10 degC).
+        (tol)          : float, tolerance on max|P(T_0) - T_0| [degC].
+        (max_iter)     : int, maximum number of iterations (years of the
+                         fixed-point iteration plus Newton iterations).
+        (output_every) : int, steps between outputs over the year.
+        """
+        n_steps = int(round(1.0/self.integrator.dt))
+        if abs(n_steps*self.integrator.dt - 1.0) > 1E-9:
+            raise ValueError("The time step must divide one year")
+        if T_init is None:
+            T_init = 10.0*np.ones(len(self.x))
+        
+        def Residual(T_0):
+            return self.integrator.Run(T_0, self.Source, n_steps,
+                output_every=0)[2] - T_0
+        
+        T_0 = np.array(T_init, dtype=float)
+        converged = False
+        newton = True
+        residual_old = np.inf
+        for k in xrange(max_iter):
+            R = Residual(T_0)
+            residual = np.max(abs(R))
+            if residual < tol:
+                converged = True
+                break
+            # Switch to Newton's method when the fixed-point iteration
+            # converges slowly, once the ice edge has settled (the residual
+            # may fall slowly at first while ice forms or melts):
+            if newton and residual > 0.1*residual_old and residual < 1.0:
+                try:
+                    T_0 = optimize.newton_krylov(Residual, T_0, f_tol=tol,
+                        maxiter=max_iter-k)
+                    converged = True
+                    break
+                except optimize.nonlin.NoConvergence:
+                    # There may be no periodic state near T_0 (e.g. beyond
+                    # a saddle-node bifurcation), so continue integrating:
+                    newton = False
+            T_0 = T_0 + R
+            residual_old = residual
+        
+        t, T = self.integrator.Run(T_0, self.Source, n_steps,
+            output_every=output_every)[:2]
+        xi = np.array([self.IceEdges(T_j)[0] for T_j in T])
+        return t, T, xi, converged
+
+
+def Hysteresis(Q_values, D=None, smooth_coalbedo=False, T_init=None,
+    N=pm.n_grid, dt=pm.dt, tol=pm.dTdt_tol, max_years=pm.max_years,
+    params=None):
+    """Calculate the equilibrium ice edge for each of a sequence of values of
+    Q, each run being initialised from the equilibrium of the previous one (so
+    that, e.g., increasing then decreasing Q traces out the hysteresis loop).
+    Returns NumPy arrays (xi, converged) of the same length as Q_values.
+    
+    --Args--
+    Q_values          : NumPy array, sequence of Q [W m^-2].
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (T_init)          : NumPy array, initial temperature for the first run.
+    (N)               : int, number of grid cells.
+    (dt)              : float, time step [yr].
+    (tol)             : float, tolerance on max|dT/dt| [degC yr^-1].
+    (max_years)       : float, maximum integration time for each run [yr].
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    model = NumericalEBM(Q_values[0], D, smooth_coalbedo, N, dt,
+        params=params)
+    xi = np.zeros(len(Q_values))
+    converged = np.zeros(len(Q_values), dtype=bool)
+    T = T_init
+    for j in xrange(len(Q_values)):
+        model.Q = Q_values[j]
+        T, xi[j], converged[j] = model.Equilibrium(T, tol, max_years)
+    return xi, converged
+
+
+def SteadyState(Q=None, D=None, smooth_coalbedo=False, T_init=None,
+    xi_init=1.0, N=pm.n_grid, tol=1E-10, max_iter=50, params=None):
+    """Solve directly for the steady state of the discretised EBM,
+    
+        L*T - A + QS(x)a(x,x_i) = 0,    T(x_i) = T_ice_edge,
+    
+    where L = K - B*I and K is the diffusion operator (see
+    diffusion_scheme.SchemeMatrix()) for k(x) = D(1-x^2), using Newton's
+    method for the unknowns (T, x_i). The Jacobian of this system is sparse:
+    the tridiagonal matrix L bordered by one column (QS da/dx_i) and one row
+    (interpolation of T to x_i). Each iteration is solved by block elimination
+    using a single sparse LU factorisation of L, which is computed once, so
+    that it costs two pairs of triangular solves. The Newton step in x_i is
+    halved until the residual |T(x_i) - T_ice_edge| decreases, since the step
+    coalbedo is only piecewise smooth in x_i. Returns (T, xi, converged).
+    
+    The ice-free (x_i = 1) and snowball (x_i = 0) states are returned if the
+    iteration reaches the boundary and the temperature there is consistent
+    with that state. If no interior ice edge is found, the iteration moves to
+    the boundary towards which the ice edge would move. If the iteration does
+    not converge within max_iter iterations, the last iterate is returned
+    with converged = False.
+    
+    For numerical continuation, a previous solution (e.g. for a nearby value
+    of Q or D) may be given as the initial guess T_init, from which the
+    initial ice edge is diagnosed; otherwise x_i = xi_init is used.
+    
+    --Args--
+    (Q)               : float, solar constant divided by 4 [W m^-2]
+                        (default params.Q).
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (T_init)          : NumPy array of length N, initial guess for T [degC].
+    (xi_init)         : float, initial guess for the ice edge (used if T_init
+                        is not given; default 1, ice free).
+    (N)               : int, number of grid cells.
+    (tol)             : float, tolerance on |T(x_i) - T_ice_edge| [degC].
+    (max_iter)        : int, maximum number of Newton iterations.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    p = pm.Get(params)
+    Q = p.Q if Q is None else Q
+    D = p.D if D is None else D
+    x = Grid(N)
+    h = 1.0 / N
+    S = Insolation(x, p)
+    x_padded = np.concatenate(([0.0], x, [1.0]))
+    
+    L = ds.SchemeMatrix(N, lambda x: D*(1-x**2), form='sparse') - \
+        p.B*sparse.identity(N, format='csr')
+    L_lu = splinalg.splu(L.tocsc())
+    
+    def Solve(xi):
+        """Returns T for fixed xi, and G = T(xi) - T_ice_edge."""
+        T = L_lu.solve(p.A - Q*S*Coalbedo(x, xi, smooth_coalbedo, h, p))
+        T_padded = np.concatenate(([T[0]], T, [T[-1]]))
+        return T, np.interp(xi, x_padded, T_padded) - p.T_ice_edge
+    
+    xi = xi_init if T_init is None else IceEdge(x, T_init, p)
+    T, G = Solve(xi)
+    
+    def Converged(xi, G):
+        # Converged, or ice-free/snowball state (no ice edge in the interior):
+        return abs(G) < tol or (xi == 1.0 and G >= 0) or (xi == 0.0 and G <= 0)
+    
+    stalled = False
+    for k in xrange(max_iter):
+        if Converged(xi, G):
+            break
+    
+        # dG/dxi = dT/dx at xi + (dT/dxi evaluated at xi), where dT/dxi is
+        # found from the bordered system by block elimination:
+        dT_dxi = L_lu.solve(-Q*S*CoalbedoDerivative(x, xi, smooth_coalbedo,
+            h, p))
+        j = min(max(np.searchsorted(x_padded, xi), 1), N+1)
+        T_padded = np.concatenate(([T[0]], T, [T[-1]]))
+        dG_dxi = (T_padded[j]-T_padded[j-1])/(x_padded[j]-x_padded[j-1]) + \
+            np.interp(xi, x_padded, np.concatenate(([dT_dxi[0]], dT_dxi,
+            [dT_dxi[-1]])))
+    
+        step = -G/dG_dxi if dG_dxi != 0 else -np.sign(G)*h
+        while True:
+            xi_new = min(max(xi + step, 0.0), 1.0)
+            T_new, G_new = Solve(xi_new)
+            if abs(G_new) < abs(G) or abs(step) < 1E-14:
+                break
+            step *= 0.5
+        if abs(G) - abs(G_new) >= tol:
+            stalled = False
+        elif not stalled:
+            # The iteration may have stalled at the edge of a grid cell,
+            # where the step coalbedo has a kink, so try once more from the
+            # new iterate:
+            stalled = True
+        else:
+            # The iteration has stalled at a minimum of |G| (e.g. Q is beyond
+            # a saddle-node bifurcation, so that there is no interior ice
+            # edge nearby), so try the boundary state towards which the ice
+            # edge would move (poleward if T(x_i) > T_ice_edge):
+            xi_new = 1.0 if G > 0 else 0.0
+            T_new, G_new = Solve(xi_new)
+            stalled = False
+        xi, T, G = xi_new, T_new, G_new
+    
+    return T, xi, Converged(xi, G)
+
+
+def SteadyStateBranch(Q_values, D=None, smooth_coalbedo=False, T_init=None,
+    xi_init=1.0, N=pm.n_grid, tol=1E-10, max_iter=50, params=None):
+    """Calculate the steady states for a sequence of values of Q by numerical
+    continuation: the solution for each Q is used as the initial guess for the
+    next (see SteadyState()). Returns (T, xi, converged), where T has shape
+    (len(Q_values), N).
+    
+    --Args--
+    Q_values          : NumPy array, sequence of Q [W m^-2].
+    (D)               : float, large-scale constant diffusivity
+                        [W m^-2 degC^-1] (default params.D).
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (T_init)          : NumPy array of length N, initial guess for the first
+                        value of Q.
+    (xi_init)         : float, initial ice edge for the first value of Q (used
+                        if T_init is not given).
+    (N)               : int, number of grid cells.
+    (tol)             : float, tolerance on |T(x_i) - T_ice_edge| [degC].
+    (max_iter)        : int, maximum number of Newton iterations for each Q.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    T = np.zeros( (len(Q_values), N) )
+    xi = np.zeros(len(Q_values))
+    converged = np.zeros(len(Q_values), dtype=bool)
+    for j in xrange(len(Q_values)):
+        T[j], xi[j], converged[j] = SteadyState(Q_values[j], D,
+            smooth_coalbedo, T_init, xi_init, N, tol, max_iter, params)
+        T_init = T[j]
+    return T, xi, converged
@@ -6,6 +6,7 @@
 ### ---------------------------------------------------------------------------
 
 from __future__ import division
+import collections
 import numpy as np
 
 RE = 6371000.0 # Mean radius of Earth [m]
@@ -27,6 +28,10 @@ delta_x = 0.05 # width of smoothing of co-albedo [dimensionless]
 S2 = -0.482 # Coefficient of degree-2 Legendre polynomial in spatial
             # distribution of solar radiation [dimensionless]
 
+S1 = -0.796 # Coefficient of cos(2 pi t)*P_1(x) in the seasonal cycle of the
+            # spatial distribution of solar radiation (-1 < x < 1), t in years
+            # from the northern winter solstice [dimensionless]
+
 Q = 335.0 # Solar constant divided by 4 [W m^-2]
             
 D = 0.649 # Large scale diffusivity (accounts for geometric factors too)
@@ -39,6 +44,22 @@ C = 0.16*B # effective heat capacity [W yr m^-2 degC^-1]
 
 ### ANALYTIC SOLUTION PARAMETERS ###
 nmax = 6 # expansion index to truncate (see North et. al. 1981 equation (25))
+# If either of these tolerances is positive, nmax is instead chosen for each
+# solution (up to nmax_limit) so that the estimated truncation errors of Q(x_i)
+# and T(x) are less than them (see analytics.AdaptiveNmax()):
+nmax_Q_tol = 0.0 # [W m^-2]
+nmax_T_tol = 0.0 # [degC]
+nmax_limit = 1000 # maximum nmax chosen adaptively
+Hn_tol = 1E-10 # absolute tolerance on H_n for the smoothed co-albedo
+Hn_cache_size = 128 # maximum number of cached H_n calculations
+Q_table_n_xi = 2001 # number of x_i knots in the Q(x_i) lookup tables
+Q_table_cache_size = 32 # maximum number of lookup tables held in memory
+
+### NUMERICAL SOLUTION PARAMETERS ###
+n_grid = 200 # number of grid cells in x (0 < x < 1)
+dt = 0.01 # time step [yr]
+dTdt_tol = 1E-5 # equilibrium reached when max|dT/dt| < dTdt_tol [degC yr^-1]
+max_years = 500 # maximum integration time to reach equilibrium [yr]
 
 ### PLOTTING PARAMETERS ###
 Q_min = 0.8 # default minimum extent to plot Q [units of default Q value]
@@ -49,3 +70,32 @@ x_max = 1.05 # default maximum extent to plot x [dimensionless]
 # In plotting HFC(xi), fit linear line between these limits:
 xi_HFC_lim1 = 0.20
 xi_HFC_lim2 = 0.85
+
+
+### PARAMETER SETS ###
+# An immutable (hence hashable and cheaply picklable) set of the model
+# parameters. The functions in analytics.py etc. accept one of these as their
+# params argument, so that different parameter values may be used without
+# changing the module-level values above (e.g. in parallel sweeps), and so
+# that it may be used as (part of) a cache key. Modified copies are made with
+# the _replace() method, e.g. Current()._replace(B=2.0):
+Parameters = collections.namedtuple('Parameters', ['A', 'B', 'ai', 'af',
+    'delta_x', 'S2', 'S1', 'Q', 'D', 'T_ice_edge', 'C', 'RE', 'nmax',
+    'nmax_Q_tol', 'nmax_T_tol', 'nmax_limit', 'Hn_tol'])
+
+
+def Current():
+    """Returns a Parameters tuple of the current module-level values."""
+    values = globals()
+    return Parameters(*[values[name] for name in Parameters._fields])
+
+
+def Get(params=None):
+    """Returns params, or the current module-level values (see Current()) if
+    params is None. Functions with an optional params argument use this to
+    resolve it when they are called (not when they are defined).
+    
+    --Args--
+    (params) : Parameters tuple or None.
+    """
+    return Current() if params is None else params
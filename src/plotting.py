@@ -52,7 +52,7 @@ def StabilityPlot(xi, norm_Q_arrays, relative_D, cols=['k']):
     ax.set_ylim([pm.x_min, pm.x_max])
     ax.set_xlabel(r'Normalised solar constant, $Q/Q_0$')
     ax.set_ylabel(r'Ice-edge position, $x_\mathrm{i}=\sin \phi_\mathrm{i}$')
-    fig.canvas.set_window_title(
+    SetFigureName(fig,
         'StabilityPlot' + ('Multiple'*(len(norm_Q_arrays)>1)) )
     fig.tight_layout()
     return fig, ax
@@ -103,7 +103,7 @@ def PlotHeatTransport(x, HT, xi, latitude_axis=False):
     ax.axvline(xi, linestyle='--', label=r'Ice edge')
     ax.plot(x, HT/(1E15), color='k')
     ax.set_ylabel(r'Poleward Heat Transport (PW)')
-    fig.canvas.set_window_title('HeatTransport')
+    SetFigureName(fig, 'HeatTransport')
     fig.tight_layout()
     return fig, ax
 
@@ -133,32 +133,33 @@ def PlotHeatFluxConvergence(x, HFC, xi, latitude_axis=False):
     ax.axvline(xi, linestyle='--', label=r'Ice edge')
     ax.plot(x, HFC, color='k')
     ax.set_ylabel(r'Heat flux convergence (W m$^{-2}$)')
-    fig.canvas.set_window_title('HeatFluxConvergence')
+    SetFigureName(fig, 'HeatFluxConvergence')
     fig.tight_layout()
     return fig, ax
 
 
 def PlotHFCIceEdge(relative_D=np.array([0.75,1.0,1.25]), smooth_coalbedo=False,
-    add_linear_fit=False):
+    add_linear_fit=False, params=None):
     """Plot the heat flux convergence (HFC) at the ice edge as the ice edge
     varies (i.e. HFC(x=xi) vs xi) for each value of D = relative_D * D0 where
-    D0 is standard value (set in the parameters file). Calculations are done
-    here and the MatPlotLib figure and axis objects (fig, ax) are returned.
+    D0 is standard value (params.D). Calculations are done here and the
+    MatPlotLib figure and axis objects (fig, ax) are returned.
     
     --Args--
     (relative_D)      : (NumPy) array of values of D to be used in units of D0.
     (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
     (add_linear_fit)  : bool, if True, adds a linear fit to the first data set.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
     """
     
+    params = pm.Get(params)
     xi = np.arange(0.0, 1.001, 0.01)
-    HFC = np.zeros( (len(relative_D), len(xi)) )
     
-    for j in xrange(len(relative_D)):
-        for k in xrange(len(xi)):
-            Q = an.Q(xi[k], pm.D*relative_D[j], smooth_coalbedo)
-            HFC[j][k] = an.HeatFluxConvergence(xi[k], xi[k], Q,
-                pm.D*relative_D[j], smooth_coalbedo)
+    # Rows correspond to each value of D, columns to each ice edge (x = xi):
+    D = params.D*np.asarray(relative_D, dtype=float)[:,np.newaxis]
+    solution = an.AnalyticSolution(xi, smooth_coalbedo, params)
+    HFC = solution.HeatFluxConvergence(xi, solution.Q(D), D)
     
     fig, ax = plt.subplots()
     ax.axhline(0, color=[.2,.2,.2], linewidth=0.8)
@@ -177,15 +178,66 @@ def PlotHFCIceEdge(relative_D=np.array([0.75,1.0,1.25]), smooth_coalbedo=False,
     ax.set_xlabel(r'Ice edge position, $x_\mathrm{i}=\sin\phi_\mathrm{i}$')
     ax.set_ylabel(r'Heat flux convergence (W m$^{-2}$)')
     ax.legend(loc='upper left')
-    fig.canvas.set_window_title(
+    SetFigureName(fig,
         'HeatFluxConvergenceIceEdge' + '_Multiple'*(len(relative_D)>1))
     fig.tight_layout()
     return fig, ax
 
 
+def PlotFoldCurves(curves, param_label=r'$D/D_0$', p_scale=None,
+    params=None):
+    """Plot the critical values of Q at the saddle-node bifurcations (folds)
+    of the solution branch against a model parameter, as returned by
+    continuation.TrackFolds(), with the cusps at which they meet. Returns the
+    MatPlotLib figure and axis objects (fig, ax).
+    
+    --Args--
+    curves        : list of continuation.FoldCurve tuples.
+    (param_label) : string, axis label for the parameter.
+    (p_scale)     : float, the parameter is plotted in units of p_scale
+                    (default params.D).
+    (params)      : Parameters tuple, giving the reference values D0 and Q0
+                    (default: current values, see parameters.py).
+    """
+    params = pm.Get(params)
+    p_scale = params.D if p_scale is None else p_scale
+    fig, ax = plt.subplots()
+    labels = {'minimum': 'Q minimum', 'maximum': 'Q maximum', 'cusp': 'Cusp'}
+    for c in curves:
+        # Join each curve to its cusps, between the neighbouring p_values:
+        p = np.array(c.p); Q = np.array(c.Q)
+        for cusp in sorted(c.cusps, key=lambda cusp: -cusp.index):
+            p = np.insert(p, cusp.index, cusp.p)
+            Q = np.insert(Q, cusp.index, cusp.Q)
+        ax.plot(p/p_scale, Q/params.Q, color='k',
+            linestyle=('-' if c.kind=='minimum' else '--'),
+            label=labels.pop(c.kind, None))
+        for cusp in c.cusps:
+            ax.plot(cusp.p/p_scale, cusp.Q/params.Q, 'o', color='k',
+                label=labels.pop('cusp', None))
+    ax.set_xlabel(param_label)
+    ax.set_ylabel(r'Critical normalised solar constant, $Q/Q_0$')
+    ax.legend(loc='upper left')
+    SetFigureName(fig, 'FoldCurves')
+    fig.tight_layout()
+    return fig, ax
+
+
 ###############################################################################
 
 
+def SetFigureName(fig, name):
+    """Set the name of a figure, used as its filename by fileIO.SaveFigures():
+    its label and (if it has a window) its window title.
+    
+    --Args--
+    fig  : MatPlotLib figure object.
+    name : string, name of the figure.
+    """
+    fig.set_label(name)
+    fig.canvas.set_window_title(name)
+
+
 def SetRCParams():
     """Set default MatPlotLib formatting styles (rcParams) which will be set
     automatically for any plotting method.
@@ -0,0 +1,195 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Opt-in instrumentation of the hot paths: call counts and cumulative wall
+### time of the instrumented functions (see Timed()), counts of events such as
+### quadrature evaluations (see Count()), and the wall time of named phases of
+### a script (see Phase()). It is enabled by setting the environment variable
+### CLASSIC_EBM_PROFILE=1, in which case a report is printed at exit, or within
+### a Profile() context. When disabled, each instrumented call costs only one
+### check of a flag.
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import os, sys, atexit, functools, collections, timeit
+
+environment_variable = 'CLASSIC_EBM_PROFILE'
+
+# Whether instrumentation is currently enabled:
+enabled = os.environ.get(environment_variable, '') not in ('', '0')
+
+# Name of the current phase (see Phase()):
+_phase = None
+
+# Records, per phase (in order of first use): the wall time of the phase, the
+# [number of calls, cumulative wall time] of each timed function and the total
+# of each counted event:
+_phase_times = collections.OrderedDict()
+_timings = collections.OrderedDict()
+_counts = collections.OrderedDict()
+
+
+def Timed(name):
+    """Returns a decorator which records the number of calls and cumulative
+    wall time (including that of any instrumented functions it calls) of a
+    function under name, when instrumentation is enabled. Calls in worker
+    processes (e.g. of parallel sweeps) are not recorded.
+    
+    --Args--
+    name : str, name under which to record the function (e.g.
+           'analytics.Q').
+    """
+    def Decorator(function):
+        @functools.wraps(function)
+        def Wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            t0 = timeit.default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record = _timings.setdefault(_phase, {}).setdefault(name,
+                    [0, 0.0])
+                record[0] += 1
+                record[1] += timeit.default_timer() - t0
+        return Wrapper
+    return Decorator
+
+
+def Count(name, n=1):
+    """Add n to the count of the event name (e.g. the number of points at
+    which an integrand is evaluated), when instrumentation is enabled."""
+    if enabled:
+        counts = _counts.setdefault(_phase, {})
+        counts[name] = counts.get(name, 0) + n
+
+
+def Counted(name, function):
+    """Returns function wrapped so that each call is counted as an event
+    name (see Count()). Intended for integrands passed to adaptive
+    quadrature; wrap them only when enabled, to avoid any overhead."""
+    def Wrapper(*args):
+        Count(name)
+        return function(*args)
+    return Wrapper
+
+
+class Phase(object):
+    """Context in which timings and counts are recorded under the phase name
+    (e.g. 'compute', 'plot' or 'save' in the bin/ scripts), and whose wall
+    time is recorded. Phases may be nested, in which case the inner phase is
+    recorded as 'outer/inner'.
+    
+    --Args--
+    name : str, name of the phase.
+    """
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def __enter__(self):
+        global _phase
+        self._outer = _phase
+        _phase = self.name if _phase is None else _phase + '/' + self.name
+        self._t0 = timeit.default_timer()
+        return self
+    
+    def __exit__(self, *exc_info):
+        global _phase
+        if enabled:
+            _phase_times[_phase] = _phase_times.get(_phase, 0.0) + (
+                timeit.default_timer() - self._t0)
+        _phase = self._outer
+        return False
+
+
+class Profile(object):
+    """Context in which instrumentation is enabled (whatever the environment
+    variable), optionally clearing previous records on entry and printing a
+    report (see Report()) on exit.
+    
+    --Args--
+    (report) : bool, whether to print a report on exit.
+    (reset)  : bool, whether to clear previous records on entry.
+    (stream) : file object to which to print the report (default stderr).
+    """
+    
+    def __init__(self, report=True, reset=True, stream=None):
+        self.report = report
+        self.reset = reset
+        self.stream = stream
+    
+    def __enter__(self):
+        global enabled
+        self._was_enabled = enabled
+        if self.reset:
+            Reset()
+        enabled = True
+        return self
+    
+    def __exit__(self, *exc_info):
+        global enabled
+        enabled = self._was_enabled
+        if self.report:
+            Report(self.stream)
+        return False
+
+
+def Reset():
+    """Clear all records."""
+    _phase_times.clear()
+    _timings.clear()
+    _counts.clear()
+
+
+def Records():
+    """Returns the records as a dictionary keyed by phase (None for calls
+    outside any phase) of dictionaries with entries 'time' (wall time of the
+    phase, or None), 'timings' ({name: (calls, wall time [s])}) and 'counts'
+    ({name: count})."""
+    phases = list(_phase_times) + [p for p in list(_timings) + list(_counts)
+        if p not in _phase_times]
+    records = collections.OrderedDict()
+    for p in phases:
+        if p in records:
+            continue
+        records[p] = {'time': _phase_times.get(p),
+            'timings': dict((name, tuple(r)) for name, r in
+                _timings.get(p, {}).items()),
+            'counts': dict(_counts.get(p, {}))}
+    return records
+
+
+def Report(stream=None):
+    """Print a summary of the records: for each phase, its wall time, then
+    the number of calls and cumulative wall time of each timed function (in
+    order of decreasing time) and the counted events.
+    
+    --Args--
+    (stream) : file object to which to print (default stderr).
+    """
+    stream = sys.stderr if stream is None else stream
+    stream.write('=== CLASSIC_EBM profile ===\n')
+    for phase, record in Records().items():
+        label = '(outside phases)' if phase is None else phase
+        if record['time'] is None:
+            stream.write('Phase %s\n' % label)
+        else:
+            stream.write('Phase %s: %.4f s\n' % (label, record['time']))
+        timings = sorted(record['timings'].items(), key=lambda r: -r[1][1])
+        if timings:
+            stream.write('    %10s %12s  %s\n' % ('calls', 'time [s]',
+                'function'))
+        for name, (calls, t) in timings:
+            stream.write('    %10d %12.4f  %s\n' % (calls, t, name))
+        for name, count in sorted(record['counts'].items()):
+            stream.write('    %10d %12s  %s\n' % (count, '(count)', name))
+    stream.flush()
+
+
+def _ReportAtExit():
+    if enabled and (_phase_times or _timings or _counts):
+        Report()
+
+
+atexit.register(_ReportAtExit)
@@ -0,0 +1,159 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tables of Legendre polynomials (and their derivatives) evaluated on a grid
+### of x, so that the spectral expansion of the analytic solution can be
+### summed as a single matrix-vector product against the T_n coefficients.
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import numpy as np
+
+
+def Degrees(nmax):
+    """Returns a NumPy array of the (even) degrees n included in the truncated
+    spectral expansion, i.e. n = 0, 2, 4, ..., consistent with the summation
+    range used by the functions in analytics.py.
+    
+    --Args--
+    nmax : int, expansion index at which to truncate.
+    """
+    return np.arange(0, nmax+2, 2)
+
+
+def LegendreP(nmax, x):
+    """Evaluate the Legendre polynomials P_n(x) for all n = 0, 1, ..., nmax
+    using the three-term recurrence relation (see LegendreTable()). Returns a
+    NumPy array of shape x.shape + (nmax+1,).
+    
+    --Args--
+    nmax : int, maximum degree of Legendre polynomial.
+    x    : float or NumPy array, points at which to evaluate.
+    """
+    x = np.asarray(x, dtype=float)
+    # The recurrence runs over the first axis, so that each P_n is contiguous:
+    P = np.zeros((nmax+1,) + x.shape)
+    P[0] = 1.0
+    if nmax > 0:
+        P[1] = x
+    for n in xrange(1, nmax):
+        P[n+1] = ( (2*n+1)*x*P[n] - n*P[n-1] ) / (n+1)
+    return np.moveaxis(P, 0, -1)
+
+
+def LegendreTable(nmax, x):
+    """Evaluate the Legendre polynomials P_n(x), and their first and second
+    derivatives, for all n = 0, 1, ..., nmax using the three-term recurrence
+    relations:
+    
+        (n+1)P_{n+1} = (2n+1)xP_n - nP_{n-1}
+             P'_{n+1} = P'_{n-1} + (2n+1)P_n
+            P''_{n+1} = P''_{n-1} + (2n+1)P'_n
+    
+    which are numerically stable for large n (unlike evaluating poly1d
+    coefficients). Returns (P, dP, d2P), each a NumPy array of shape
+    x.shape + (nmax+1,).
+    
+    --Args--
+    nmax : int, maximum degree of Legendre polynomial.
+    x    : float or NumPy array, points at which to evaluate.
+    """
+    x = np.asarray(x, dtype=float)
+    P = np.zeros((nmax+1,) + x.shape)
+    dP = np.zeros((nmax+1,) + x.shape)
+    d2P = np.zeros((nmax+1,) + x.shape)
+    
+    P[0] = 1.0
+    if nmax > 0:
+        P[1] = x
+        dP[1] = 1.0
+    for n in xrange(1, nmax):
+        P[n+1] = ( (2*n+1)*x*P[n] - n*P[n-1] ) / (n+1)
+        dP[n+1] = dP[n-1] + (2*n+1)*P[n]
+        d2P[n+1] = d2P[n-1] + (2*n+1)*dP[n]
+    
+    return tuple(np.moveaxis(a, 0, -1) for a in (P, dP, d2P))
+
+
+def LegendreIntegral(nmax, x):
+    """Evaluate the integrals of the Legendre polynomials from 0 to x,
+    
+        I_n(x) = int_0^x P_n(t) dt = [P_{n+1} - P_{n-1}]_0^x / (2n+1),
+    
+    (and I_0 = x) for all n = 0, 1, ..., nmax, with P_n evaluated by the
+    three-term recurrence relation (see LegendreP()). Unlike integrating
+    poly1d coefficients, this is accurate for large n. Returns a NumPy array
+    of shape x.shape + (nmax+1,).
+    
+    --Args--
+    nmax : int, maximum degree of Legendre polynomial.
+    x    : float or NumPy array, upper limits of the integrals.
+    """
+    x = np.asarray(x, dtype=float)
+    P = LegendreP(nmax+1, x)
+    P0 = LegendreP(nmax+1, 0.0)
+    n = np.arange(1, nmax+1)
+    I = np.zeros(x.shape + (nmax+1,))
+    I[...,0] = x
+    I[...,1:] = ((P[...,2:] - P0[2:]) - (P[...,:-2] - P0[:-2])) / (2*n+1)
+    return I
+
+
+class SpectralBasis(object):
+    """Legendre basis tables P_n(x), P_n'(x) and P_n''(x) for the even degrees
+    n = 0, 2, ..., evaluated on a fixed grid of x. Each table has shape
+    x.shape + (number of degrees,), so that a field expanded as sum_n c_n*P_n
+    is reconstructed with np.dot(basis.P, c).
+    
+    Instances should normally be obtained from GetSpectralBasis(), which
+    caches them so that the tables are reused across many solutions.
+    
+    --Args--
+    nmax : int, expansion index at which to truncate.
+    x    : float or NumPy array, grid of x on which to evaluate the basis.
+    """
+    
+    def __init__(self, nmax, x):
+        self.nmax = nmax
+        self.x = np.array(x, dtype=float)
+        self.n = Degrees(nmax)
+        P, dP, d2P = LegendreTable(self.n[-1], self.x)
+        self.P = P[...,self.n]
+        self.dP = dP[...,self.n]
+        self.d2P = d2P[...,self.n]
+    
+    def Sum(self, table, c):
+        """Sum the spectral series sum_n c_n*table_n(x). If c is a 1D array of
+        coefficients this is a single matrix-vector product; otherwise c must
+        have shape s + (number of degrees,) and the result is broadcast with
+        shape of x.
+    
+        --Args--
+        table : NumPy array, one of self.P, self.dP, self.d2P.
+        c     : NumPy array, coefficients (last axis runs over degrees).
+        """
+        c = np.asarray(c)
+        if c.ndim == 1:
+            return np.dot(table, c)
+        return np.sum(table*c, axis=-1)
+
+
+_basis_cache = {}
+_basis_cache_size = 32
+
+
+def GetSpectralBasis(nmax, x):
+    """Returns a SpectralBasis for the given truncation and grid of x, reusing
+    a previously-constructed one if it exists.
+    
+    --Args--
+    nmax : int, expansion index at which to truncate.
+    x    : float or NumPy array, grid of x on which to evaluate the basis.
+    """
+    x = np.asarray(x, dtype=float)
+    key = (nmax, x.shape, x.tobytes())
+    if key not in _basis_cache:
+        if len(_basis_cache) >= _basis_cache_size:
+            _basis_cache.clear()
+        _basis_cache[key] = SpectralBasis(nmax, x)
+    return _basis_cache[key]
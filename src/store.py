@@ -0,0 +1,185 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### On-disk store of computed results (e.g. Q(x_i) arrays, heat transport
+### profiles and parameter sweeps), keyed by a hash of everything they depend
+### on, so that they are not recomputed on every run. Large results are
+### written chunk by chunk to memory-mapped .npy files, so that interrupted
+### computations may be resumed.
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import os, shutil, hashlib
+import numpy as np
+import parameters as pm
+
+# Version of the stored results. Increment this whenever a change to the
+# model changes results, so that those stored by an older version are not
+# used:
+store_version = 2
+
+# Directory in which results are stored:
+store_dir = os.path.join(os.path.dirname(__file__), '..', 'results')
+
+# Whether to use the store (if False, Cached() always computes its result
+# and nothing is written):
+enabled = True
+
+
+def _Canonical(obj):
+    """Returns a representation of obj (a number, string, NumPy array,
+    function or a list, tuple or dictionary of these) whose repr() determines
+    its value. Arrays are represented by their shape, type and a hash of their
+    data."""
+    if isinstance(obj, (np.ndarray, np.generic)):
+        a = np.ascontiguousarray(obj)
+        return ('array', a.dtype.str, a.shape,
+            hashlib.sha1(a.tobytes()).hexdigest())
+    if isinstance(obj, dict):
+        return ('dict',) + tuple((k, _Canonical(obj[k])) for k in sorted(obj))
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__,) + tuple(_Canonical(o) for o in obj)
+    if callable(obj):
+        return ('function', obj.__module__, obj.__name__)
+    return repr(obj)
+
+
+def _ModuleParameters():
+    """Returns a dictionary of the current values of all of the numerical
+    module-level parameters (see parameters.py), including those which are
+    not fields of parameters.Parameters (e.g. the numerical grid size and
+    time step)."""
+    values = vars(pm)
+    return dict((name, values[name]) for name in values
+        if not name.startswith('_') and isinstance(values[name], (int, float)))
+
+
+def Key(*parts):
+    """Returns a hash (a string of hexadecimal digits) of parts and the
+    current module-level parameters (which any function called with
+    params=None depends on), identifying a stored result.
+    """
+    description = (store_version, _Canonical(parts),
+        _Canonical(_ModuleParameters()))
+    return hashlib.sha1(repr(description).encode()).hexdigest()[:20]
+
+
+def Path(name, *parts):
+    """Returns the path in the store of the result called name which depends
+    on parts (see Key())."""
+    return os.path.join(store_dir, '%s_%s' % (name, Key(*parts)))
+
+
+def Cached(function, *args, **kwargs):
+    """Returns function(*args, **kwargs), loaded from the store if it has
+    been computed before with the same arguments and parameters, otherwise
+    computed and stored. The result must be a NumPy array (or float) or a
+    tuple of them; when loaded from the store, these are read-only
+    memory-mapped NumPy arrays.
+    
+    --Args--
+    function : function to evaluate (defined at the top level of a module).
+    (args)   : positional arguments of function.
+    (kwargs) : keyword arguments of function.
+    """
+    if not enabled:
+        return function(*args, **kwargs)
+    
+    dirname = Path(function.__name__, function, args, kwargs)
+    if os.path.isdir(dirname):
+        single, count = np.load(os.path.join(dirname, 'info.npy'))
+        values = tuple(np.load(os.path.join(dirname, 'result_%d.npy' % j),
+            mmap_mode='r') for j in xrange(count))
+        return values[0] if single else values
+    
+    result = function(*args, **kwargs)
+    single = not isinstance(result, tuple)
+    values = [result] if single else result
+    
+    # Write to a temporary directory which is then renamed, so that a
+    # partially-written result is never read:
+    temp = '%s.%d.tmp' % (dirname, os.getpid())
+    os.makedirs(temp)
+    for j, value in enumerate(values):
+        np.save(os.path.join(temp, 'result_%d.npy' % j), np.asarray(value))
+    np.save(os.path.join(temp, 'info.npy'), np.array([single, len(values)]))
+    try:
+        os.rename(temp, dirname)
+    except OSError: # stored by another process in the meantime
+        shutil.rmtree(temp)
+    return result
+
+
+def Clear():
+    """Delete all stored results."""
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+
+
+class ChunkedArray(object):
+    """An array of results at each point of a grid, stored in the directory
+    dirname as a memory-mapped .npy file which is written chunk by chunk (so
+    that the whole array is never held in memory), together with a record
+    of which points have been written. If the directory already exists the
+    array is reopened, so that a computation which was interrupted can be
+    resumed by computing only the points which are still pending.
+    
+    --Args--
+    dirname : str, directory of the array (see Path()).
+    shape   : tuple, shape of the grid of points.
+    """
+    
+    def __init__(self, dirname, shape):
+        self.dirname = dirname
+        self.shape = tuple(shape)
+        self.n_points = int(np.prod(self.shape))
+        self._values = None
+        done_file = os.path.join(dirname, 'done.npy')
+        if os.path.isfile(done_file):
+            self.done = np.lib.format.open_memmap(done_file, mode='r+')
+        else:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self.done = np.lib.format.open_memmap(done_file, mode='w+',
+                dtype=bool, shape=(self.n_points,))
+            self.done[:] = False
+            self.done.flush()
+    
+    def _Values(self, result_shape=None):
+        """Returns the memory-mapped array of values, of shape
+        (n_points,) + result_shape, creating it if necessary."""
+        if self._values is None:
+            values_file = os.path.join(self.dirname, 'values.npy')
+            if os.path.isfile(values_file):
+                self._values = np.lib.format.open_memmap(values_file,
+                    mode='r+')
+            elif result_shape is not None:
+                self._values = np.lib.format.open_memmap(values_file,
+                    mode='w+', dtype=float,
+                    shape=(self.n_points,) + tuple(result_shape))
+        return self._values
+    
+    def Pending(self, start, stop):
+        """Returns whether any of the points with flat (C-ordered) indices
+        start, ..., stop-1 have not been written."""
+        return not np.all(self.done[start:stop])
+    
+    def Write(self, start, stop, results):
+        """Write the list of results (NumPy arrays of the same shape) at the
+        points with flat indices start, ..., stop-1. The values are flushed
+        to disk before the points are recorded as written."""
+        values = self._Values(np.shape(results[0]))
+        values[start:stop] = results
+        values.flush()
+        self.done[start:stop] = True
+        self.done.flush()
+    
+    def Values(self):
+        """Returns the (read-only, memory-mapped) array of all values, of
+        shape self.shape + (shape of one result)."""
+        if not np.all(self.done):
+            raise ValueError("Not all points of %s have been written"
+                % self.dirname)
+        values = np.load(os.path.join(self.dirname, 'values.npy'),
+            mmap_mode='r')
+        return values.reshape(self.shape + values.shape[1:])
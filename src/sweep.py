@@ -0,0 +1,208 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Parameter sweeps: evaluate a function of the model parameters at every
+### point of a grid of parameter values, split into chunks which are run in
+### parallel over a pool of processes (requires concurrent.futures; on Python
+### 2.7 this is the 'futures' backport). Sweeps may be stored on disk chunk by
+### chunk (see store.py), so that an interrupted sweep can be resumed.
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+import collections, multiprocessing
+import numpy as np
+import concurrent.futures as futures
+import parameters as pm, analytics as an, continuation as ct, numerical as nm
+import store as st
+
+
+# Results of a sweep: the names of the swept parameters, a list of the arrays
+# of their values (one per axis, in the same order) and the array of results,
+# of shape (len(axes[0]), len(axes[1]), ...) + (shape of one result):
+Sweep = collections.namedtuple('Sweep', ['names', 'axes', 'values'])
+
+
+def _RunChunk(function, names, axes, start, stop, params, kwargs):
+    """Evaluate function at the grid points with flat (C-ordered) indices
+    start, start+1, ..., stop-1, returning a list of the results. At each
+    point, the swept model parameters replace those in params, which is
+    passed to function as its params argument; any other swept values, and
+    kwargs, are passed as keyword arguments.
+    """
+    shape = tuple(len(a) for a in axes)
+    fields = [name in pm.Parameters._fields for name in names]
+    results = []
+    for index in xrange(start, stop):
+        point = dict(kwargs)
+        replace = {}
+        for name, a, i, field in zip(names, axes,
+            np.unravel_index(index, shape), fields):
+            if name in ('nmax', 'nmax_limit'):
+                replace[name] = int(a[i])
+            elif field:
+                replace[name] = a[i]
+            else:
+                point[name] = a[i]
+        point['params'] = params._replace(**replace)
+        results.append(np.asarray(function(**point), dtype=float))
+    return results
+
+
+def _RunChunks(function, names, axes, chunks, processes, params, kwargs):
+    """Generator of (start, stop, results) for each of chunks (see
+    _RunChunk()), in the order in which they finish. At most two chunks per
+    process are submitted at a time, so that the results held in memory at
+    once do not grow with the size of the sweep.
+    """
+    if processes == 1:
+        for start, stop in chunks:
+            yield start, stop, _RunChunk(function, names, axes, start, stop,
+                params, kwargs)
+        return
+    
+    with futures.ProcessPoolExecutor(processes) as executor:
+        queue = list(reversed(chunks))
+        running = {}
+        while queue or running:
+            while queue and len(running) < 2*processes:
+                start, stop = queue.pop()
+                job = executor.submit(_RunChunk, function, names, axes, start,
+                    stop, params, kwargs)
+                running[job] = (start, stop)
+            finished = futures.wait(running,
+                return_when=futures.FIRST_COMPLETED)[0]
+            for job in finished:
+                start, stop = running.pop(job)
+                yield start, stop, job.result()
+
+
+def RunSweep(function, axes, processes=None, chunk_size=None, params=None,
+    store=False, **kwargs):
+    """Evaluate function at every point of the grid of parameter values given
+    by axes, e.g. [('D', D_values), ('B', B_values)], returning a Sweep tuple
+    whose array of results is indexed in the same order as axes. Any model
+    parameter (e.g. D, Q, A, B, ai, af, delta_x, nmax; any field of
+    parameters.Parameters) may be swept, as may other arguments of function
+    such as xi.
+    
+    At each point, function is called with the keyword argument params, a
+    copy of params with the swept model parameters replaced by the point's
+    values, plus any other swept values and kwargs as keyword arguments.
+    Since params is immutable and picklable, nothing is shared or modified
+    between points or processes. The function must return a float or a
+    NumPy array of the same shape at every point, and (when processes > 1)
+    it must be picklable, i.e. defined at the top level of a module (see
+    SolutionQ(), Folds() and SteadyStateIceEdge() below). The grid is split
+    into chunks of consecutive points which are submitted to a process pool;
+    each result is placed by its index so that the results do not depend on
+    the number of processes.
+    
+    If store is True, the results are written to the store (see
+    store.ChunkedArray) as each chunk finishes, keyed by the function, axes,
+    params and kwargs, and the array of results is memory-mapped from it.
+    Chunks which have already been stored (e.g. by an earlier, interrupted
+    run of the same sweep) are not recomputed, and memory use does not grow
+    with the size of the sweep.
+    
+    If any axis is empty, function is not called and the array of results
+    is empty, of shape (len(axes[0]), len(axes[1]), ...).
+    
+    --Args--
+    function     : function of the model parameters (see above).
+    axes         : list of (name, values) pairs; the parameters to sweep.
+    (processes)  : int, number of worker processes (default: number of CPUs).
+                   If 1, the sweep is run serially in this process.
+    (chunk_size) : int, number of grid points per chunk (default: such that
+                   there are about four chunks per process).
+    (params)     : Parameters tuple of the values of the parameters which
+                   are not swept (default: current values, see
+                   parameters.py).
+    (store)      : bool, whether to store the results on disk and resume
+                   from any stored already.
+    (kwargs)     : further keyword arguments passed to function at every
+                   point (e.g. smooth_coalbedo, or an array of xi so that
+                   each evaluation is vectorised over xi).
+    """
+    params = pm.Get(params)
+    names = [name for name, values in axes]
+    axes = [np.atleast_1d(np.asarray(values, dtype=float))
+        for name, values in axes]
+    shape = tuple(len(a) for a in axes)
+    n_points = int(np.prod(shape))
+    if n_points == 0:
+        # Nothing to evaluate (nor store); the shape of one result is not
+        # known, so it is taken to be a float:
+        return Sweep(names, axes, np.empty(shape))
+    
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(int(np.ceil(n_points/(4*processes))), 1)
+    chunks = [(j, min(j+chunk_size, n_points))
+        for j in xrange(0, n_points, chunk_size)]
+    
+    if store:
+        stored = st.ChunkedArray(st.Path('sweep', function, names, axes,
+            params, kwargs), shape)
+        chunks = [(start, stop) for start, stop in chunks
+            if stored.Pending(start, stop)]
+        for start, stop, results in _RunChunks(function, names, axes, chunks,
+            processes, params, kwargs):
+            stored.Write(start, stop, results)
+        return Sweep(names, axes, stored.Values())
+    
+    values = None
+    for start, stop, results in _RunChunks(function, names, axes, chunks,
+        processes, params, kwargs):
+        if values is None:
+            values = np.empty((n_points,) + results[0].shape)
+        values[start:stop] = results
+    
+    return Sweep(names, axes, values.reshape(shape + values.shape[1:]))
+
+
+def SolutionQ(xi, smooth_coalbedo=False, params=None):
+    """Returns Q(x_i) of the analytic steady-state solution (see
+    analytics.Q()). For use with RunSweep().
+    
+    --Args--
+    xi                : float or NumPy array, sine of ice-edge latitude.
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    return an.Q(xi, None, smooth_coalbedo, params)
+
+
+def Folds(smooth_coalbedo=False, params=None):
+    """Returns a NumPy array (x_i, Q) of the minimum then the maximum fold of
+    the analytic solution branch (see continuation.FindFolds()), with NaN
+    for any that do not exist. Where there is more than one fold of the same
+    kind, the first is used. For use with RunSweep().
+    
+    --Args--
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    result = np.nan*np.zeros(4)
+    for fold in ct.FindFolds(None, smooth_coalbedo, params=params)[0][::-1]:
+        j = 0 if fold.kind == 'minimum' else 2
+        result[j:j+2] = fold.xi, fold.Q
+    return result
+
+
+def SteadyStateIceEdge(smooth_coalbedo=False, xi_init=1.0, params=None):
+    """Returns the ice edge x_i of the steady state of the numerical EBM
+    reached from the initial guess xi_init (see numerical.SteadyState()), or
+    NaN if the solver does not converge. For use with RunSweep().
+    
+    --Args--
+    (smooth_coalbedo) : bool, whether to use the smoothed coalbedo function.
+    (xi_init)         : float, initial guess of the ice edge.
+    (params)          : Parameters tuple (default: current values, see
+                        parameters.py).
+    """
+    T, xi, converged = nm.SteadyState(smooth_coalbedo=smooth_coalbedo,
+        xi_init=xi_init, params=params)
+    return xi if converged else np.nan
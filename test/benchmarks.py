@@ -0,0 +1,397 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Benchmarks of the analytic, numerical and plotting hot paths over
+### realistic problem sizes, each paired with a check of its accuracy against
+### reference values calculated independently of the code being timed. Times
+### and a sample of the results are compared with a JSON baseline file, and
+### slow-downs beyond a threshold, inaccurate results and results which have
+### changed since the baseline are flagged.
+### Usage: python benchmarks.py [quick] [update] [threshold=<ratio>]
+###     [baseline=<filename>] [only=<text>]
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, time, json, platform, collections, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import fileIO
+fileIO.SetHeadless()
+
+import matplotlib.pyplot as plt
+import numpy.polynomial.legendre as legendre
+import scipy.special as spec
+from src import parameters as pm, analytics as an, spectral
+from src import diffusion_scheme as ds, plotting as pl
+
+# A benchmark: its name, the function to time (returning its result), a
+# function of the result returning its maximum relative error with respect to
+# reference values, and the tolerance on that error:
+Benchmark = collections.namedtuple('Benchmark', ['name', 'function', 'check',
+    'tol'])
+
+baseline_version = 1
+default_baseline = os.path.join(os.path.dirname(__file__), 'benchmarks.json')
+default_threshold = 1.25 # flag benchmarks slower than this x baseline
+values_tol = 1E-9 # flag results which differ from the baseline by more
+n_values = 8 # number of values of each result recorded in the baseline
+
+
+###############################################################################
+### REFERENCE VALUES (independent of analytics.py and spectral.py)
+
+
+def ReferenceHn(xi, smooth_coalbedo, params, m=512):
+    """Returns H_n(x_i), n = 0, 2, ..., nmax, for each of xi, calculated with
+    an m-point Gauss-Legendre rule on each of [0, x_i] and [x_i, 1] and
+    NumPy's Legendre polynomials.
+    """
+    n = np.arange(0, params.nmax+1, 2)
+    nodes, weights = legendre.leggauss(m)
+    a1 = 0.5*(params.ai+params.af); a2 = 0.5*(params.ai-params.af)
+    Hn = np.zeros((len(xi), len(n)))
+    for j, x_i in enumerate(xi):
+        for lo, hi, a_step in [(0.0, x_i, params.af), (x_i, 1.0, params.ai)]:
+            x = 0.5*(hi-lo)*nodes + 0.5*(hi+lo)
+            w = 0.5*(hi-lo)*weights
+            if smooth_coalbedo:
+                a = a1 + a2*spec.erf((x-x_i)/params.delta_x)
+            else:
+                a = a_step
+            S = 1 + params.S2*(1.5*x**2 - 0.5)
+            P = legendre.legvander(x, params.nmax)[:,n]
+            Hn[j] += (2*n+1)*np.dot(w*S*a, P)
+    return Hn
+
+
+def ReferenceQ(xi, smooth_coalbedo, params, D=None):
+    """Returns Q(x_i) for each of xi (see ReferenceHn())."""
+    D = params.D if D is None else D
+    n = np.arange(0, params.nmax+1, 2)
+    Hn = ReferenceHn(xi, smooth_coalbedo, params)
+    P = legendre.legvander(xi, params.nmax)[:,n]
+    S = np.sum(Hn*P/(n*(n+1)*D + params.B), axis=-1)
+    return (params.A + params.B*params.T_ice_edge)/(params.B*S)
+
+
+def ReferenceProfiles(x, xi, smooth_coalbedo, params, D=None):
+    """Returns the heat transport [W] and heat flux convergence [W m^-2] at x
+    for the steady state with ice edge xi (a float), i.e. with Q = Q(x_i),
+    summing the Legendre series with NumPy."""
+    D = params.D if D is None else D
+    n = np.arange(0, params.nmax+1, 2)
+    Q = ReferenceQ(np.array([xi]), smooth_coalbedo, params, D)[0]
+    Hn = ReferenceHn(np.array([xi]), smooth_coalbedo, params)[0]
+    c = np.zeros(params.nmax+1)
+    c[n] = Q*Hn/(n*(n+1)*D + params.B)
+    c[0] -= params.A/params.B
+    dT = legendre.legval(x, legendre.legder(c))
+    d2T = legendre.legval(x, legendre.legder(c, 2))
+    HT = -2*np.pi*params.RE**2*D*(1-x**2)*dT
+    HFC = D*((1-x**2)*d2T - 2*x*dT)
+    return HT, HFC
+
+
+def RelativeError(value, reference):
+    """Returns the maximum absolute error of value relative to the maximum
+    absolute reference value (NaN values give an infinite error)."""
+    error = np.max(np.abs(np.asarray(value) - reference))/np.max(
+        np.abs(reference))
+    return np.inf if np.isnan(error) else error
+
+
+def Samples(n, m=9):
+    """Returns up to m evenly-spaced indices of an array of length n."""
+    return np.unique(np.linspace(0, n-1, min(m, n)).astype(int))
+
+
+###############################################################################
+### BENCHMARKS
+
+
+def ClearCaches():
+    """Empty the caches of H_n, Gauss-Legendre orders and spectral bases, so
+    that each timed call does all of its work."""
+    an.Hn_cache.Clear()
+    an._gauss_orders.clear()
+    spectral._basis_cache.clear()
+
+
+def _Label(smooth_coalbedo):
+    return 'smooth' if smooth_coalbedo else 'step'
+
+
+def AnalyticBenchmarks(sizes, nmax_values):
+    """Benchmarks of analytics.Q() on grids of sizes ice edges, and of
+    analytics.HeatTransport() and analytics.HeatFluxConvergence() on grids of
+    sizes points, for each truncation nmax and both coalbedos."""
+    benchmarks = []
+    for nmax in nmax_values:
+        for smooth in [False, True]:
+            params = pm.Current()._replace(nmax=nmax)
+            for size in sizes:
+                xi = np.linspace(0.0, 1.0, size)
+                j = Samples(size)
+                Q_ref = ReferenceQ(xi[j], smooth, params)
+    
+                def Q(xi=xi, smooth=smooth, params=params):
+                    ClearCaches()
+                    return an.Q(xi, None, smooth, params)
+    
+                benchmarks.append(Benchmark('analytics.Q[xi=%d,nmax=%d,%s]'
+                    % (size, nmax, _Label(smooth)), Q,
+                    lambda Q, j=j, Q_ref=Q_ref: RelativeError(Q[j], Q_ref),
+                    1E-9))
+    
+            xi = 0.95
+            Q = float(ReferenceQ(np.array([xi]), smooth, params)[0])
+            for size in sizes:
+                x = np.linspace(-1.0, 1.0, size)
+                j = Samples(size, 101)
+                HT_ref, HFC_ref = ReferenceProfiles(x[j], xi, smooth, params)
+    
+                def HT(x=x, xi=xi, Q=Q, smooth=smooth, params=params):
+                    ClearCaches()
+                    return an.HeatTransport(x, xi, Q, None, smooth, params)
+    
+                def HFC(x=x, xi=xi, Q=Q, smooth=smooth, params=params):
+                    ClearCaches()
+                    return an.HeatFluxConvergence(x, xi, Q, None, smooth,
+                        params)
+    
+                benchmarks.append(Benchmark(
+                    'analytics.HeatTransport[x=%d,nmax=%d,%s]' % (size, nmax,
+                    _Label(smooth)), HT,
+                    lambda HT, j=j, r=HT_ref: RelativeError(HT[j], r), 1E-9))
+                benchmarks.append(Benchmark(
+                    'analytics.HeatFluxConvergence[x=%d,nmax=%d,%s]' % (size,
+                    nmax, _Label(smooth)), HFC,
+                    lambda HFC, j=j, r=HFC_ref: RelativeError(HFC[j], r),
+                    1E-9))
+    return benchmarks
+
+
+def DiffusionBenchmarks(sizes, dense_max=1000, n_batch=100):
+    """Benchmarks of diffusion_scheme.SchemeMatrix() and
+    SolveDiffusionEquation() with N grid cells for each of sizes, in banded
+    form and (for N <= dense_max) dense form, and for a batch of n_batch
+    profiles each with its own (constant) diffusivity (for N*n_batch <=
+    dense_max**2).
+    
+    SchemeMatrix() is used with the EBM diffusivity k = D(1-x^2) on 0 < x < 1
+    and checked for conservation (zero column sums) and symmetry.
+    SolveDiffusionEquation() is used with k = 1 and an eigenmode of the
+    discrete operator, q_j = cos(pi x_j), whose backward-Euler step is exactly
+    q_j/(1 + (4 dt/h^2) sin^2(pi h/2)).
+    """
+    benchmarks = []
+    k = lambda x: pm.D*(1-x**2)
+    dt = 1E-3
+    for N in sizes:
+        for form in ['banded', 'dense']:
+            if form == 'dense' and N > dense_max:
+                continue
+    
+            def Matrix(N=N, form=form):
+                return ds.SchemeMatrix(N, k, form=form)
+    
+            def CheckMatrix(A, form=form):
+                # Each column of the banded form holds the non-zero elements
+                # of that column of A (see diffusion_scheme.BandedMatrix()):
+                sums = np.sum(A, axis=0)
+                if form == 'banded':
+                    asym = A[0,1:] - A[2,:-1]
+                else:
+                    asym = A - A.T
+                return max(np.max(np.abs(sums)),
+                    np.max(np.abs(asym)))/np.max(np.abs(A))
+    
+            benchmarks.append(Benchmark('diffusion_scheme.SchemeMatrix[N=%d,'
+                '%s]' % (N, form), Matrix, CheckMatrix, 1E-12))
+    
+            h = 1.0/N
+            x = h*(np.arange(N) + 0.5)
+            q_old = np.cos(np.pi*x)
+            q_ref = q_old/(1 + (4*dt/h**2)*np.sin(0.5*np.pi*h)**2)
+            zero = np.zeros(N)
+    
+            def Solve(N=N, form=form, q_old=q_old, zero=zero):
+                return ds.SolveDiffusionEquation(q_old, zero, zero,
+                    lambda x: 1.0 + 0*x, dt, banded=(form == 'banded'))
+    
+            benchmarks.append(Benchmark(
+                'diffusion_scheme.SolveDiffusionEquation[N=%d,%s]' % (N,
+                form), Solve, lambda q, r=q_ref: RelativeError(q, r), 1E-10))
+    
+        if N*n_batch > dense_max**2:
+            continue
+        h = 1.0/N
+        x = h*(np.arange(N) + 0.5)
+        kappa = np.linspace(0.5, 1.5, n_batch)[:,np.newaxis]
+        q_old = np.tile(np.cos(np.pi*x), (n_batch, 1))
+        q_ref = q_old/(1 + kappa*(4*dt/h**2)*np.sin(0.5*np.pi*h)**2)
+        zero = np.zeros(N)
+    
+        def SolveBatch(N=N, q_old=q_old, zero=zero, kappa=kappa):
+            return ds.SolveDiffusionEquation(q_old, zero, zero,
+                kappa*np.ones(N+1), dt)
+    
+        benchmarks.append(Benchmark(
+            'diffusion_scheme.SolveDiffusionEquation[N=%d,batch=%d]' % (N,
+            n_batch), SolveBatch, lambda q, r=q_ref: RelativeError(q, r),
+            1E-10))
+    return benchmarks
+
+
+def PlottingBenchmarks():
+    """Benchmarks of plotting.PlotHFCIceEdge() (including drawing the figure)
+    for both coalbedos, checking the plotted heat flux convergence at the ice
+    edge for each D."""
+    benchmarks = []
+    params = pm.Current()
+    relative_D = np.array([0.75, 1.0, 1.25])
+    xi = np.arange(0.0, 1.001, 0.01)
+    j = Samples(len(xi), 6)
+    for smooth in [False, True]:
+        HFC_ref = np.array([[ReferenceProfiles(xi[k], xi[k], smooth, params,
+            D*params.D)[1] for k in j] for D in relative_D])
+    
+        def Plot(smooth=smooth):
+            ClearCaches()
+            fig, ax = pl.PlotHFCIceEdge(relative_D, smooth, params=params)
+            fig.canvas.draw()
+            HFC = np.array([line.get_ydata() for line in ax.lines[1:]])
+            plt.close(fig)
+            return HFC
+    
+        benchmarks.append(Benchmark('plotting.PlotHFCIceEdge[%s]'
+            % _Label(smooth), Plot,
+            lambda HFC, r=HFC_ref: RelativeError(HFC[:,j], r), 1E-9))
+    return benchmarks
+
+
+###############################################################################
+### RUNNING AND COMPARISON WITH THE BASELINE
+
+
+def Time(function, min_time=0.2, repeat=3):
+    """Returns (time, result): the shortest time per call [s] of function,
+    over repeat batches of calls each lasting at least min_time (or a single
+    call, if longer), and the result of the last call."""
+    number = 1
+    while True:
+        t0 = time.time()
+        for k in xrange(number):
+            result = function()
+        t = time.time() - t0
+        if t >= min_time or number >= 10000:
+            break
+        number *= 10
+    times = [t/number]
+    for r in xrange(repeat-1):
+        t0 = time.time()
+        for k in xrange(number):
+            result = function()
+        times.append((time.time() - t0)/number)
+    return min(times), result
+
+
+def Sample(result):
+    """Returns a list of up to n_values values from a result (an array, or a
+    tuple of arrays) to be recorded in the baseline."""
+    if isinstance(result, tuple):
+        result = np.concatenate([np.ravel(r) for r in result])
+    result = np.ravel(result)
+    return [float(v) for v in result[Samples(len(result), n_values)]]
+
+
+def LoadBaseline(filename):
+    """Returns the dictionary of baseline results in filename (empty if it
+    does not exist or is from a different baseline_version)."""
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as f:
+        baseline = json.load(f)
+    if baseline.get('version') != baseline_version:
+        return {}
+    return baseline['results']
+
+
+def SaveBaseline(filename, results):
+    """Save the dictionary of results to the baseline file filename."""
+    with open(filename, 'w') as f:
+        json.dump({'version': baseline_version, 'machine': platform.node(),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results},
+            f, indent=1, sort_keys=True)
+
+
+def Compare(entry, old, threshold):
+    """Returns a list of the flags raised for a benchmark result entry
+    compared with its baseline entry old (if any)."""
+    flags = []
+    if not entry['error'] <= entry['tol']:
+        flags.append('INACCURATE')
+    if old is not None:
+        if entry['time'] > threshold*old['time']:
+            flags.append('SLOWER')
+        new_values = np.array(entry['values']); old_values = np.array(
+            old['values'])
+        if new_values.shape != old_values.shape or not np.allclose(
+            new_values, old_values, rtol=values_tol, atol=0.0,
+            equal_nan=True):
+            flags.append('CHANGED')
+    return flags
+
+
+def main(quick=False, update=False, threshold=default_threshold,
+    baseline_file=default_baseline, only=None):
+    
+    if quick:
+        sizes = [100, 1000]; nmax_values = [6, 20]
+    else:
+        sizes = [100, 1000, 10000, 100000]; nmax_values = [6, 20, 100]
+    
+    print "Setting up benchmarks (calculating reference values)..."
+    benchmarks = (AnalyticBenchmarks(sizes, nmax_values)
+        + DiffusionBenchmarks(sizes) + PlottingBenchmarks())
+    if only is not None:
+        benchmarks = [b for b in benchmarks if only in b.name]
+    
+    baseline = LoadBaseline(baseline_file)
+    results = dict(baseline)
+    n_flagged = 0
+    print "%-56s %10s %10s %6s %8s  %s" % ('Benchmark', 'Time [s]',
+        'Baseline', 'Ratio', 'Error', 'Flags')
+    for b in benchmarks:
+        with np.errstate(all='ignore'):
+            t, result = Time(b.function)
+            error = b.check(result)
+        entry = {'time': t, 'error': error, 'tol': b.tol,
+            'values': Sample(result)}
+        old = baseline.get(b.name)
+        flags = Compare(entry, old, threshold)
+        n_flagged += len(flags) > 0
+        print "%-56s %10.3e %10s %6s %8.1e  %s" % (b.name, t,
+            '-' if old is None else '%10.3e' % old['time'],
+            '-' if old is None else '%6.2f' % (t/old['time']), error,
+            ' '.join(flags))
+        sys.stdout.flush()
+        if update or old is None:
+            results[b.name] = entry
+    
+    if update or len(results) > len(baseline):
+        SaveBaseline(baseline_file, results)
+        print "Baseline written to %s" % baseline_file
+    print "%d of %d benchmarks flagged" % (n_flagged, len(benchmarks))
+    return n_flagged
+
+
+if __name__ == '__main__':
+    options = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    n_flagged = main(quick=('quick' in sys.argv), update=('update' in
+        sys.argv), threshold=float(options.get('threshold',
+        default_threshold)), baseline_file=options.get('baseline',
+        default_baseline), only=options.get('only'))
+    sys.exit(1 if n_flagged > 0 else 0)
@@ -0,0 +1,400 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the analytic solution (analytics.py) against a scalar reference
+### implementation of North et al. (1981), evaluating one term of the
+### expansion at a time as the original functions did, and of its exact
+### derivatives against finite differences; and of the truncation of the
+### expansion at large or adaptively-chosen degree.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+import scipy.special as spec, scipy.integrate as integrate
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an
+
+
+# Values of ReferenceHn() already calculated (by adaptive quadrature, for the
+# smoothed coalbedo):
+_reference_Hn = {}
+
+
+def ReferenceHn(n, xi, smooth_coalbedo, params):
+    """H_n(x_i) for scalar xi (North et al. 1981 eq (29))."""
+    p = params
+    if smooth_coalbedo:
+        key = (n, float(xi), p)
+        if key not in _reference_Hn:
+            a1 = 0.5*(p.ai+p.af); a2 = 0.5*(p.ai-p.af)
+            integrand = lambda x: ((2*n+1)*spec.legendre(n)(x)*(
+                1+p.S2*spec.legendre(2)(x))*(a1+a2*spec.erf((x-xi)
+                /p.delta_x)))
+            _reference_Hn[key] = integrate.quad(integrand, 0.0, 1.0,
+                epsabs=1E-12)[0]
+        return _reference_Hn[key]
+    integrand = spec.legendre(n)*(1.0 + p.S2*spec.legendre(2))
+    I = np.polyint(integrand)
+    return (2*n+1)*(p.af*(I(xi) - I(0)) + p.ai*(I(1) - I(xi)))
+
+
+def ReferenceTn(n, xi, Q, D, smooth_coalbedo, params):
+    """T_n for scalar xi, Q and D (North et al. 1981 eq (30))."""
+    Ln = n*(n+1)*D + params.B
+    return (Q*ReferenceHn(n, xi, smooth_coalbedo, params)/Ln
+        - (n==0)*(params.A/params.B))
+
+
+def ReferenceQ(xi, D, smooth_coalbedo, params):
+    """Q(x_i) for scalar xi and D (North et al. 1981 eq (37))."""
+    total = 0.0
+    for n in xrange(0, params.nmax+2, 2):
+        total += (ReferenceHn(n, xi, smooth_coalbedo, params)
+            *spec.legendre(n)(xi)/(n*(n+1)*D + params.B))
+    return (params.A + params.B*params.T_ice_edge)/(params.B*total)
+
+
+def ReferenceProfiles(x, xi, Q, D, smooth_coalbedo, params):
+    """Returns the temperature, heat flux convergence and heat transport at
+    scalar x for scalar xi, Q and D."""
+    T = 0.0; dT = 0.0; d2T = 0.0
+    for n in xrange(0, params.nmax+2, 2):
+        T_n = ReferenceTn(n, xi, Q, D, smooth_coalbedo, params)
+        P = spec.legendre(n)
+        T += T_n*P(x)
+        dT += T_n*np.polyder(P, m=1)(x)
+        d2T += T_n*np.polyder(P, m=2)(x)
+    HFC = D*((1-x**2)*d2T - 2*x*dT)
+    HT = -2*np.pi*D*params.RE**2*(1-x**2)*dT
+    return T, HFC, HT
+
+
+class VectorisedTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+        self.xi = np.array([0.05, 0.3, 0.61, 0.9, 0.97])
+        self.x = np.array([0.0, 0.2, 0.5, 0.8, 1.0])
+        self.D = self.params.D*np.array([0.5, 1.0, 1.5])
+    
+    def assertClose(self, a, b, rtol):
+        self.assertEqual(np.shape(a), np.shape(b))
+        self.assertTrue(np.all(abs(a - b) <= rtol*np.max(abs(b))),
+            msg='maximum relative difference %g'
+            % (np.max(abs(a - b))/np.max(abs(b))))
+    
+    def testQ(self):
+        # Q(xi[:,np.newaxis], D[np.newaxis,:]) gives one value per pair:
+        for smooth_coalbedo, rtol in [(False, 1E-12), (True, 1E-8)]:
+            Q = an.Q(self.xi[:,np.newaxis], self.D[np.newaxis,:],
+                smooth_coalbedo, self.params)
+            Q_ref = np.array([[ReferenceQ(xi, D, smooth_coalbedo,
+                self.params) for D in self.D] for xi in self.xi])
+            self.assertClose(Q, Q_ref, rtol)
+            self.assertClose(an.Q(self.xi, None, smooth_coalbedo,
+                self.params), Q_ref[:,1], rtol)
+            self.assertEqual(np.shape(an.Q(0.5, params=self.params)), ())
+    
+    def testTn(self):
+        Q = self.params.Q*np.array([0.9, 1.1])
+        for smooth_coalbedo, rtol in [(False, 1E-12), (True, 1E-8)]:
+            for n in [0, 2, 6]:
+                T_n = an.Tn(n, self.xi[:,np.newaxis], Q[np.newaxis,:],
+                    smooth_coalbedo=smooth_coalbedo, params=self.params)
+                T_n_ref = np.array([[ReferenceTn(n, xi, Q_j, self.params.D,
+                    smooth_coalbedo, self.params) for Q_j in Q]
+                    for xi in self.xi])
+                self.assertClose(T_n, T_n_ref, rtol)
+    
+    def testProfiles(self):
+        # Temperature, HFC and heat transport: one profile per ice edge, or
+        # per value of D:
+        functions = [an.Temperature, an.HeatFluxConvergence,
+            an.HeatTransport]
+        for smooth_coalbedo, rtol in [(False, 1E-11), (True, 1E-8)]:
+            reference = np.array([[ReferenceProfiles(x, xi, self.params.Q,
+                self.params.D, smooth_coalbedo, self.params) for x in self.x]
+                for xi in self.xi])
+            for j, function in enumerate(functions):
+                values = function(self.x[np.newaxis,:],
+                    self.xi[:,np.newaxis], smooth_coalbedo=smooth_coalbedo,
+                    params=self.params)
+                self.assertClose(values, reference[...,j], rtol)
+            reference = np.array([[ReferenceProfiles(x, 0.9, self.params.Q,
+                D, smooth_coalbedo, self.params) for x in self.x]
+                for D in self.D])
+            for j, function in enumerate(functions):
+                values = function(self.x, 0.9, D=self.D[:,np.newaxis],
+                    smooth_coalbedo=smooth_coalbedo, params=self.params)
+                self.assertClose(values, reference[...,j], rtol)
+    
+    def testScalar(self):
+        # Scalar arguments give scalar results:
+        for function in [an.Temperature, an.HeatFluxConvergence,
+            an.HeatTransport]:
+            value = function(0.5, 0.9, params=self.params)
+            self.assertEqual(np.shape(value), ())
+            self.assertAlmostEqual(float(value), float(function(
+                np.array([0.5]), 0.9, params=self.params)[0]), places=10)
+
+
+
+class HnSmoothCoalbedoTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.params = pm.Current()
+    
+    def testAgainstQuad(self):
+        # The Gauss-Legendre rule agrees with adaptive quadrature to within
+        # its tolerance, including for narrow smoothing and many terms:
+        for params, tol in [(self.params, None),
+            (self.params._replace(delta_x=0.01, nmax=20), None),
+            (self.params._replace(delta_x=0.01, nmax=20), 1E-5)]:
+            tol_Hn = params.Hn_tol if tol is None else tol
+            self.assertTrue(an.CheckHnSmoothCoalbedo(tol=tol, params=params)
+                < max(tol_Hn, 1E-10))
+    
+    def testDefault(self):
+        # Hn_smooth_coalbedo() uses the Gauss-Legendre rule by default, and
+        # the quadrature otherwise:
+        xi = np.linspace(0.0, 1.0, 7)
+        Hn = an.Hn_smooth_coalbedo_gauss([0, 2, 4], xi, params=self.params)
+        for j, n in enumerate([0, 2, 4]):
+            self.assertTrue(np.all(an.Hn_smooth_coalbedo(n, xi,
+                params=self.params) == Hn[:,j]))
+            Hn_quad = an.Hn_smooth_coalbedo(n, xi, 'quad', self.params)
+            self.assertTrue(np.max(abs(Hn_quad - Hn[:,j])) < 1E-10)
+            self.assertAlmostEqual(float(an.Hn_smooth_coalbedo(n, 0.4,
+                'quad', self.params)), ReferenceHn(n, 0.4, True,
+                self.params), places=12)
+    
+    def testChunks(self):
+        # The result does not depend on how xi is split into chunks:
+        xi = np.linspace(0.0, 1.0, 50).reshape(5, 10)
+        Hn = an.Hn_smooth_coalbedo_gauss([0, 2, 4, 6], xi, params=self.params)
+        self.assertEqual(Hn.shape, (5, 10, 4))
+        an.Hn_cache.Clear()
+        Hn_chunks = an.Hn_smooth_coalbedo_gauss([0, 2, 4, 6], xi,
+            chunk_size=3, params=self.params)
+        self.assertTrue(np.max(abs(Hn_chunks - Hn)) < 1E-14)
+
+
+
+class AnalyticSolutionTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.params = pm.Current()
+        self.xi = np.linspace(0.1, 0.95, 6)
+        self.x = np.linspace(0.0, 1.0, 11)
+    
+    def testReuse(self):
+        # H_n is calculated on construction only; other values of Q and D
+        # reuse it (so that the cache of H_n is not consulted):
+        for smooth_coalbedo in [False, True]:
+            solution = an.AnalyticSolution(self.xi, smooth_coalbedo,
+                self.params)
+            info = an.HnCacheInfo()
+            Q_xi = []
+            for f in [0.5, 1.0, 2.0]:
+                D = f*self.params.D; Q = f*self.params.Q
+                Q_xi.append(solution.Q(D))
+                T = solution.Temperature(self.x[:,np.newaxis], Q, D)
+                self.assertEqual(T.shape, (len(self.x), len(self.xi)))
+                solution.HeatTransport(self.x[:,np.newaxis], Q, D)
+                solution.HeatFluxConvergence(self.x[:,np.newaxis], Q, D)
+            self.assertEqual(an.HnCacheInfo()['hits'], info['hits'])
+            self.assertEqual(an.HnCacheInfo()['misses'], info['misses'])
+            for f, Q in zip([0.5, 1.0, 2.0], Q_xi):
+                self.assertTrue(np.all(Q == an.Q(self.xi, f*self.params.D,
+                    smooth_coalbedo, self.params)))
+    
+    def testAgainstReference(self):
+        solution = an.AnalyticSolution(0.7, params=self.params)
+        for f in [0.5, 2.0]:
+            D = f*self.params.D; Q = f*self.params.Q
+            T_n = solution.TnCoefficients(Q, D)
+            for j, n in enumerate(solution.n):
+                self.assertAlmostEqual(T_n[j], ReferenceTn(n, 0.7, Q, D,
+                    False, self.params), places=10)
+            self.assertAlmostEqual(float(solution.Q(D)), ReferenceQ(0.7, D,
+                False, self.params), places=9)
+    
+    def testLinearInQ(self):
+        # T + A/B is proportional to Q, and the heat transport and HFC are
+        # proportional to Q:
+        solution = an.AnalyticSolution(self.xi[:,np.newaxis],
+            params=self.params)
+        p = self.params
+        T1 = solution.Temperature(self.x, p.Q) + p.A/p.B
+        T2 = solution.Temperature(self.x, 2*p.Q) + p.A/p.B
+        self.assertTrue(np.max(abs(T2 - 2*T1)) < 1E-10)
+        for function in [solution.HeatTransport,
+            solution.HeatFluxConvergence]:
+            value = function(self.x, p.Q)
+            self.assertTrue(np.max(abs(function(self.x, 3*p.Q) - 3*value))
+                <= 1E-12*np.max(abs(value)))
+    
+    def testBroadcast(self):
+        # Q and D broadcast against xi:
+        solution = an.AnalyticSolution(self.xi, params=self.params)
+        D = self.params.D*np.array([0.5, 1.0, 2.0])[:,np.newaxis]
+        Q = solution.Q(D)
+        self.assertEqual(Q.shape, (3, len(self.xi)))
+        for j in xrange(3):
+            self.assertTrue(np.all(Q[j] == solution.Q(D[j,0])))
+        T_n = solution.TnCoefficients(Q, D)
+        self.assertEqual(T_n.shape, (3, len(self.xi), len(solution.n)))
+
+
+
+class DerivativeTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.params = pm.Current()
+        self.xi = np.array([0.3, 0.7, 0.95])
+        self.x = np.linspace(0.0, 1.0, 6)
+    
+    def FiniteDifference(self, function, name, smooth_coalbedo):
+        """Returns the central difference of function(xi, Q, D, params) with
+        respect to the parameter name."""
+        p = self.params
+        values = {'xi': self.xi, 'Q': p.Q, 'D': p.D}
+        value = values[name] if name in values else getattr(p, name)
+        h = 1E-6*np.max(abs(value))
+        result = []
+        for sign in [1, -1]:
+            args = dict(values)
+            if name in values:
+                args[name] = value + sign*h
+                args['params'] = p
+            else:
+                args['params'] = p._replace(**{name: value + sign*h})
+            result.append(function(smooth_coalbedo=smooth_coalbedo, **args))
+        return (result[0] - result[1]) / (2*h)
+    
+    def assertDerivatives(self, value, derivatives, function,
+        smooth_coalbedo, names=an.derivative_parameters):
+        self.assertEqual(sorted(derivatives), sorted(names))
+        self.assertTrue(np.max(abs(value - function(self.xi, self.params.Q,
+            self.params.D, smooth_coalbedo, self.params))) < 1E-9*np.max(
+            abs(value)))
+        for name in names:
+            reference = self.FiniteDifference(function, name, smooth_coalbedo)
+            self.assertEqual(np.shape(derivatives[name]), np.shape(value))
+            self.assertTrue(np.max(abs(derivatives[name] - reference))
+                <= 1E-5*max(np.max(abs(reference)), 1E-10),
+                msg='d/d%s, smooth_coalbedo = %s' % (name, smooth_coalbedo))
+    
+    def testTn(self):
+        for smooth_coalbedo in [False, True]:
+            T_n, dT_n = an.TnDerivatives(self.xi[:,np.newaxis],
+                smooth_coalbedo=smooth_coalbedo, params=self.params)
+            function = lambda xi, Q, D, smooth_coalbedo, params: \
+                an.TnCoefficients(xi[:,np.newaxis], Q, D, smooth_coalbedo,
+                params)
+            self.assertDerivatives(T_n, dT_n, function, smooth_coalbedo)
+    
+    def testQ(self):
+        # Q(x_i) does not depend on Q:
+        for smooth_coalbedo in [False, True]:
+            Q, dQ = an.QDerivatives(self.xi, smooth_coalbedo=smooth_coalbedo,
+                params=self.params)
+            function = lambda xi, Q, D, smooth_coalbedo, params: an.Q(xi, D,
+                smooth_coalbedo, params)
+            names = [name for name in an.derivative_parameters if name != 'Q']
+            self.assertDerivatives(Q, dQ, function, smooth_coalbedo, names)
+    
+    def testProfiles(self):
+        for smooth_coalbedo in [False, True]:
+            for derivatives, function in [
+                (an.TemperatureDerivatives, an.Temperature),
+                (an.HeatFluxConvergenceDerivatives, an.HeatFluxConvergence),
+                (an.HeatTransportDerivatives, an.HeatTransport)]:
+                value, dvalue = derivatives(self.x[:,np.newaxis], self.xi,
+                    smooth_coalbedo=smooth_coalbedo, params=self.params)
+                self.assertEqual(np.shape(value), (len(self.x),
+                    len(self.xi)))
+                self.assertDerivatives(value, dvalue, lambda xi, Q, D,
+                    smooth_coalbedo, params: function(self.x[:,np.newaxis],
+                    xi, Q, D, smooth_coalbedo, params), smooth_coalbedo)
+
+
+
+def GaussHnStep(n, xi, params):
+    """H_n(x_i) for the step coalbedo and scalar xi, by Gauss-Legendre
+    quadrature on either side of xi (exact, as the integrand is a polynomial
+    of degree n+2), with P_n evaluated by its recurrence."""
+    p = params
+    nodes, weights = np.polynomial.legendre.leggauss(n//2 + 3)
+    total = 0.0
+    for a, b, coalbedo in [(0.0, xi, p.af), (xi, 1.0, p.ai)]:
+        x = 0.5*(b-a)*nodes + 0.5*(a+b)
+        total += 0.5*(b-a)*coalbedo*np.sum(weights*spec.eval_legendre(n, x)
+            *(1 + p.S2*spec.eval_legendre(2, x)))
+    return (2*n+1)*total
+
+
+class TruncationTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.params = pm.Current()
+        self.xi = np.array([0.0, 0.25, 0.6, 0.93, 1.0])
+    
+    def testLargeDegree(self):
+        # The step-coalbedo H_n are accurate for large n (for which
+        # integrating the power series of P_n loses all precision):
+        n = np.arange(0, 402, 2)
+        Hn = an.Hn_step_coalbedo(n, self.xi, self.params)
+        self.assertEqual(Hn.shape, (len(self.xi), len(n)))
+        self.assertTrue(np.all(np.isfinite(Hn)))
+        for i, xi in enumerate(self.xi):
+            for j in [0, 1, 3]:
+                self.assertAlmostEqual(Hn[i,j], ReferenceHn(n[j], xi, False,
+                    self.params), places=12)
+            for j in [10, 50, 100, 200]:
+                self.assertTrue(abs(Hn[i,j] - GaussHnStep(n[j], xi,
+                    self.params)) < 1E-11, msg='n = %d, xi = %g' % (n[j], xi))
+        self.assertTrue(np.all(an.Hn_step_coalbedo(40, self.xi, self.params)
+            == Hn[:,20]))
+    
+    def testFixed(self):
+        # With no tolerances, the truncation is params.nmax:
+        nmax, Hn = an.AdaptiveNmax(self.xi, params=self.params)
+        self.assertEqual(nmax, self.params.nmax)
+        self.assertEqual(an.AnalyticSolution(self.xi,
+            params=self.params).params.nmax, self.params.nmax)
+    
+    def testTolerances(self):
+        # The chosen truncation is within the tolerances of a much finer one,
+        # for Q(x_i) and for T(x):
+        x = np.linspace(0.0, 1.0, 101)
+        xi = np.linspace(0.05, 0.95, 7)
+        for smooth_coalbedo in [False, True]:
+            for Q_tol, T_tol in [(1E-3, 0.0), (0.0, 1E-2), (1E-4, 1E-3)]:
+                params = self.params._replace(nmax_Q_tol=Q_tol,
+                    nmax_T_tol=T_tol)
+                solution = an.AnalyticSolution(xi, smooth_coalbedo, params)
+                nmax = solution.params.nmax
+                self.assertEqual(nmax, an.AdaptiveNmax(xi, smooth_coalbedo,
+                    params)[0])
+                self.assertTrue(self.params.nmax <= nmax < params.nmax_limit)
+                fine = self.params._replace(nmax=4*nmax)
+                Q = solution.Q()
+                self.assertTrue(Q_tol == 0 or np.max(abs(Q - an.Q(xi, None,
+                    smooth_coalbedo, fine))) < Q_tol)
+                T = solution.Temperature(x[:,np.newaxis], Q)
+                self.assertTrue(T_tol == 0 or np.max(abs(T - an.Temperature(
+                    x[:,np.newaxis], xi, Q, None, smooth_coalbedo, fine)))
+                    < T_tol)
+        
+        # Tighter tolerances need more terms:
+        nmax = [an.AdaptiveNmax(xi, params=self.params._replace(
+            nmax_Q_tol=Q_tol))[0] for Q_tol in [1E-2, 1E-4, 1E-6]]
+        self.assertTrue(nmax[0] < nmax[1] < nmax[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
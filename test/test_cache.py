@@ -0,0 +1,115 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the bounded memoization cache (cache.py) and of its use for the
+### H_n(x_i) terms of the analytic solution (analytics.Hn_cache).
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, cache
+
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+    
+    def Square(self, x):
+        self.calls.append(x)
+        return x**2
+    
+    def testHitsAndMisses(self):
+        c = cache.Cache(4)
+        for x in [1, 2, 1, 1, 3]:
+            self.assertEqual(c.Get(x, self.Square, x), x**2)
+        self.assertEqual(self.calls, [1, 2, 3])
+        info = c.Info()
+        self.assertEqual((info['hits'], info['misses'], info['size']),
+            (2, 3, 3))
+        self.assertAlmostEqual(info['hit_rate'], 0.4)
+    
+    def testEviction(self):
+        # Least-recently used, or oldest, entries are evicted first:
+        for policy, kept in [('lru', [1, 3]), ('fifo', [2, 3])]:
+            c = cache.Cache(2, policy)
+            for x in [1, 2, 1, 3]:
+                c.Get(x, self.Square, x)
+            self.assertEqual(sorted(c._data), kept)
+        self.assertRaises(ValueError, cache.Cache, 2, 'random')
+    
+    def testResizeAndClear(self):
+        c = cache.Cache(4)
+        for x in xrange(4):
+            c.Get(x, self.Square, x)
+        c.Resize(2)
+        self.assertEqual(list(c._data), [2, 3])
+        c.Clear()
+        self.assertEqual(c.Info()['size'], 0)
+        self.assertEqual(c.Info()['misses'], 0)
+        c.Resize(0) # disables caching
+        for x in [1, 1]:
+            c.Get(x, self.Square, x)
+        self.assertEqual(self.calls[-2:], [1, 1])
+        self.assertEqual(c.Info()['size'], 0)
+    
+    def testReadOnly(self):
+        # Cached arrays cannot be modified by the caller:
+        c = cache.Cache(4)
+        value = c.Get('a', np.arange, 3.0)
+        self.assertRaises(ValueError, value.__setitem__, 0, 1.0)
+    
+    def testArrayKey(self):
+        x = np.linspace(0.0, 1.0, 5)
+        self.assertEqual(cache.ArrayKey(x), cache.ArrayKey(x.copy()))
+        self.assertEqual(cache.ArrayKey(0.5), cache.ArrayKey(np.float64(0.5)))
+        self.assertNotEqual(cache.ArrayKey(x), cache.ArrayKey(x[::-1]))
+        self.assertNotEqual(cache.ArrayKey(x), cache.ArrayKey(x.reshape(5, 1)))
+        self.assertEqual(hash(cache.ArrayKey(x)), hash(cache.ArrayKey(x+0.0)))
+
+
+class HnCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+        self.xi = np.linspace(0.0, 1.0, 11)
+        an.Hn_cache.Clear()
+    
+    def testKey(self):
+        # Equal values of xi hit the cache, whichever array holds them:
+        for smooth_coalbedo in [False, True]:
+            Hn = an.HnCoefficients(self.xi, smooth_coalbedo, self.params)
+            misses = an.HnCacheInfo()['misses']
+            Hn_again = an.HnCoefficients(self.xi.copy(), smooth_coalbedo,
+                self.params)
+            self.assertTrue(Hn_again is Hn)
+            self.assertEqual(an.HnCacheInfo()['misses'], misses)
+    
+    def testInvalidation(self):
+        # Changing any parameter that H_n depends on gives a new value rather
+        # than a stale one; parameters it does not depend on hit the cache:
+        for smooth_coalbedo, names in [(False, ['ai', 'af', 'S2']),
+            (True, ['ai', 'af', 'S2', 'delta_x'])]:
+            Hn = an.HnCoefficients(self.xi, smooth_coalbedo, self.params)
+            for name in names:
+                params = self.params._replace(**{name: 1.1*getattr(
+                    self.params, name)})
+                an.Hn_cache.Clear()
+                Hn_ref = an.HnCoefficients(self.xi, smooth_coalbedo, params)
+                an.Hn_cache.Clear()
+                an.HnCoefficients(self.xi, smooth_coalbedo, self.params)
+                Hn_new = an.HnCoefficients(self.xi, smooth_coalbedo, params)
+                self.assertTrue(np.all(Hn_new == Hn_ref), msg=name)
+                self.assertFalse(np.all(Hn_new == Hn), msg=name)
+            info = an.HnCacheInfo()
+            an.HnCoefficients(self.xi, smooth_coalbedo,
+                self.params._replace(D=2.0, A=200.0, Q=300.0))
+            self.assertEqual(an.HnCacheInfo()['hits'], info['hits'] + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
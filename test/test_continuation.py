@@ -0,0 +1,119 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the continuation of the solution branch and of the location and
+### tracking of its folds (continuation.py), against scans of dQ/dx_i on a
+### fine grid of x_i.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, continuation as ct
+
+
+def ScanFolds(D, smooth_coalbedo, params, n=50001):
+    """Returns the x_i of the sign changes of dQ/dx_i on a grid of n points
+    in 0 < x_i < 1 (to within 1/(n-1))."""
+    xi = np.linspace(0.0, 1.0, n)
+    dQ = ct.dQdxi(xi, D, smooth_coalbedo, params)
+    j = np.nonzero(np.sign(dQ[1:]) != np.sign(dQ[:-1]))[0]
+    return 0.5*(xi[j] + xi[j+1])
+
+
+class FindFoldsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+    
+    def testDefaultFolds(self):
+        folds = ct.FindFolds(params=self.params)[0]
+        self.assertEqual([f.kind for f in folds], ['minimum', 'maximum'])
+        for fold, xi, Q in zip(folds, [0.610603, 0.947578],
+            [309.4799, 318.4381]):
+            self.assertAlmostEqual(fold.xi, xi, places=5)
+            self.assertAlmostEqual(fold.Q, Q, places=3)
+            self.assertTrue(abs(ct.dQdxi(fold.xi, params=self.params))
+                < 1E-6)
+    
+    def testBranches(self):
+        # The sections of the branch alternate in stability, with Q monotonic
+        # on each:
+        folds, branches = ct.FindFolds(params=self.params)
+        self.assertEqual(len(branches), len(folds)+1)
+        self.assertEqual([b.stable for b in branches], [False, True, False])
+        for branch in branches:
+            dQ = np.diff(branch.Q)
+            self.assertTrue(np.all(dQ > 0) if branch.stable else
+                np.all(dQ < 0))
+    
+    def testAgainstScan(self):
+        # Including the close pairs of folds near the cusp (D ~ 1.503 D0 for
+        # the step coalbedo), where the branch is nearly vertical:
+        D0 = self.params.D
+        cases = [(False, f, 50001) for f in [0.5, 1.0, 1.3, 1.45, 1.47,
+            1.49, 1.5, 1.502, 1.51, 1.55, 2.0]] + [(True, f, 20001) for f in
+            [1.0, 1.47]]
+        for smooth_coalbedo, f, n in cases:
+            xi_scan = ScanFolds(f*D0, smooth_coalbedo, self.params, n)
+            folds = ct.FindFolds(f*D0, smooth_coalbedo, params=self.params)[0]
+            self.assertEqual(len(folds), len(xi_scan),
+                msg='D = %g D0, smooth_coalbedo = %s' % (f, smooth_coalbedo))
+            for fold, xi in zip(folds, xi_scan):
+                self.assertTrue(abs(fold.xi - xi) < 1.0/(n-1))
+
+
+class TrackFoldsTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.params = pm.Current()
+    
+    def testEmpty(self):
+        self.assertEqual(ct.TrackFolds([], params=self.params), [])
+    
+    def testCusp(self):
+        # The pair of folds merges at a cusp at D ~ 1.5025 D0, which is found
+        # whichever direction D is varied in:
+        D0 = self.params.D
+        for relative_D in [np.arange(1.40, 1.605, 0.01),
+            np.arange(1.60, 1.395, -0.01)]:
+            curves = ct.TrackFolds(relative_D*D0, params=self.params)
+            self.assertEqual(sorted(c.kind for c in curves), ['maximum',
+                'minimum'])
+            for k, D in enumerate(relative_D*D0):
+                folds = ct.FindFolds(D, params=self.params)[0]
+                xi = sorted(c.xi[k] for c in curves if not np.isnan(c.xi[k]))
+                self.assertEqual(len(xi), len(folds))
+                for fold, xi_k in zip(folds, xi):
+                    self.assertAlmostEqual(fold.xi, xi_k, places=8)
+            cusp = curves[0].cusps[0]
+            self.assertEqual(curves[1].cusps, [cusp])
+            self.assertTrue(abs(cusp.p/D0 - 1.5025) < 1E-3)
+            self.assertTrue(abs(relative_D[cusp.index-1] - 1.505) < 0.01 and
+                abs(relative_D[cusp.index] - 1.505) < 0.01)
+            for c in curves:
+                finite = ~np.isnan(c.xi)
+                self.assertTrue(abs(c.xi[finite][np.argmin(abs(c.p[finite] -
+                    cusp.p))] - cusp.xi) < 0.01)
+    
+    def testNewFolds(self):
+        # For the smoothed coalbedo, a new pair of folds appears at
+        # D ~ 1.046 D0, in addition to the fold tracked from the start:
+        D0 = self.params.D
+        relative_D = np.arange(1.0, 1.125, 0.02)
+        curves = ct.TrackFolds(relative_D*D0, smooth_coalbedo=True,
+            params=self.params)
+        self.assertEqual(len(curves), 3)
+        counts = np.sum([~np.isnan(c.xi) for c in curves], axis=0)
+        self.assertEqual(list(counts), [1, 1, 1, 3, 3, 3, 3])
+        new = [c for c in curves if c.cusps]
+        self.assertEqual(len(new), 2)
+        self.assertEqual(new[0].cusps, new[1].cusps)
+        self.assertTrue(abs(new[0].cusps[0].p/D0 - 1.046) < 1E-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
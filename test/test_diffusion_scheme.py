@@ -0,0 +1,220 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the numerical scheme for the diffusion equation
+### (diffusion_scheme.py): the banded (tridiagonal) solution against the dense
+### matrix inverse, the diffusion operator against an element-by-element
+### construction and the integrator against repeated single steps.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import diffusion_scheme as ds
+
+
+def Diffusivity(x):
+    """A diffusivity which varies in x, similar to that of the EBM."""
+    return 0.6*(1 - x**2) + 0.1
+
+
+def ReferenceSchemeMatrix(N, k, L=1.0):
+    """The matrix of the diffusion operator, built element by element with k
+    evaluated at one face at a time."""
+    h = L / N
+    A = np.zeros( (N, N) )
+    for i in xrange(1, N-1):
+        for j in xrange(0, N):
+            A[i][j] = (i==(j+1)) * k((j+1)*h) + \
+                      (i==(j-1)) * k(j*h) + \
+                      ( i == j ) * -(k((j+1)*h) + k(j*h))
+    A[0][0] = -k(h)
+    A[0][1] = k(h)
+    A[N-1][N-2] = k((N-1)*h)
+    A[N-1][N-1] = -k((N-1)*h)
+    return A / h**2
+
+
+class SchemeMatrixTests(unittest.TestCase):
+    
+    def testAgainstReference(self):
+        for N, L in [(3, 1.0), (20, 1.0), (31, 2.0)]:
+            A_ref = ReferenceSchemeMatrix(N, Diffusivity, L)
+            A = ds.SchemeMatrix(N, Diffusivity, L)
+            self.assertTrue(np.max(abs(A - A_ref)) < 1E-12*np.max(abs(A_ref)))
+            self.assertTrue(np.all(ds.SchemeMatrix(N, Diffusivity, L,
+                'sparse').toarray() == A))
+            
+            # Banded storage, as used by scipy.linalg.solve_banded():
+            ab = ds.SchemeMatrix(N, Diffusivity, L, 'banded')
+            for offset, row in [(1, 0), (0, 1), (-1, 2)]:
+                band = ab[row, max(offset, 0):N+min(offset, 0)]
+                self.assertTrue(np.all(band == np.diag(A, offset)))
+    
+    def testFaceDiffusivity(self):
+        # Functions of scalars only are evaluated face by face, and arrays of
+        # face values are used directly (with no flux through the
+        # boundaries):
+        N = 10
+        x_faces = np.arange(N+1)/N
+        A = ds.SchemeMatrix(N, Diffusivity)
+        scalar = lambda x: float(Diffusivity(x))
+        self.assertTrue(np.all(ds.SchemeMatrix(N, scalar) == A))
+        self.assertTrue(np.max(abs(ds.SchemeMatrix(N, Diffusivity(x_faces))
+            - A)) < 1E-12*np.max(abs(A)))
+        self.assertTrue(np.max(abs(np.sum(A, axis=1))) < 1E-12*np.max(abs(A)))
+        self.assertRaises(ValueError, ds.SchemeMatrix, N, np.ones(N))
+        self.assertRaises(ValueError, ds.SchemeMatrix, N, Diffusivity,
+            form='csc')
+    
+    def testDiagonals(self):
+        # Several diffusivity profiles at once:
+        N = 10
+        x_faces = np.arange(N+1)/N
+        k = np.stack([f*Diffusivity(x_faces) for f in [1.0, 3.0]])
+        lower, diag, upper = ds.SchemeDiagonals(N, k)
+        self.assertEqual(diag.shape, (2, N))
+        for m in xrange(2):
+            A = ds.SchemeMatrix(N, k[m])
+            self.assertTrue(np.all(lower[m,1:] == np.diag(A, -1)))
+            self.assertTrue(np.all(diag[m] == np.diag(A)))
+            self.assertTrue(np.all(upper[m,:-1] == np.diag(A, 1)))
+            q = np.cos(np.arange(N))
+            self.assertTrue(np.max(abs(ds.TridiagonalDot(lower[m], diag[m],
+                upper[m], q) - np.dot(A, q))) < 1E-12*np.max(abs(A)))
+        self.assertRaises(ValueError, ds.SchemeMatrix, N, k)
+
+
+class SolveDiffusionEquationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.N = 50
+        self.x = (0.5 + np.arange(self.N))/self.N
+        self.q = np.cos(3*self.x) + self.x**3
+        self.S = np.sin(5*self.x)
+    
+    def testBandedAgainstDense(self):
+        for theta in [0.0, 0.5, 1.0]:
+            for dt in [1E-4, 1E-2]:
+                q_banded = ds.SolveDiffusionEquation(self.q, self.S,
+                    2*self.S, Diffusivity, dt, theta=theta)
+                q_dense = ds.SolveDiffusionEquation(self.q, self.S,
+                    2*self.S, Diffusivity, dt, theta=theta, banded=False)
+                self.assertTrue(np.max(abs(q_banded - q_dense)) < 1E-12,
+                    msg='theta = %g, dt = %g' % (theta, dt))
+    
+    def testConservation(self):
+        # With no source, the Neumann boundaries conserve the total of q:
+        q = self.q
+        for j in xrange(10):
+            q = ds.SolveDiffusionEquation(q, 0*q, 0*q, Diffusivity, 0.01)
+        self.assertAlmostEqual(np.sum(q), np.sum(self.q), places=10)
+        self.assertTrue(np.ptp(q) < np.ptp(self.q))
+    
+    def testProfiles(self):
+        # Several profiles (the rows of q) are advanced at once, with shared
+        # or separate sources and diffusivities:
+        q = np.stack((self.q, 2*self.q, self.q**2))
+        S = np.stack((self.S, -self.S, 0*self.S))
+        x_faces = np.arange(self.N+1)/self.N
+        k = np.stack([f*Diffusivity(x_faces) for f in [1.0, 0.5, 2.0]])
+        for S_all, k_all, banded in [(self.S, Diffusivity, True),
+            (S, Diffusivity, True), (S, Diffusivity, False), (S, k, True)]:
+            q_new = ds.SolveDiffusionEquation(q, S_all, S_all, k_all, 0.01,
+                theta=0.5, banded=banded)
+            self.assertEqual(q_new.shape, q.shape)
+            for m in xrange(3):
+                q_m = ds.SolveDiffusionEquation(q[m],
+                    S_all if np.ndim(S_all) == 1 else S_all[m],
+                    S_all if np.ndim(S_all) == 1 else S_all[m],
+                    k_all if callable(k_all) else k_all[m], 0.01, theta=0.5)
+                self.assertTrue(np.max(abs(q_new[m] - q_m)) < 1E-12)
+
+
+
+class DiffusionIntegratorTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.N = 40
+        self.x = (0.5 + np.arange(self.N))/self.N
+        self.q = np.cos(3*self.x)
+        self.S = np.sin(5*self.x)
+    
+    def Steps(self, q, n_steps, dt, theta=1.0, k=Diffusivity):
+        """Returns q after n_steps calls of SolveDiffusionEquation()."""
+        for j in xrange(n_steps):
+            q = ds.SolveDiffusionEquation(q, self.S, self.S, k, dt,
+                theta=theta)
+        return q
+    
+    def testRun(self):
+        for theta in [0.5, 1.0]:
+            integrator = ds.DiffusionIntegrator(self.N, Diffusivity, 0.01,
+                theta=theta)
+            t, q, q_final = integrator.Run(self.q, self.S, 20,
+                output_every=5)
+            self.assertTrue(np.allclose(t, [0.0, 0.05, 0.1, 0.15, 0.2]))
+            self.assertEqual(q.shape, (5, self.N))
+            self.assertTrue(np.all(q[0] == self.q))
+            self.assertTrue(np.all(q[-1] == q_final))
+            for j in xrange(1, 5):
+                self.assertTrue(np.max(abs(q[j] - self.Steps(self.q, 5*j,
+                    0.01, theta))) < 1E-12)
+    
+    def testUpdate(self):
+        # Changing dt or k re-factorises the implicit operator:
+        integrator = ds.DiffusionIntegrator(self.N, Diffusivity, 0.01)
+        implicit = integrator._implicit
+        integrator.Update(dt=0.01, k=Diffusivity)
+        self.assertTrue(integrator._implicit is implicit)
+        k = lambda x: 2*Diffusivity(x)
+        for dt, k_new in [(0.02, Diffusivity), (0.02, k)]:
+            integrator.Update(dt=dt, k=k_new)
+            self.assertFalse(integrator._implicit is implicit)
+            implicit = integrator._implicit
+            q = integrator.Run(self.q, self.S, 3, output_every=0)[2]
+            self.assertTrue(np.max(abs(q - self.Steps(self.q, 3, dt,
+                k=k_new))) < 1E-12)
+    
+    def testDecay(self):
+        # With decay and a constant source, q tends to the steady state
+        # A q - lambda q + S = 0:
+        integrator = ds.DiffusionIntegrator(self.N, Diffusivity, 1.0,
+            decay=2.0)
+        q = integrator.Run(self.q, self.S, 200, output_every=0)[2]
+        A = ds.SchemeMatrix(self.N, Diffusivity)
+        q_steady = np.linalg.solve(2.0*np.eye(self.N) - A, self.S)
+        self.assertTrue(np.max(abs(q - q_steady)) < 1E-10)
+    
+    def testProfiles(self):
+        # Profiles with their own diffusivities and decay rates match those
+        # integrated one at a time:
+        q = np.stack((self.q, -self.q, self.q**2))
+        x_faces = np.arange(self.N+1)/self.N
+        k = np.stack([f*Diffusivity(x_faces) for f in [1.0, 0.5, 2.0]])
+        decay = np.array([0.0, 1.0, 0.5])
+        integrator = ds.DiffusionIntegrator(self.N, k, 0.01, theta=0.5,
+            decay=decay)
+        t, q_out, q_final = integrator.Run(q, self.S, 10)
+        self.assertEqual(q_out.shape, (11, 3, self.N))
+        for m in xrange(3):
+            q_m = ds.DiffusionIntegrator(self.N, k[m], 0.01, theta=0.5,
+                decay=decay[m]).Run(q[m], self.S, 10)[2]
+            self.assertTrue(np.max(abs(q_final[m] - q_m)) < 1E-12)
+    
+    def testCallback(self):
+        # Integration stops when the callback returns True, and the final
+        # state is output; the source may depend on t and q:
+        integrator = ds.DiffusionIntegrator(self.N, Diffusivity, 0.01)
+        S = lambda t, q: self.S - q
+        t, q, q_final = integrator.Run(self.q, S, 100, output_every=4,
+            callback=lambda t, q: t > 0.065)
+        self.assertTrue(np.allclose(t, [0.0, 0.04, 0.07]))
+        self.assertTrue(np.all(q[-1] == q_final))
+
+
+if __name__ == '__main__':
+    unittest.main()
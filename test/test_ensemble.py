@@ -0,0 +1,189 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the batched Monte Carlo ensembles (ensemble.py): each member of
+### a batch against the analytic solution for its own parameters, the
+### sampling, and the streaming statistics against those of the samples.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, continuation as ct
+from src import ensemble as en
+
+
+def Members(batch, params):
+    """Returns a Parameters tuple for each member of the batch."""
+    m = len(batch.values()[0])
+    return [params._replace(**dict((name, float(values[j])) for name, values
+        in batch.iteritems())) for j in xrange(m)]
+
+
+class EnsembleSolutionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+        self.xi = np.linspace(0.0, 1.0, 501)
+        p = self.params
+        self.distributions = [('A', 0.95*p.A, 1.05*p.A),
+            ('B', 0.9*p.B, 1.1*p.B), ('D', 0.5*p.D, 1.5*p.D),
+            ('ai', 0.35, 0.42), ('af', 0.65, 0.72), ('S2', -0.5, -0.4),
+            ('Q', 0.9*p.Q, 1.1*p.Q)]
+        self.batch = en.SampleBatches(self.distributions, 8, seed=1).next()
+    
+    def testQ(self):
+        # Each member's Q(x_i) is that of the analytic solution for its own
+        # parameters:
+        for smooth_coalbedo in [False, True]:
+            solution = en.EnsembleSolution(self.xi, smooth_coalbedo,
+                self.params)
+            Q = solution.Q(self.batch)
+            self.assertEqual(Q.shape, (8, len(self.xi)))
+            for j, params in enumerate(Members(self.batch, self.params)):
+                Q_ref = an.Q(self.xi, None, smooth_coalbedo, params)
+                self.assertTrue(np.max(abs(Q[j] - Q_ref)) < 1E-9*np.max(Q_ref))
+    
+    def testUnsampled(self):
+        # Parameters which are not sampled take the values of params:
+        solution = en.EnsembleSolution(self.xi, params=self.params)
+        Q = solution.Q({'D': np.array([0.5, 1.0])})
+        for j, D in enumerate([0.5, 1.0]):
+            Q_ref = an.Q(self.xi, D, params=self.params)
+            self.assertTrue(np.max(abs(Q[j] - Q_ref)) < 1E-9*np.max(Q_ref))
+    
+    def testIceEdgeAndTn(self):
+        # The stable ice edge is where Q(x_i) crosses the member's Q with
+        # dQ/dx_i > 0, and T_n are those of the steady state there:
+        solution = en.EnsembleSolution(self.xi, params=self.params)
+        Q = solution.Q(self.batch)
+        xi = solution.IceEdge(Q, self.batch)
+        T_n = solution.TnCoefficients(xi, self.batch)
+        self.assertEqual(T_n.shape, (8, len(solution.n)))
+        for j, params in enumerate(Members(self.batch, self.params)):
+            if 0.0 < xi[j] < 1.0:
+                self.assertTrue(abs(an.Q(xi[j], params=params) - params.Q)
+                    < 1E-3)
+                self.assertTrue(ct.dQdxi(xi[j], params=params) > 0)
+                self.assertTrue(np.all(an.Q(self.xi[self.xi > xi[j]],
+                    params=params) > params.Q))
+            elif xi[j] == 1.0:
+                self.assertTrue(params.Q > an.Q(1.0, params=params))
+            else:
+                self.assertTrue(np.all(Q[j] >= params.Q))
+            for k, n in enumerate(solution.n):
+                self.assertAlmostEqual(T_n[j,k], float(an.Tn(n, xi[j],
+                    params=params)), places=10)
+    
+    def testFolds(self):
+        # The folds of each member agree with those located by Brent's
+        # method, to within the accuracy of the grid:
+        solution = en.EnsembleSolution(self.xi, params=self.params)
+        Q = solution.Q(self.batch)
+        xi_min, Q_min, xi_max, Q_max = solution.Folds(Q)
+        for j, params in enumerate(Members(self.batch, self.params)):
+            folds = ct.FindFolds(params=params)[0]
+            for xi_fold, Q_fold, kind in [(xi_min[j], Q_min[j], 'minimum'),
+                (xi_max[j], Q_max[j], 'maximum')]:
+                matches = [f for f in folds if f.kind == kind]
+                if not matches:
+                    self.assertTrue(np.isnan(xi_fold))
+                    continue
+                self.assertTrue(abs(xi_fold - matches[0].xi) < 1E-3)
+                self.assertTrue(abs(Q_fold - matches[0].Q) < 1E-4)
+
+
+class SamplingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.distributions = [('A', 200.0, 210.0), ('D', 0.4, 0.8)]
+    
+    def testBatches(self):
+        batches = list(en.SampleBatches(self.distributions, 25,
+            batch_size=10, seed=2))
+        self.assertEqual([len(b['A']) for b in batches], [10, 10, 5])
+        again = list(en.SampleBatches(self.distributions, 25,
+            batch_size=10, seed=2))
+        for b, b_again in zip(batches, again):
+            self.assertTrue(np.all(b['D'] == b_again['D']))
+        for b in batches:
+            self.assertTrue(np.all((b['D'] >= 0.4) & (b['D'] < 0.8)))
+        self.assertRaises(ValueError, list, en.SampleBatches(
+            self.distributions, 25, method='sobol'))
+        self.assertRaises(ValueError, en.RunEnsemble, [('delta_x', 0.0,
+            0.1)], 10)
+    
+    def testLatinHypercube(self):
+        # Each stratum of each parameter is sampled exactly once, across all
+        # batches:
+        n = 40
+        D = np.concatenate([b['D'] for b in en.SampleBatches(
+            self.distributions, n, method='lhs', batch_size=15, seed=3)])
+        strata = np.floor((D - 0.4)/0.4*n).astype(int)
+        self.assertEqual(sorted(strata), range(n))
+
+
+class StreamingHistogramTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(4)
+        self.values = rng.standard_normal((5000, 3))
+        self.values[::97,1] = np.nan
+    
+    def testStatistics(self):
+        # Accumulated over batches, the mean, variance, range and quantiles
+        # agree with those of all of the samples (the quantiles to within the
+        # width of a bin):
+        edges = np.linspace(-3.0, 3.0, 121)
+        histogram = en.StreamingHistogram(edges, (3,))
+        for j in xrange(0, 5000, 700):
+            histogram.Add(self.values[j:j+700])
+        for k in xrange(3):
+            v = self.values[:,k][~np.isnan(self.values[:,k])]
+            self.assertEqual(histogram.n[k], len(v))
+            self.assertEqual(histogram.n_nan[k], 5000 - len(v))
+            self.assertAlmostEqual(histogram.mean[k], np.mean(v), places=12)
+            self.assertAlmostEqual(histogram.Variance()[k], np.var(v, ddof=1),
+                places=12)
+            self.assertEqual((histogram.min[k], histogram.max[k]),
+                (np.min(v), np.max(v)))
+            q = np.array([0.1, 0.5, 0.9])
+            self.assertTrue(np.max(abs(histogram.Quantile(q)[:,k]
+                - np.percentile(v, 100*q))) < 0.05)
+        self.assertEqual(histogram.Quantile(np.array([0.5, 0.9])).shape,
+            (2, 3))
+        # Outside the range of the bins, counted but not in the density:
+        density = histogram.Density()
+        self.assertTrue(np.all(np.sum(density*np.diff(edges), axis=1) < 1.0))
+    
+    def testEmpty(self):
+        histogram = en.StreamingHistogram(np.linspace(0.0, 1.0, 11))
+        histogram.Add(np.array([np.nan, np.nan]))
+        self.assertEqual((histogram.n, histogram.n_nan), (0, 2))
+        self.assertTrue(np.isnan(histogram.Quantile(0.5)))
+        self.assertTrue(np.isnan(histogram.Variance()))
+
+
+class RunEnsembleTests(unittest.TestCase):
+
+    def testDefaultParameters(self):
+        # With no uncertainty, every member is the deterministic solution:
+        params = pm.Current()
+        statistics = en.RunEnsemble([('D', params.D, params.D)], 30,
+            batch_size=8, params=params)
+        folds = ct.FindFolds(params=params)[0]
+        for histogram in statistics:
+            self.assertTrue(np.all(histogram.n == 30))
+            self.assertTrue(np.all(histogram.Variance() < 1E-20))
+        self.assertEqual(statistics.xi.mean, 1.0)
+        self.assertTrue(abs(statistics.xi_min.mean - folds[0].xi) < 1E-3)
+        x = np.linspace(0.0, 1.0, 101)
+        T = an.Temperature(x, 1.0, params=params)
+        self.assertTrue(np.max(abs(statistics.T_profile.mean - T)) < 1E-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of saving figures (fileIO.SaveFigures()): the overwrite policies,
+### the headless default and saving in a pool of processes. Figures are saved
+### to a temporary sub-directory of plots, which is removed afterwards.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, shutil, tempfile, unittest, StringIO
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import fileIO as fio
+import matplotlib.pyplot as plt
+
+
+plots_dir = os.path.join(os.path.dirname(__file__), '..', 'plots')
+
+
+class SaveFiguresTests(unittest.TestCase):
+
+    def setUp(self):
+        fio.SetHeadless()
+        self.overwrite_policy = fio.overwrite_policy
+        self.dirname = tempfile.mkdtemp(dir=plots_dir)
+        self.subdir = os.path.basename(self.dirname)
+        self.figures = []
+        for label in ['first', 'second']:
+            fig = plt.figure()
+            fig.set_label(label)
+            fig.gca().plot([0, 1], [1, 0])
+            self.figures.append(fig)
+        self.answers = []
+        self.prompts = []
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+    
+    def tearDown(self):
+        sys.stdout = self.stdout
+        fio.overwrite_policy = self.overwrite_policy
+        if hasattr(fio, 'raw_input'):
+            del fio.raw_input
+        for fig in self.figures:
+            plt.close(fig)
+        shutil.rmtree(self.dirname)
+    
+    def RawInput(self, prompt):
+        """Answers the prompts of SaveFigures() from self.answers."""
+        self.prompts.append(prompt)
+        return self.answers.pop(0)
+    
+    def Mark(self):
+        """Replaces each saved file with a marker, returning their names."""
+        names = sorted(os.listdir(self.dirname))
+        for name in names:
+            with open(os.path.join(self.dirname, name), 'w') as f:
+                f.write('old')
+        return names
+    
+    def Overwritten(self):
+        """Returns the names of the files which are no longer markers."""
+        return sorted(name for name in os.listdir(self.dirname)
+            if open(os.path.join(self.dirname, name)).read() != 'old')
+    
+    def testNames(self):
+        # Figures are named by their labels unless filenames are given:
+        self.assertTrue(fio.Headless())
+        self.assertEqual(fio.FigureName(self.figures[0]), 'first')
+        fio.SaveFigures(self.figures, self.subdir, ['.pdf', '.png'])
+        self.assertEqual(sorted(os.listdir(self.dirname)), ['first.pdf',
+            'first.png', 'second.pdf', 'second.png'])
+        fio.SaveFigures(self.figures, self.subdir, '.png', ['a', 'b'])
+        self.assertTrue(os.path.isfile(os.path.join(self.dirname, 'b.png')))
+        self.assertRaises(ValueError, fio.SaveFigures, self.figures,
+            self.subdir, overwrite='sometimes')
+    
+    def testOverwrite(self):
+        fio.SaveFigures(self.figures, self.subdir, '.png')
+        names = self.Mark()
+        # Headless, existing files are not over-written by default:
+        fio.SaveFigures(self.figures, self.subdir, '.png')
+        self.assertEqual(self.Overwritten(), [])
+        fio.SaveFigures(self.figures, self.subdir, '.png', overwrite='always')
+        self.assertEqual(self.Overwritten(), names)
+        
+        # Unless the policy is set (e.g. by the 'overwrite' flag):
+        self.Mark()
+        argv = ['script.py', 'overwrite', 'headless']
+        fio.HandleFlags(argv)
+        self.assertEqual(argv, ['script.py'])
+        fio.SaveFigures(self.figures, self.subdir, '.png')
+        self.assertEqual(self.Overwritten(), names)
+    
+    def testAsk(self):
+        # Each file is prompted for, until answered Y-ALL:
+        fio.SaveFigures(self.figures, self.subdir, ['.pdf', '.png'])
+        self.Mark()
+        fio.raw_input = self.RawInput
+        self.answers = ['N', 'Y', 'N', 'N']
+        fio.SaveFigures(self.figures, self.subdir, ['.pdf', '.png'],
+            overwrite='ask')
+        self.assertEqual(len(self.prompts), 4)
+        self.assertEqual(self.Overwritten(), ['first.png'])
+        self.Mark()
+        self.answers = ['N', 'Y-ALL']
+        fio.SaveFigures(self.figures, self.subdir, ['.pdf', '.png'],
+            overwrite='ask')
+        self.assertEqual(len(self.prompts), 6)
+        self.assertEqual(self.Overwritten(), ['first.png', 'second.pdf',
+            'second.png'])
+    
+    def testProcesses(self):
+        # Saving in a pool of processes gives the same files:
+        fio.SaveFigures(self.figures, self.subdir, '.png', processes=2)
+        self.assertEqual(sorted(os.listdir(self.dirname)), ['first.png',
+            'second.png'])
+        saved = [open(os.path.join(self.dirname, name), 'rb').read()
+            for name in ['first.png', 'second.png']]
+        fio.SaveFigures(self.figures, self.subdir, '.png', ['a', 'b'])
+        for name, data in zip(['a.png', 'b.png'], saved):
+            self.assertEqual(open(os.path.join(self.dirname, name),
+                'rb').read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the fitting of the model parameters to heat transport profiles
+### (fitting.py), using synthetic observations from known parameters.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, warnings, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, fitting as ft
+
+
+class FitHeatTransportTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.params = pm.Current()
+        self.x = np.linspace(0.05, 0.95, 30)
+    
+    def Synthetic(self, xi, steady_state, params):
+        """Returns the heat transport at self.x of the solution with ice edge
+        xi and the given params, with Q either Q(xi) or params.Q."""
+        Q = an.Q(xi, params=params) if steady_state else params.Q
+        return an.HeatTransport(self.x, xi, Q, params=params)
+    
+    def testJacobian(self):
+        # The analytic derivatives agree with finite differences:
+        for steady_state in [False, True]:
+            HT, J = ft.HeatTransportJacobian(self.x, 0.9,
+                steady_state=steady_state, params=self.params)
+            for name in ['D', 'A', 'B']:
+                h = 1E-6*getattr(self.params, name)
+                HT_h = ft.HeatTransportJacobian(self.x, 0.9,
+                    steady_state=steady_state,
+                    params=self.params._replace(**{name: getattr(self.params,
+                    name) + h}))[0]
+                self.assertTrue(np.max(abs((HT_h - HT)/h - J[name]))
+                    < 1E-4*np.max(abs(HT)))
+    
+    def testRecoverD(self):
+        # The fit recovers D from the heat transport of a known solution,
+        # with Q(x_i) (the default) or fixed Q:
+        for steady_state in [True, False]:
+            for relative_D in [0.6, 1.0, 1.8]:
+                params = self.params._replace(D=relative_D*self.params.D)
+                HT = self.Synthetic(0.9, steady_state, params)
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter('always')
+                    result = ft.FitHeatTransport(self.x, HT, xi=0.9,
+                        steady_state=steady_state, params=self.params)
+                self.assertEqual(caught, [])
+                self.assertTrue(result.success)
+                self.assertAlmostEqual(result.params.D/params.D, 1.0,
+                    places=6)
+                self.assertTrue(result.rms < 1E-6*np.max(HT))
+    
+    def testRecoverSeveral(self):
+        # As for D, B and x_i together, with noise added to the observations:
+        params = self.params._replace(D=0.8*self.params.D,
+            B=1.1*self.params.B)
+        HT = self.Synthetic(0.85, True, params)
+        HT_noisy = HT*(1.0 + 0.001*np.sin(37.0*self.x))
+        result = ft.FitHeatTransport(self.x, HT_noisy, fit=('D', 'B', 'xi'),
+            params=self.params)
+        self.assertTrue(result.success)
+        self.assertTrue(abs(result.params.D/params.D - 1.0) < 0.02)
+        self.assertTrue(abs(result.params.B/params.B - 1.0) < 0.02)
+        self.assertTrue(abs(result.xi - 0.85) < 0.01)
+    
+    def testWarnings(self):
+        # A heat transport which no D can give: twice that of any solution
+        # (D grows until the heat transport no longer depends on it) or
+        # equatorward (D reaches its lower bound, zero):
+        HT = self.Synthetic(0.9, True, self.params)
+        for HT_obs, message in [(2*HT, 'insensitive'), (-HT, 'bound')]:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                ft.FitHeatTransport(self.x, HT_obs, xi=0.9,
+                    params=self.params)
+            self.assertTrue(any(message in str(w.message) for w in caught))
+    
+    def testInvalid(self):
+        self.assertRaises(ValueError, ft.FitHeatTransport, self.x,
+            np.zeros(len(self.x)), fit=('Q',), params=self.params)
+        self.assertRaises(ValueError, ft.FitHeatTransport, self.x,
+            np.zeros(len(self.x)), fit=('A',), steady_state=False,
+            params=self.params)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the lookup tables of the solution branch Q(x_i) (lookup.py):
+### interpolation, stability and the inverse queries, against the analytic
+### solution and brute-force scans of Q(x_i) on a fine grid of x_i.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, shutil, tempfile, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, continuation as ct
+from src import lookup as lk, store as st
+
+
+def ScanIceEdges(Q, D, smooth_coalbedo, params, n=20001):
+    """Returns, for each of the values Q, the x_i at which Q(x_i) crosses it
+    on a grid of n points in 0 <= x_i <= 1 (to within 1/(n-1))."""
+    xi = np.linspace(0.0, 1.0, n)
+    Q_xi = an.Q(xi, D, smooth_coalbedo, params)
+    result = []
+    for q in Q:
+        j = np.nonzero(np.sign(Q_xi[1:] - q) != np.sign(Q_xi[:-1] - q))[0]
+        result.append(0.5*(xi[j] + xi[j+1]))
+    return result
+
+
+class QTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+    
+    def testQ(self):
+        table = lk.GetQTable(params=self.params, persist=False)
+        xi = np.linspace(0.0, 1.0, 1237)
+        Q, dQ = an.QDerivatives(xi, params=self.params)
+        self.assertTrue(np.max(abs(table.Q(xi) - Q)) < 1E-6)
+        self.assertTrue(np.max(abs(table.dQdxi(xi) - dQ['xi'])) < 1E-3)
+    
+    def testIceEdges(self):
+        # The inverse queries find every crossing of Q(x_i), including those
+        # of the close pair of folds near the cusp (D ~ 1.5025 D0 for the
+        # step coalbedo), and their stability is that of dQ/dx_i there:
+        D0 = self.params.D
+        n = 20001
+        for smooth_coalbedo, relative_D in [(False, 1.0), (False, 1.3),
+            (False, 1.5), (False, 1.502), (False, 2.0), (True, 1.0),
+            (True, 1.1), (True, 1.47)]:
+            D = relative_D*D0
+            table = lk.GetQTable(D, smooth_coalbedo, params=self.params,
+                persist=False)
+            Q_folds = np.array([f.Q for f in table.folds])
+            Q = np.linspace(table.Q_knots.min(), table.Q_knots.max(), 203)
+            Q = np.concatenate((Q[1:-1], Q_folds + 1E-4, Q_folds - 1E-4))
+            xi_table, stable = table.IceEdges(Q)
+            for q, xi_q, xi_scan in zip(Q, xi_table, ScanIceEdges(Q, D,
+                smooth_coalbedo, self.params, n)):
+                found = ~np.isnan(xi_q)
+                msg = 'D = %g D0, smooth_coalbedo = %s, Q = %.6f' % (
+                    relative_D, smooth_coalbedo, q)
+                self.assertEqual(np.sum(found), len(xi_scan), msg=msg)
+                self.assertTrue(np.all(abs(xi_q[found] - xi_scan)
+                    < 1.0/(n-1)), msg=msg)
+                self.assertTrue(np.all(stable[found] == (ct.dQdxi(
+                    xi_q[found], D, smooth_coalbedo, self.params) > 0)),
+                    msg=msg)
+    
+    def testNearCusp(self):
+        # Three steady states, between the folds at 0.8901 and 0.9009:
+        table = lk.GetQTable(1.5*self.params.D, params=self.params,
+            persist=False)
+        xi, stable = table.IceEdges(303.334)
+        self.assertEqual(list(stable), [False, True, False])
+        for xi_b, xi_ref in zip(xi, [0.88467, 0.89864, 0.90279]):
+            self.assertAlmostEqual(xi_b, xi_ref, places=5)
+        self.assertTrue(np.all(abs(an.Q(xi, 1.5*self.params.D,
+            params=self.params) - 303.334) < 1E-8))
+    
+    def testMissedFolds(self):
+        # Folds not found by continuation.FindFolds() are found from the
+        # sign of dQ/dx_i at the knots and the branch split there:
+        D = 1.5*self.params.D
+        reference = lk.BuildQTable(params=self.params._replace(D=D))
+        FindFolds = ct.FindFolds
+        try:
+            ct.FindFolds = lambda *args, **kwargs: ([], [])
+            table = lk.BuildQTable(params=self.params._replace(D=D))
+        finally:
+            ct.FindFolds = FindFolds
+        self.assertEqual(list(table.stable), list(reference.stable))
+        for fold, fold_ref in zip(table.folds, reference.folds):
+            self.assertEqual(fold.kind, fold_ref.kind)
+            self.assertAlmostEqual(fold.xi, fold_ref.xi, places=8)
+        Q = np.linspace(300.0, 310.0, 11)
+        self.assertTrue(np.allclose(table.IceEdges(Q)[0],
+            reference.IceEdges(Q)[0], equal_nan=True))
+    
+    def testStable(self):
+        table = lk.GetQTable(params=self.params, persist=False)
+        xi = np.linspace(0.001, 0.999, 999)
+        self.assertTrue(np.all(table.Stable(xi) == (ct.dQdxi(xi,
+            params=self.params) > 0)))
+    
+    
+    def testStore(self):
+        # Tables are stored (see store.Cached()) and then loaded rather than
+        # rebuilt, and are rebuilt only when a parameter on which Q(x_i)
+        # depends changes:
+        store_dir = st.store_dir
+        st.store_dir = tempfile.mkdtemp()
+        BuildQTable = lk.BuildQTable
+        try:
+            lk.table_cache.Clear()
+            table = lk.GetQTable(params=self.params)
+            self.assertEqual(len(os.listdir(st.store_dir)), 1)
+            lk.table_cache.Clear()
+            lk.BuildQTable = None # must not be called
+            stored = lk.GetQTable(params=self.params._replace(Q=300.0))
+            lk.BuildQTable = BuildQTable
+            for a, a_stored in [(table.xi, stored.xi), (table.Q_knots,
+                stored.Q_knots), (table.edges, stored.edges), (table.stable,
+                stored.stable)]:
+                self.assertTrue(np.all(a == a_stored))
+            lk.GetQTable(1.1*self.params.D, params=self.params)
+            self.assertEqual(len(os.listdir(st.store_dir)), 2)
+        finally:
+            lk.BuildQTable = BuildQTable
+            lk.table_cache.Clear()
+            shutil.rmtree(st.store_dir)
+            st.store_dir = store_dir
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the numerical solvers (numerical.py) against the time-stepping
+### model, the analytic solution and the known behaviour of the steady
+### states.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, numerical as nm, analytics as an
+
+
+class SteadyStateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+    
+    def testConverged(self):
+        # Newton's method takes four iterations from this guess:
+        T, xi, converged = nm.SteadyState(Q=0.94*self.params.Q, xi_init=0.8,
+            params=self.params)
+        self.assertTrue(converged)
+        self.assertTrue(0.8 < xi < 0.9)
+        self.assertAlmostEqual(np.interp(xi, nm.Grid(), T),
+            self.params.T_ice_edge, places=6)
+    
+    def testMaxIter(self):
+        # Running out of iterations must not be reported as convergence (nor
+        # as a snowball or ice-free state):
+        T_ref, xi_ref = nm.SteadyState(Q=0.94*self.params.Q, xi_init=0.8,
+            params=self.params)[:2]
+        for max_iter in [1, 2, 3]:
+            T, xi, converged = nm.SteadyState(Q=0.94*self.params.Q,
+                xi_init=0.8, max_iter=max_iter, params=self.params)
+            self.assertFalse(converged)
+            self.assertTrue(0.0 < xi < 1.0)
+            self.assertTrue(abs(xi - xi_ref) < 0.05)
+    
+    def testBoundaryStates(self):
+        # Beyond the saddle-node bifurcations, only the snowball (small Q) or
+        # ice-free (large Q) states exist, whatever the initial guess:
+        for Q, xi_edge in [(0.8*self.params.Q, 0.0),
+            (1.5*self.params.Q, 1.0)]:
+            for xi_init in [0.0, 0.3, 0.6, 1.0]:
+                T, xi, converged = nm.SteadyState(Q=Q, xi_init=xi_init,
+                    params=self.params)
+                self.assertTrue(converged)
+                self.assertEqual(xi, xi_edge)
+    
+    def testBranch(self):
+        # Continuation along the stable branch of small ice caps, which
+        # retreat as Q increases, close to the analytic Q(x_i); each solution
+        # is that found from the previous one:
+        Q = np.linspace(316.0, 311.0, 6)
+        for smooth_coalbedo in [False, True]:
+            T, xi, converged = nm.SteadyStateBranch(Q,
+                smooth_coalbedo=smooth_coalbedo, xi_init=0.85,
+                params=self.params)
+            self.assertEqual(T.shape, (len(Q), pm.n_grid))
+            self.assertTrue(np.all(converged))
+            self.assertTrue(np.all(np.diff(xi) < 0) and 0.6 < xi[-1])
+            self.assertTrue(np.max(abs(an.Q(xi, None, smooth_coalbedo,
+                self.params) - Q)) < 1.0)
+            T_3, xi_3 = nm.SteadyState(Q[3], smooth_coalbedo=smooth_coalbedo,
+                T_init=T[2], params=self.params)[:2]
+            self.assertEqual(xi_3, xi[3])
+            self.assertTrue(np.all(T_3 == T[3]))
+    
+    def testEquilibrium(self):
+        # The steady state agrees with the time-stepping model's equilibrium:
+        T, xi, converged = nm.SteadyState(params=self.params)
+        model = nm.NumericalEBM(params=self.params)
+        T_eq, xi_eq, converged_eq = model.Equilibrium(T + 1.0)
+        self.assertTrue(converged and converged_eq)
+        self.assertTrue(abs(xi - xi_eq) < 1E-3)
+        self.assertTrue(np.max(abs(T - T_eq)) < 1E-2)
+
+
+class NumericalEBMTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.params = pm.Current()
+    
+    def testIceEdge(self):
+        # Linear interpolation between grid points, with the snowball and
+        # ice-free states at the boundaries:
+        x = nm.Grid(10)
+        T_ice = self.params.T_ice_edge
+        self.assertAlmostEqual(nm.IceEdge(x, T_ice + 10.0*(0.52 - x),
+            self.params), 0.52, places=12)
+        self.assertEqual(nm.IceEdge(x, T_ice + 1.0 + 0*x, self.params), 1.0)
+        self.assertEqual(nm.IceEdge(x, T_ice - 1.0 + 0*x, self.params), 0.0)
+    
+    def testCoalbedo(self):
+        # The cell-averaged step coalbedo integrates exactly, and varies
+        # continuously with the ice edge:
+        N = 20
+        x, h = nm.Grid(N), 1.0/N
+        p = self.params
+        xi = np.linspace(0.0, 1.0, 201)
+        a = np.array([nm.Coalbedo(x, xi_j, h=h, params=p) for xi_j in xi])
+        self.assertTrue(np.max(abs(h*np.sum(a, axis=1)
+            - (p.af*xi + p.ai*(1-xi)))) < 1E-12)
+        self.assertTrue(np.max(abs(np.diff(a, axis=0)))
+            <= (p.af-p.ai)*0.005/h + 1E-12)
+        
+        # The derivative with respect to the ice edge, against finite
+        # differences (away from the cell faces for the step coalbedo):
+        for smooth_coalbedo in [False, True]:
+            for xi_j in [0.33, 0.71]:
+                da = nm.CoalbedoDerivative(x, xi_j, smooth_coalbedo, h, p)
+                da_ref = (nm.Coalbedo(x, xi_j + 1E-6, smooth_coalbedo, h, p)
+                    - nm.Coalbedo(x, xi_j - 1E-6, smooth_coalbedo, h, p)
+                    ) / 2E-6
+                self.assertTrue(np.max(abs(da - da_ref)) < 1E-6*np.max(
+                    abs(da_ref)))
+    
+    def testRun(self):
+        model = nm.NumericalEBM(params=self.params)
+        T_init = 10.0*np.ones(model.N)
+        t, T, T_final = model.Run(T_init, 1.0, output_every=25)
+        self.assertTrue(np.allclose(t, [0.0, 0.25, 0.5, 0.75, 1.0]))
+        self.assertEqual(T.shape, (5, model.N))
+        self.assertTrue(np.all(T[0] == T_init))
+        self.assertTrue(np.all(T[-1] == T_final))
+        
+        # Integrating in two parts gives the same result:
+        T_half = model.Run(T_init, 0.5)[2]
+        self.assertTrue(np.max(abs(model.Run(T_half, 0.5)[2] - T_final))
+            < 1E-12)
+        self.assertRaises(ValueError, nm.NumericalEBM(params=self.params,
+            seasonal=True).Equilibrium)
+    
+    def testEquilibrium(self):
+        # The equilibrium ice edge is where the analytic Q(x_i) equals Q, to
+        # within the discretisation error:
+        for smooth_coalbedo in [False, True]:
+            model = nm.NumericalEBM(Q=316.0, smooth_coalbedo=smooth_coalbedo,
+                params=self.params)
+            T, xi, converged = model.Equilibrium(5.0 - 10.0*model.x**2)
+            self.assertTrue(converged)
+            self.assertTrue(0.8 < xi < 0.9)
+            self.assertTrue(abs(an.Q(xi, None, smooth_coalbedo, self.params)
+                - 316.0) < 1.0)
+            self.assertAlmostEqual(nm.IceEdge(model.x, T, self.params), xi)
+    
+    def testHysteresis(self):
+        # From the ice-free state, reducing Q beyond the small ice cap
+        # instability gives a snowball, which persists when Q is restored
+        # until Q exceeds Q(0):
+        Q_snowball = float(an.Q(0.0, params=self.params))
+        Q = np.array([1.0, 0.9, 1.0, 1.02*Q_snowball/self.params.Q]
+            )*self.params.Q
+        xi, converged = nm.Hysteresis(Q, params=self.params)
+        self.assertTrue(np.all(converged))
+        self.assertTrue(np.all(xi == [1.0, 0.0, 0.0, 1.0]))
+    
+    def testSetD(self):
+        # Changing D (as Hysteresis() changes Q) takes effect in later runs:
+        model = nm.NumericalEBM(params=self.params)
+        model.D = 0.5*self.params.D
+        T_init = 10.0*np.ones(model.N)
+        T = model.Run(T_init, 5.0)[2]
+        T_ref = nm.NumericalEBM(D=0.5*self.params.D,
+            params=self.params).Run(T_init, 5.0)[2]
+        self.assertTrue(np.max(abs(T - T_ref)) < 1E-12)
+    
+    def testSeasonalInsolation(self):
+        # Non-negative, and with annual mean Insolation(x) where it is not
+        # clipped (away from the poles):
+        x = 2*nm.Grid(400) - 1
+        t = (0.5 + np.arange(1000))/1000
+        S = np.array([nm.SeasonalInsolation(x, t_j, self.params)
+            for t_j in t])
+        self.assertTrue(np.min(S) >= 0.0)
+        S_mean = np.mean(S, axis=0)
+        S_ref = nm.Insolation(x, self.params)
+        mid = abs(x) < 0.5
+        self.assertTrue(np.max(abs(S_mean - S_ref)[mid]) < 1E-12)
+        self.assertTrue(np.all(S_mean >= S_ref - 1E-12))
+    
+    def testPeriodicNoSeasonalCycle(self):
+        # Without the seasonal cycle, both hemispheres are in the steady
+        # state:
+        params = self.params._replace(S1=0.0)
+        T_ss, xi_ss = nm.SteadyState(params=params)[:2]
+        model = nm.NumericalEBM(params=params, seasonal=True)
+        t, T, xi, converged = model.PeriodicEquilibrium()
+        self.assertTrue(converged)
+        T_ref = np.concatenate((T_ss[::-1], T_ss))
+        self.assertTrue(np.max(abs(T - T_ref)) < 1E-6)
+        self.assertTrue(np.max(abs(xi - xi_ss)) < 1E-6)
+    
+    def testPeriodicDefaultParameters(self):
+        # The annual-mean temperature and ice edge of the seasonal model stay
+        # close to those of the annual-mean model (ice free at the default
+        # parameters; ice forms only in winter), the seasonal cycle cooling
+        # the high latitudes by a few degrees:
+        T_ss, xi_ss = nm.SteadyState(params=self.params)[:2]
+        model = nm.NumericalEBM(params=self.params, seasonal=True)
+        t, T, xi, converged = model.PeriodicEquilibrium()
+        self.assertTrue(converged)
+        N = model.N
+        T_mean = np.mean(T[:-1], axis=0)
+        # The hemispheres are half a year out of phase:
+        self.assertTrue(np.max(abs(T_mean[N:] - T_mean[N-1::-1])) < 1E-6)
+        self.assertTrue(np.max(abs(T_mean[N:] - T_ss)) < 8.0)
+        self.assertTrue(abs(T_mean[N] - T_ss[0]) < 4.0)
+        self.assertTrue(abs(nm.IceEdge(model.x[N:], T_mean[N:]) - xi_ss)
+            < 0.05)
+        self.assertTrue(np.min(xi) > 0.3)
+        self.assertTrue(abs(np.mean(xi[:-1]) - xi_ss) < 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
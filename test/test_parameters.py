@@ -0,0 +1,86 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the immutable set of model parameters (parameters.Parameters):
+### snapshots of the module-level values, resolution of the default at call
+### time, and the model functions' use of the values given rather than the
+### module-level ones.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, pickle, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, numerical as nm
+from src import sweep as sw
+
+
+class ParametersTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+        self.D = pm.D
+    
+    def tearDown(self):
+        pm.D = self.D
+    
+    def testCurrent(self):
+        # A snapshot of the module-level values, which later changes to them
+        # do not affect:
+        for name in pm.Parameters._fields:
+            self.assertEqual(getattr(self.params, name), getattr(pm, name))
+        pm.D = 2*self.D
+        self.assertEqual(self.params.D, self.D)
+        self.assertEqual(pm.Current().D, 2*self.D)
+        self.assertEqual(pm.Get().D, 2*self.D)
+        self.assertTrue(pm.Get(self.params) is self.params)
+    
+    def testImmutable(self):
+        # Hashable, picklable and copied with changes by _replace():
+        self.assertRaises(AttributeError, setattr, self.params, 'D', 1.0)
+        self.assertEqual(hash(self.params), hash(pm.Current()))
+        self.assertEqual(pickle.loads(pickle.dumps(self.params)),
+            self.params)
+        params = self.params._replace(D=1.0)
+        self.assertEqual(params.D, 1.0)
+        self.assertEqual(self.params.D, self.D)
+        self.assertNotEqual(params, self.params)
+        self.assertEqual(params._replace(D=self.D), self.params)
+    
+    def testDefaultAtCallTime(self):
+        # Without params, functions use the module-level values when they are
+        # called:
+        xi = np.linspace(0.1, 0.9, 5)
+        Q = an.Q(xi)
+        pm.D = 2*self.D
+        self.assertTrue(np.all(an.Q(xi) == an.Q(xi,
+            params=self.params._replace(D=2*self.D))))
+        self.assertFalse(np.all(an.Q(xi) == Q))
+        self.assertTrue(np.all(an.Q(xi, params=self.params) == Q))
+    
+    def testParamsGiven(self):
+        # The values given are used in place of the module-level values (which
+        # are not modified):
+        params = self.params._replace(D=2*self.D, B=1.9)
+        for smooth_coalbedo in [False, True]:
+            pm.D = 2*self.D; pm.B = 1.9
+            try:
+                Q_ref = an.Q(0.7, smooth_coalbedo=smooth_coalbedo)
+                T_ref = nm.SteadyState(smooth_coalbedo=smooth_coalbedo)[0]
+            finally:
+                pm.D = self.D; pm.B = self.params.B
+            self.assertEqual(an.Q(0.7, smooth_coalbedo=smooth_coalbedo,
+                params=params), Q_ref)
+            self.assertTrue(np.all(nm.SteadyState(
+                smooth_coalbedo=smooth_coalbedo, params=params)[0] == T_ref))
+        model = nm.NumericalEBM(params=params)
+        self.assertEqual((model.D, model.Q), (2*self.D, self.params.Q))
+        sw.RunSweep(sw.SolutionQ, [('D', [0.5, 1.0]), ('B', [1.8, 2.0])],
+            processes=2, params=params, xi=0.7)
+        self.assertEqual(pm.Current(), self.params)
+
+
+if __name__ == '__main__':
+    unittest.main()
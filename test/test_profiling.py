@@ -0,0 +1,125 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the opt-in instrumentation (profiling.py): nothing is recorded
+### unless it is enabled, and calls, counts and phases are recorded when it
+### is.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, StringIO, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, profiling as prof
+
+
+@prof.Timed('test.Square')
+def Square(x):
+    """Returns x**2, raising ValueError if x is negative."""
+    if x < 0:
+        raise ValueError
+    return x**2
+
+
+class ProfilingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.enabled = prof.enabled
+        prof.enabled = False
+        prof.Reset()
+    
+    def tearDown(self):
+        prof.enabled = self.enabled
+        prof.Reset()
+    
+    def testDisabled(self):
+        # Nothing is recorded, and the functions behave as usual:
+        self.assertEqual(Square(3), 9)
+        self.assertEqual(Square.__name__, 'Square')
+        prof.Count('test.event')
+        prof.Counted('test.event', Square)(2)
+        with prof.Phase('compute'):
+            Square(2)
+        self.assertEqual(prof.Records(), {})
+    
+    def testEnabled(self):
+        with prof.Profile(report=False):
+            self.assertTrue(prof.enabled)
+            for x in [1, 2, -1]:
+                try:
+                    Square(x)
+                except ValueError:
+                    pass
+            prof.Count('test.event', 5)
+            prof.Counted('test.event', Square)(2)
+        self.assertFalse(prof.enabled)
+        record = prof.Records()[None]
+        self.assertEqual(record['time'], None)
+        # Calls which raise are recorded:
+        self.assertEqual(record['timings']['test.Square'][0], 4)
+        self.assertTrue(record['timings']['test.Square'][1] >= 0.0)
+        self.assertEqual(record['counts'], {'test.event': 6})
+    
+    def testPhases(self):
+        # Nested phases, in order of first use:
+        with prof.Profile(report=False):
+            with prof.Phase('compute'):
+                Square(1)
+                with prof.Phase('inner'):
+                    Square(2)
+            with prof.Phase('save'):
+                pass
+            with prof.Phase('compute'):
+                Square(3)
+        records = prof.Records()
+        self.assertEqual(list(records), ['compute/inner', 'compute', 'save'])
+        self.assertEqual(records['compute']['timings']['test.Square'][0], 2)
+        self.assertEqual(records['compute/inner']['timings']['test.Square'][0],
+            1)
+        self.assertEqual(records['save']['timings'], {})
+        self.assertTrue(records['compute']['time']
+            >= records['compute/inner']['time'])
+        self.assertEqual(prof._phase, None)
+    
+    def testReport(self):
+        # Records are cleared on entry unless reset is False:
+        stream = StringIO.StringIO()
+        with prof.Profile(stream=stream):
+            Square(2)
+        with prof.Profile(reset=False, stream=stream):
+            Square(2)
+        report = stream.getvalue().split('=== CLASSIC_EBM profile ===\n')
+        self.assertEqual(len(report), 3)
+        self.assertTrue('1 ' in report[1].split('test.Square')[0])
+        self.assertTrue('2 ' in report[2].split('test.Square')[0])
+        self.assertEqual(prof.Records()[None]['timings']['test.Square'][0], 2)
+        # The previous state is restored, whether or not the context exits
+        # with an exception:
+        prof.enabled = True
+        with prof.Profile(report=False):
+            pass
+        self.assertTrue(prof.enabled)
+        prof.enabled = False
+        try:
+            with prof.Profile(report=False):
+                Square(-1)
+        except ValueError:
+            pass
+        self.assertFalse(prof.enabled)
+    
+    def testModel(self):
+        # The model's hot paths are instrumented, and give the same results
+        # either way:
+        params = pm.Current()
+        xi = np.linspace(0.1, 0.9, 5)
+        Q = an.Q(xi, params=params)
+        with prof.Profile(report=False):
+            Q_profiled = an.Q(xi, params=params)
+        self.assertTrue(np.all(Q_profiled == Q))
+        self.assertTrue('analytics.Q' in prof.Records()[None]['timings'])
+
+
+if __name__ == '__main__':
+    unittest.main()
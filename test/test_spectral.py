@@ -0,0 +1,83 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the tables of Legendre polynomials, their derivatives and
+### integrals (spectral.py) against NumPy's Legendre series.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+import numpy.polynomial.legendre as legendre
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import spectral
+
+
+def Reference(n, x, m=0):
+    """Returns the m-th derivative of P_n at x (NumPy's Legendre series)."""
+    c = np.zeros(n+1); c[n] = 1.0
+    return legendre.legval(x, legendre.legder(c, m))
+
+
+class LegendreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.linspace(-1.0, 1.0, 41)
+    
+    def testTable(self):
+        nmax = 40
+        P, dP, d2P = spectral.LegendreTable(nmax, self.x)
+        self.assertEqual(P.shape, (len(self.x), nmax+1))
+        self.assertTrue(np.all(spectral.LegendreP(nmax, self.x) == P))
+        for n in xrange(nmax+1):
+            # Relative to the maxima of |P_n|, |P_n'| and |P_n''| on [-1, 1]
+            # (at x = 1):
+            for m, table in [(0, P), (1, dP), (2, d2P)]:
+                scale = max(abs(Reference(n, 1.0, m)), 1.0)
+                self.assertTrue(np.max(abs(table[:,n]
+                    - Reference(n, self.x, m))) < 1E-12*scale,
+                    msg='n = %d, m = %d' % (n, m))
+    
+    def testIntegral(self):
+        nmax = 40
+        I = spectral.LegendreIntegral(nmax, self.x)
+        self.assertEqual(I.shape, (len(self.x), nmax+1))
+        for n in xrange(nmax+1):
+            c = np.zeros(n+1); c[n] = 1.0
+            integral = legendre.legint(c, lbnd=0.0)
+            self.assertTrue(np.max(abs(I[:,n] - legendre.legval(self.x,
+                integral))) < 1E-13, msg='n = %d' % n)
+    
+    def testShapes(self):
+        # Scalars and arrays of any shape:
+        self.assertEqual(spectral.LegendreP(4, 0.3).shape, (5,))
+        x = self.x.reshape(1, 41)
+        for table in spectral.LegendreTable(4, x):
+            self.assertEqual(table.shape, (1, 41, 5))
+        self.assertEqual(spectral.LegendreIntegral(4, x).shape, (1, 41, 5))
+        self.assertEqual(list(spectral.Degrees(6)), [0, 2, 4, 6])
+    
+    def testBasis(self):
+        # The basis holds the even degrees, and is reused for the same grid:
+        basis = spectral.GetSpectralBasis(6, self.x)
+        self.assertTrue(basis is spectral.GetSpectralBasis(6, self.x.copy()))
+        self.assertTrue(basis is not spectral.GetSpectralBasis(8, self.x))
+        P, dP, d2P = spectral.LegendreTable(6, self.x)
+        for table, table_ref in [(basis.P, P), (basis.dP, dP),
+            (basis.d2P, d2P)]:
+            self.assertTrue(np.all(table == table_ref[:,::2]))
+    
+        # Sums of one series, or of several broadcast against x:
+        c = np.array([1.0, -2.0, 0.5, 0.25])
+        series = (Reference(0, self.x) - 2*Reference(2, self.x)
+            + 0.5*Reference(4, self.x) + 0.25*Reference(6, self.x))
+        self.assertTrue(np.max(abs(basis.Sum(basis.P, c) - series)) < 1E-13)
+        values = basis.Sum(basis.P, np.stack((c, 2*c))[:,np.newaxis,:])
+        self.assertEqual(values.shape, (2, len(self.x)))
+        self.assertTrue(np.max(abs(values[1] - 2*series)) < 1E-13)
+
+
+if __name__ == '__main__':
+    unittest.main()
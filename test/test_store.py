@@ -0,0 +1,126 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of the on-disk store of results (store.py): keys, invalidation and
+### the resumption of interrupted sweeps (see sweep.RunSweep()). The store is
+### redirected to a temporary directory.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, shutil, tempfile, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, store as st, sweep as sw
+
+
+# The values of D at which Counted() has been called, and the value at which
+# it raises Interrupted (if any):
+calls = []
+interrupt_D = None
+
+
+class Interrupted(Exception):
+    pass
+
+
+def Counted(params=None):
+    """Returns 2 D, recording the call in calls."""
+    calls.append(params.D)
+    if params.D == interrupt_D:
+        raise Interrupted()
+    return 2*params.D
+
+
+class StoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+        self.store_dir = st.store_dir
+        st.store_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(st.store_dir)
+        st.store_dir = self.store_dir
+    
+    def testKey(self):
+        # Keys depend on the values of everything given, and on the
+        # module-level parameters and store_version:
+        key = st.Key('a', 1.0, np.arange(3.0), self.params)
+        self.assertEqual(key, st.Key('a', 1.0, np.arange(3.0),
+            pm.Current()))
+        self.assertNotEqual(key, st.Key('a', 1.0, np.arange(3.0),
+            self.params._replace(D=1.0)))
+        self.assertNotEqual(key, st.Key('a', 1.0, np.arange(4.0),
+            self.params))
+        self.assertNotEqual(key, st.Key('a', 1.0, np.arange(3),
+            self.params))
+        n_grid = pm.n_grid
+        try:
+            pm.n_grid = n_grid + 1
+            self.assertNotEqual(key, st.Key('a', 1.0, np.arange(3.0),
+                self.params))
+        finally:
+            pm.n_grid = n_grid
+        store_version = st.store_version
+        try:
+            st.store_version = store_version + 1
+            self.assertNotEqual(key, st.Key('a', 1.0, np.arange(3.0),
+                self.params))
+        finally:
+            st.store_version = store_version
+    
+    def testCached(self):
+        # Computed once, then loaded (read-only) from the store:
+        del calls[:]
+        for j in xrange(2):
+            value = st.Cached(Counted, params=self.params)
+            self.assertEqual(float(value), 2*self.params.D)
+        self.assertEqual(calls, [self.params.D])
+        self.assertFalse(value.flags.writeable)
+        st.Cached(Counted, params=self.params._replace(D=1.0))
+        self.assertEqual(calls, [self.params.D, 1.0])
+    
+    def testDisabled(self):
+        del calls[:]
+        try:
+            st.enabled = False
+            for j in xrange(2):
+                st.Cached(Counted, params=self.params)
+        finally:
+            st.enabled = True
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(os.listdir(st.store_dir), [])
+    
+    def testResume(self):
+        # A sweep interrupted part way through is resumed by computing only
+        # the chunks which were not stored, giving the same results as an
+        # uninterrupted sweep:
+        global interrupt_D
+        D = np.linspace(0.1, 1.0, 10)
+        axes = [('D', D)]
+        del calls[:]
+        try:
+            interrupt_D = D[5]
+            self.assertRaises(Interrupted, sw.RunSweep, Counted, axes,
+                processes=1, chunk_size=2, params=self.params, store=True)
+        finally:
+            interrupt_D = None
+        self.assertEqual(calls, list(D[:6]))
+        del calls[:]
+        result = sw.RunSweep(Counted, axes, processes=1, chunk_size=2,
+            params=self.params, store=True)
+        self.assertEqual(calls, list(D[4:]))
+        self.assertTrue(np.all(result.values == 2*D))
+    
+        # Nothing is recomputed once the sweep is complete:
+        del calls[:]
+        result = sw.RunSweep(Counted, axes, processes=1, chunk_size=2,
+            params=self.params, store=True)
+        self.assertEqual(calls, [])
+        self.assertTrue(np.all(result.values == 2*D))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+### CLASSIC_EBM
+### Jake Aylmer
+###
+### Tests of parameter sweeps (sweep.py): the results must be indexed in the
+### order of the axes whatever the number of processes and chunk size.
+### Usage: python -m unittest discover test
+### ---------------------------------------------------------------------------
+
+from __future__ import division
+
+import sys, os, unittest, numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import parameters as pm, analytics as an, sweep as sw
+
+
+class RunSweepTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = pm.Current()
+        self.D = self.params.D*np.array([0.5, 1.0, 1.5])
+        self.B = self.params.B*np.array([0.9, 1.0, 1.1, 1.2])
+        self.xi = np.linspace(0.1, 0.9, 5)
+    
+    def testOrdering(self):
+        # Each result is that of its own point of the grid:
+        result = sw.RunSweep(sw.SolutionQ, [('D', self.D), ('B', self.B)],
+            processes=1, params=self.params, xi=self.xi)
+        self.assertEqual(result.names, ['D', 'B'])
+        self.assertEqual(result.values.shape, (3, 4, 5))
+        for i, D in enumerate(self.D):
+            for j, B in enumerate(self.B):
+                Q = an.Q(self.xi, params=self.params._replace(D=D, B=B))
+                self.assertTrue(np.all(result.values[i,j] == Q))
+    
+    def testProcesses(self):
+        # The results do not depend on how the grid is split into chunks, nor
+        # on the order in which the chunks finish:
+        axes = [('D', self.D), ('B', self.B)]
+        reference = sw.RunSweep(sw.SolutionQ, axes, processes=1,
+            params=self.params, xi=self.xi).values
+        for processes, chunk_size in [(1, 5), (2, 1), (2, 5), (3, None)]:
+            values = sw.RunSweep(sw.SolutionQ, axes, processes, chunk_size,
+                params=self.params, xi=self.xi).values
+            self.assertTrue(np.all(values == reference))
+    
+    def testSweptArgument(self):
+        # Arguments of function other than model parameters may be swept:
+        result = sw.RunSweep(sw.SolutionQ, [('xi', self.xi), ('D', self.D)],
+            processes=1, params=self.params)
+        for j, D in enumerate(self.D):
+            Q = an.Q(self.xi, params=self.params._replace(D=D))
+            self.assertTrue(np.all(result.values[:,j] == Q))
+    
+    def testEmpty(self):
+        # An empty axis gives an empty array of results, with or without the
+        # store:
+        for axes, shape in [([('D', [])], (0,)),
+            ([('D', self.D), ('B', [])], (3, 0)),
+            ([('D', []), ('B', self.B)], (0, 4))]:
+            for store in [False, True]:
+                result = sw.RunSweep(sw.SolutionQ, axes, processes=1,
+                    params=self.params, store=store, xi=self.xi)
+                self.assertEqual(result.values.shape, shape)
+
+
+if __name__ == '__main__':
+    unittest.main()